@@ -1,3 +1,4 @@
+from flask import Response, abort, current_app, stream_with_context
 from flask_admin import Admin, AdminIndexView, expose
 from flask_admin.contrib.sqla import ModelView
 from flask_basicauth import BasicAuth
@@ -19,6 +20,9 @@ from .models import (
     VerificationToken,
     db,
 )
+from .cache import invalidate_profiles
+from .exports import EXPORT_FORMATS, export_lines
+from .queries import update_option_profiles, update_search_documents
 
 
 log = get_logger()
@@ -63,25 +67,90 @@ class BasicAuthModelView(ModelView):
 class BasicAuthExportableModelView(BasicAuthModelView):
     can_export = True
 
+    @expose("/export/<export_type>/")
+    @basic_auth.required
+    def export(self, export_type):
+        return super().export(export_type)
+
+
+class StreamingExportModelView(BasicAuthExportableModelView):
+    """
+    Exports the whole table through `exports`, which streams it from a
+    server-side cursor instead of loading every row into memory. List
+    filters don't apply to these exports.
+    """
+
+    export_types = EXPORT_FORMATS
+
+    @expose("/export/<export_type>/")
+    @basic_auth.required
+    def export(self, export_type):
+        if export_type not in self.export_types:
+            abort(404)
+
+        filename = f"{self.model.__tablename__}.{export_type}"
+
+        return Response(
+            stream_with_context(export_lines(self.model, export_type)),
+            headers={"Content-Disposition": f"attachment;filename={filename}"},
+            mimetype="text/csv" if export_type == "csv" else "application/x-ndjson",
+        )
 
-class VerificationEmailModelView(BasicAuthExportableModelView):
+
+class VerificationEmailModelView(StreamingExportModelView):
     column_default_sort = ("id", False)
     column_searchable_list = ["email"]
+    form_excluded_columns = ["star_version"]
 
 
 class ModelViewSortedByValue(BasicAuthExportableModelView):
     column_default_sort = ("date_created", False)
     column_searchable_list = ["value"]
 
+    # Option values are embedded in the search documents of the profiles
+    # that use them, and in their serializations, which are built from the
+    # cached option values. Updating those profiles rebuilds their search
+    # documents and bumps their versions, invalidating them in every process,
+    # while the local caches are cleared right away.
+    def on_model_change(self, form, model, is_created):
+        if not is_created:
+            update_option_profiles(type(model), model.id)
+
+    def on_model_delete(self, model):
+        update_option_profiles(type(model), model.id)
+
+    def after_model_change(self, form, model, is_created):
+        current_app.caches["profiles"].clear()
+        current_app.caches["option_ids"].clear()
+
+    def after_model_delete(self, model):
+        current_app.caches["profiles"].clear()
+        current_app.caches["option_ids"].clear()
 
-class ModelViewSortedByDateCreated(BasicAuthExportableModelView):
+
+class VerificationTokenModelView(StreamingExportModelView):
     column_default_sort = ("date_created", False)
 
 
-class ProfileModelView(BasicAuthExportableModelView):
+class ProfileModelView(StreamingExportModelView):
     column_default_sort = ("date_created", False)
     column_display_all_relations = True
 
+    # Derived from the other columns and the profile's tags
+    form_excluded_columns = [
+        "version",
+        "search_document",
+        "last_name_sort_key",
+        *FacultyProfile.TAG_ID_COLUMNS,
+    ]
+
+    def after_model_change(self, form, model, is_created):
+        update_search_documents(type(model), [model.id])
+        db.session.commit()
+
+    def after_model_delete(self, model):
+        invalidate_profiles(type(model), [model.id])
+
 
 admin = Admin(index_view=BasicAuthAdminView())
 admin.add_view(ProfileModelView(FacultyProfile, db.session))
@@ -99,7 +168,7 @@ admin.add_view(
 admin.add_view(
     ModelViewSortedByValue(ActivityOption, db.session, name="Activities I Enjoy")
 )
-admin.add_view(ModelViewSortedByDateCreated(VerificationToken, db.session))
+admin.add_view(VerificationTokenModelView(VerificationToken, db.session))
 admin.add_view(VerificationEmailModelView(VerificationEmail, db.session))
 
 
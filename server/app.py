@@ -9,8 +9,10 @@ import flask_login
 from flask_saml2.utils import certificate_from_string, private_key_from_string
 from structlog import get_logger
 from .admin import init_admin
+from .cache import init_caches
 from .emails import init_email
 from .models import db
+from .query_stats import init_query_stats
 from .auth import login_manager
 from .views.api import save_verification_token
 from .queries import get_verification_email_by_email
@@ -92,6 +94,34 @@ def create_app():
         os.environ.get("REACT_APP_TOKEN_EXPIRY_AGE_HOURS", 1)
     )
 
+    # How long the unchanging columns of tokens are cached for
+    app.config["TOKEN_CACHE_SECONDS"] = int(os.environ.get("TOKEN_CACHE_SECONDS", 30))
+
+    # How long viewers' starred emails are cached for, per star version
+    app.config["STAR_CACHE_SECONDS"] = int(os.environ.get("STAR_CACHE_SECONDS", 30))
+    app.config["STAR_CACHE_SIZE"] = int(os.environ.get("STAR_CACHE_SIZE", 1024))
+
+    app.config["MAX_PAGE_SIZE"] = int(os.environ.get("MAX_PAGE_SIZE", 100))
+
+    app.config["OPTION_ID_CACHE_SECONDS"] = int(
+        os.environ.get("OPTION_ID_CACHE_SECONDS", 300)
+    )
+
+    app.config["PROFILE_CACHE_SECONDS"] = int(
+        os.environ.get("PROFILE_CACHE_SECONDS", 600)
+    )
+    app.config["PROFILE_CACHE_SIZE"] = int(os.environ.get("PROFILE_CACHE_SIZE", 5000))
+
+    # Statements slower than this are logged, and some of them explained
+    app.config["SLOW_QUERY_MS"] = float(os.environ.get("SLOW_QUERY_MS", 500))
+    app.config["SLOW_QUERY_EXPLAIN_RATE"] = float(
+        os.environ.get("SLOW_QUERY_EXPLAIN_RATE", 0.1)
+    )
+
+    # Queue emails for the `send-emails` worker instead of sending them while
+    # handling the request. Set EMAIL_OUTBOX=0 to send them synchronously.
+    app.config["EMAIL_OUTBOX"] = os.environ.get("EMAIL_OUTBOX", "1") != "0"
+
     db.init_app(app)
     login_manager.init_app(app)
 
@@ -101,7 +131,9 @@ def create_app():
         SSLify(app)
 
     init_admin(app)
+    init_caches(app)
     init_email(app)
+    init_query_stats(app)
 
     app.register_blueprint(views.home)
     app.register_blueprint(views.api)
@@ -2,7 +2,7 @@ import flask_login
 
 from server.views.api import UnauthorizedError, validate_verification_token
 
-from .models import VerificationToken
+from .token_cache import load_verification_token
 
 
 login_manager = flask_login.LoginManager()
@@ -11,7 +11,7 @@ login_manager.session_protection = "strong"
 
 @login_manager.user_loader
 def user_loader(token):
-    return VerificationToken.query.filter_by(token=token).first()
+    return load_verification_token(token)
 
 
 @login_manager.unauthorized_handler
@@ -0,0 +1,315 @@
+"""
+Times the search endpoints and queries against the current database, meant
+to be run on the data from `flask generate-data`.
+
+Each case is run once to warm caches and then timed over several iterations.
+An extra run counts its queries, and re-runs its SELECTs under EXPLAIN
+ANALYZE to sum the rows their scans read, so results show both how long a
+case takes and how much work the database did for it.
+"""
+import datetime
+import json
+import statistics
+import subprocess
+import time
+from typing import Callable, List, NamedTuple, Optional
+
+from flask import current_app
+
+from .models import FacultyProfile, VerificationEmail, VerificationToken, db, save
+from .queries import (
+    matching_faculty_profiles,
+    query_faculty_searchable_tags,
+    query_profile_tags,
+    trigram_search_available,
+)
+from .query_stats import record_statements
+from .synthetic_data import SYNTHETIC_EMAIL_DOMAIN
+from .views.api import generate_token
+
+
+# Plan nodes that read table rows. Bitmap index scans are left out since
+# their rows are read again by the bitmap heap scan above them.
+SCAN_NODE_TYPES = {"Seq Scan", "Index Scan", "Index Only Scan", "Bitmap Heap Scan"}
+
+# Requests are made over HTTPS, since production redirects plain HTTP
+BASE_URL = "https://localhost"
+
+
+class BenchmarkResult(NamedTuple):
+    name: str
+    iterations: int
+    p50_ms: float
+    p95_ms: float
+    query_count: int
+    rows_scanned: int
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    """
+    The nearest-rank percentile of `samples`.
+    """
+    ordered = sorted(samples)
+
+    index = max(0, min(len(ordered) - 1, round(fraction * len(ordered)) - 1))
+
+    return ordered[index]
+
+
+def _plan_rows_scanned(plan: dict) -> int:
+    rows = 0
+
+    if plan["Node Type"] in SCAN_NODE_TYPES:
+        loops = plan.get("Actual Loops", 1)
+
+        rows += (plan["Actual Rows"] + plan.get("Rows Removed by Filter", 0)) * loops
+
+    return rows + sum(_plan_rows_scanned(child) for child in plan.get("Plans", []))
+
+
+def rows_scanned(statements: List[tuple]) -> int:
+    """
+    Rows read by the table scans of the SELECT `statements`, from running
+    them again under EXPLAIN ANALYZE.
+    """
+    connection = db.session.connection()
+
+    total = 0
+
+    for statement, parameters in statements:
+        if not statement.lstrip().upper().startswith(("SELECT", "WITH")):
+            continue
+
+        [(plan,)] = connection.execute(
+            f"EXPLAIN (ANALYZE, FORMAT JSON) {statement}", parameters
+        ).fetchall()
+
+        total += _plan_rows_scanned(plan[0]["Plan"])
+
+    return total
+
+
+def benchmark(name: str, run: Callable[[], None], iterations: int) -> BenchmarkResult:
+    run()
+
+    durations = []
+
+    for _ in range(iterations):
+        start = time.perf_counter()
+        run()
+        durations.append((time.perf_counter() - start) * 1000)
+
+    with record_statements() as statements:
+        run()
+
+    return BenchmarkResult(
+        name=name,
+        iterations=iterations,
+        p50_ms=round(statistics.median(durations), 2),
+        p95_ms=round(percentile(durations, 0.95), 2),
+        query_count=len(statements),
+        rows_scanned=rows_scanned(statements),
+    )
+
+
+def _benchmark_viewer() -> VerificationToken:
+    """
+    A token for the first synthetic faculty profile, to make the requests as.
+    It's deleted once the run finishes.
+    """
+    verification_email = (
+        VerificationEmail.query.join(
+            FacultyProfile, FacultyProfile.verification_email_id == VerificationEmail.id
+        )
+        .filter(VerificationEmail.email.like(f"%@{SYNTHETIC_EMAIL_DOMAIN}"))
+        .order_by(VerificationEmail.id)
+        .first()
+    )
+
+    if verification_email is None:
+        raise BenchmarkError("No synthetic profiles; run `flask generate-data` first")
+
+    return save(
+        VerificationToken(
+            token=generate_token(),
+            email_id=verification_email.id,
+            is_personal_device=True,
+        )
+    )
+
+
+def _endpoint(client, path: str, **query_string) -> Callable[[], None]:
+    def run():
+        response = client.get(path, query_string=query_string, base_url=BASE_URL)
+
+        if response.status_code != 200:
+            raise BenchmarkError(f"{path} returned {response.status_code}")
+
+    return run
+
+
+def _query(build_query) -> Callable[[], None]:
+    def run():
+        build_query()
+
+        # Don't let loaded instances accumulate across iterations
+        db.session.expunge_all()
+
+    return run
+
+
+def benchmark_cases(client, verification_email_id: int):
+    common_tag = "Activities 1"
+    rare_tag = "Activities 100"
+
+    fuzzy_cases = [
+        (
+            "GET /api/profiles fuzzy",
+            _endpoint(client, "/api/profiles", query="reserch", search_mode="fuzzy"),
+        ),
+        (
+            "GET /api/profiles fuzzy by relevance",
+            _endpoint(
+                client,
+                "/api/profiles",
+                query="reserch",
+                search_mode="fuzzy",
+                sorting="relevance",
+            ),
+        ),
+    ]
+
+    return [
+        ("GET /api/profiles", _endpoint(client, "/api/profiles")),
+        (
+            "GET /api/profiles last name",
+            _endpoint(client, "/api/profiles", sorting="last_name_alphabetical"),
+        ),
+        (
+            "GET /api/profiles date updated",
+            _endpoint(client, "/api/profiles", sorting="date_updated"),
+        ),
+        ("GET /api/profiles page 50", _endpoint(client, "/api/profiles", page=50)),
+        ("GET /api/profiles cursor", _endpoint(client, "/api/profiles", cursor="")),
+        (
+            "GET /api/profiles count estimate",
+            _endpoint(client, "/api/profiles", count="estimate"),
+        ),
+        (
+            "GET /api/profiles query",
+            _endpoint(client, "/api/profiles", query="research"),
+        ),
+        (
+            "GET /api/profiles substring",
+            _endpoint(client, "/api/profiles", query="esearc", search_mode="substring"),
+        ),
+        (
+            "GET /api/profiles common tag",
+            _endpoint(client, "/api/profiles", tags=common_tag),
+        ),
+        (
+            "GET /api/profiles rare tag",
+            _endpoint(client, "/api/profiles", tags=rare_tag),
+        ),
+        ("GET /api/faculty-search-tags", _endpoint(client, "/api/faculty-search-tags")),
+        ("GET /api/profile-tags", _endpoint(client, "/api/profile-tags")),
+        (
+            "matching_faculty_profiles",
+            _query(
+                lambda: matching_faculty_profiles(
+                    "", "", "", "", verification_email_id
+                )[:20]
+            ),
+        ),
+        (
+            "matching_faculty_profiles query and tag",
+            _query(
+                lambda: matching_faculty_profiles(
+                    "research", common_tag, "", "", verification_email_id
+                )[:20]
+            ),
+        ),
+        ("query_faculty_searchable_tags", _query(query_faculty_searchable_tags)),
+        ("query_profile_tags", _query(query_profile_tags)),
+        *(fuzzy_cases if trigram_search_available() else []),
+    ]
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return (
+            subprocess.run(
+                ["git", "rev-parse", "HEAD"], capture_output=True, check=True, text=True
+            ).stdout.strip()
+            or None
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(iterations: int, name_filter: str = "") -> dict:
+    """
+    Run the benchmark cases whose name contains `name_filter` and return the
+    results with enough context to compare them with other runs.
+    """
+    verification_token = _benchmark_viewer()
+    verification_token_id = verification_token.id
+
+    try:
+        client = current_app.test_client()
+
+        response = client.post(
+            "/api/verify-token",
+            json={"token": verification_token.token},
+            base_url=BASE_URL,
+        )
+
+        if response.status_code != 200:
+            raise BenchmarkError(f"Couldn't log in: {response.json}")
+
+        cases = benchmark_cases(client, verification_token.email_id)
+
+        results = [
+            benchmark(name, run, iterations)
+            for name, run in cases
+            if name_filter in name
+        ]
+    finally:
+        db.session.rollback()
+
+        VerificationToken.query.filter(
+            VerificationToken.id == verification_token_id
+        ).delete()
+
+        db.session.commit()
+
+    return {
+        "commit": _git_commit(),
+        "date": datetime.datetime.utcnow().isoformat(),
+        "profile_counts": {
+            "faculty": FacultyProfile.query.count(),
+            "verification_emails": VerificationEmail.query.count(),
+        },
+        "results": [result._asdict() for result in results],
+    }
+
+
+def format_results(run: dict) -> str:
+    lines = [f"{'case':<44}{'p50 ms':>10}{'p95 ms':>10}{'queries':>9}{'rows':>11}"]
+
+    for result in run["results"]:
+        lines.append(
+            f"{result['name']:<44}{result['p50_ms']:>10}{result['p95_ms']:>10}"
+            f"{result['query_count']:>9}{result['rows_scanned']:>11}"
+        )
+
+    return "\n".join(lines)
+
+
+def save_results(run: dict, path: str) -> None:
+    with open(path, "w") as file:
+        json.dump(run, file, indent=2)
@@ -0,0 +1,88 @@
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+
+
+class TTLCache:
+    """
+    A small thread-safe in-process cache. Entries expire `ttl` seconds after
+    they are set, and the least recently set entries are evicted once
+    `max_size` is reached.
+
+    Each gunicorn worker has its own caches, so anything cached here must
+    either tolerate being stale for `ttl` seconds or be checked against the
+    database.
+    """
+
+    def __init__(self, ttl: float, max_size: int = 1024):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None:
+                return default
+
+            expires_at, value = entry
+
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return default
+
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def profile_cache_key(profile_class, profile_id):
+    return (profile_class.__tablename__, profile_id)
+
+
+def invalidate_profiles(profile_class, profile_ids):
+    """
+    Drop the serialized profiles cached for `profile_ids`. Entries are stored
+    with the profile's `version`, which a trigger bumps on every update, so
+    edits never need this: it only frees the entries of deleted profiles.
+    """
+    cache = current_app.caches["profiles"]
+
+    for profile_id in profile_ids:
+        cache.delete(profile_cache_key(profile_class, profile_id))
+
+
+def init_caches(app):
+    app.caches = {
+        # Installed Postgres extensions, which change about as rarely as options
+        "extensions": TTLCache(ttl=app.config["OPTION_ID_CACHE_SECONDS"], max_size=8),
+        # Option ids by value, and option values by id
+        "option_ids": TTLCache(ttl=app.config["OPTION_ID_CACHE_SECONDS"], max_size=2),
+        "profiles": TTLCache(
+            ttl=app.config["PROFILE_CACHE_SECONDS"],
+            max_size=app.config["PROFILE_CACHE_SIZE"],
+        ),
+        # Verification emails starred by each viewer
+        "stars": TTLCache(
+            ttl=app.config["STAR_CACHE_SECONDS"], max_size=app.config["STAR_CACHE_SIZE"]
+        ),
+        "tokens": TTLCache(ttl=app.config["TOKEN_CACHE_SECONDS"]),
+    }
@@ -1,15 +1,71 @@
+import time
+
 import click
-from flask import Blueprint
+from flask import Blueprint, current_app
+from sentry_sdk import capture_exception
+from sqlalchemy.schema import CreateIndex, DefaultClause
+from structlog import get_logger
 
 from server.emails import get_verification_url
-from server.views.api import generate_token
+from server.emails.outbox import deliver_pending_emails
+from server.views.api import (
+    faculty_directory_queryset,
+    generate_token,
+    get_search_relevance,
+    get_sort_keys,
+    lists_own_profile,
+    student_directory_queryset,
+)
+from server.views.pagination import DEFAULT_PAGE_SIZE
+
+from .models import (
+    CREATE_BUMP_PROFILE_VERSION_FUNCTION,
+    CREATE_BUMP_STAR_VERSION_FUNCTION,
+    CREATE_PROFILE_TAG_REFERENCE_FUNCTIONS,
+    CREATE_SET_LAST_NAME_SORT_KEY_FUNCTION,
+    CREATE_TRIGRAM_EXTENSION,
+    PROFILE_MODELS,
+    PROFILE_TAG_RELATIONS,
+    STAR_VERSION_TRIGGER,
+    TRIGRAM_INDEXED_COLUMNS,
+    FacultyProfile,
+    StudentProfile,
+    VerificationEmail,
+    VerificationToken,
+    db,
+    last_name_sort_key_trigger_ddl,
+    profile_tag_reference_ddls,
+    profile_version_trigger_ddl,
+    save,
+    trigram_extension_available,
+    trigram_index_ddl,
+)
+from . import (
+    benchmark,
+    exports,
+    profile_id_migration,
+    profile_import,
+    profile_tag_migration,
+    searchable_tags,
+    synthetic_data,
+)
+from .queries import (
+    SEARCH_MODES,
+    SERIALIZED_OPTION_CLASSES,
+    explain,
+    get_verification_email_by_email,
+    trigram_search_available,
+    update_search_documents,
+)
 
-from .models import FacultyProfile, VerificationEmail, VerificationToken, db, save
-from .queries import get_verification_email_by_email
+
+log = get_logger()
 
 
 blueprint = Blueprint("cli", __name__, cli_group=None)
 
+PROFILE_CLASSES = {"faculty": FacultyProfile, "student": StudentProfile}
+
 
 @blueprint.cli.command()
 @click.argument("email")
@@ -36,6 +92,439 @@ def reset_db():
     db.create_all()
 
 
+def add_missing_columns():
+    """
+    `create_all` only creates missing tables, so columns added to existing
+    models have to be added separately. Added columns are always nullable,
+    and existing rows get the column's server default if it has one. Columns
+    set by triggers are filled in by `create_triggers`.
+    """
+    for table in db.metadata.sorted_tables:
+        existing_columns = {
+            name
+            for name, in db.session.execute(
+                "SELECT column_name FROM information_schema.columns"
+                " WHERE table_schema = current_schema() AND table_name = :table",
+                {"table": table.name},
+            )
+        }
+
+        for column in table.columns:
+            if column.name in existing_columns:
+                continue
+
+            column_type = column.type.compile(dialect=db.engine.dialect)
+
+            if isinstance(column.server_default, DefaultClause):
+                default = column.server_default.arg
+
+                # Strings are literal values, and text() an SQL expression
+                if isinstance(default, str):
+                    column_type += f" DEFAULT '{default}'"
+                else:
+                    column_type += f" DEFAULT {default.text}"
+
+            print(f"Adding column {table.name}.{column.name}")
+
+            db.session.execute(
+                f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'
+            )
+
+
+def create_missing_indexes():
+    existing_indexes = {
+        name
+        for name, in db.session.execute(
+            "SELECT indexname FROM pg_indexes WHERE schemaname = current_schema()"
+        )
+    }
+
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            if index.name in existing_indexes:
+                continue
+
+            print(f"Creating index {index.name}")
+
+            db.session.execute(CreateIndex(index))
+
+
+def drop_unused_indexes():
+    # Created by earlier versions, and not used by any query since
+    unused_indexes = [
+        *[
+            f"ix_{option_class.__tablename__}_lower_value"
+            for option_class in SERIALIZED_OPTION_CLASSES
+        ],
+        *[
+            f"ix_{model.__tablename__}_available_date_updated"
+            for model in PROFILE_MODELS
+        ],
+    ]
+
+    for index_name in unused_indexes:
+        db.session.execute(f'DROP INDEX IF EXISTS "{index_name}"')
+
+
+def create_trigram_indexes():
+    connection = db.session.connection()
+
+    if not trigram_extension_available(connection):
+        print("Not creating trigram indexes because pg_trgm is not available")
+        return
+
+    connection.execute(CREATE_TRIGRAM_EXTENSION)
+
+    for model, column_name in TRIGRAM_INDEXED_COLUMNS:
+        connection.execute(trigram_index_ddl(model, column_name))
+
+
+def delete_dangling_profile_tags():
+    """
+    Delete the tags of profiles and options deleted before profile_tag's
+    references were checked. `reindex_search` then rebuilds the search
+    documents and tag id arrays that still mention them.
+    """
+    for profile_class, relations in PROFILE_TAG_RELATIONS.items():
+        for relation in relations:
+            result = db.session.execute(
+                "DELETE FROM profile_tag WHERE profile_type = :profile_type"
+                " AND tag_type = :tag_type AND ("
+                f" NOT EXISTS (SELECT 1 FROM {profile_class.__tablename__}"
+                " WHERE id = profile_tag.profile_id)"
+                f" OR NOT EXISTS (SELECT 1 FROM {relation.option_class.__tablename__}"
+                " WHERE id = profile_tag.tag_id))",
+                {
+                    "profile_type": profile_class.__tablename__,
+                    "tag_type": relation.option_class.__tablename__,
+                },
+            )
+
+            if result.rowcount:
+                print(f"Deleted {result.rowcount} dangling {relation.__name__} tags")
+
+
+def create_triggers():
+    connection = db.session.connection()
+
+    connection.execute(CREATE_BUMP_STAR_VERSION_FUNCTION)
+    connection.execute(STAR_VERSION_TRIGGER)
+
+    connection.execute(CREATE_PROFILE_TAG_REFERENCE_FUNCTIONS)
+
+    for _, trigger_ddl in profile_tag_reference_ddls():
+        connection.execute(trigger_ddl)
+
+    connection.execute(CREATE_BUMP_PROFILE_VERSION_FUNCTION)
+    connection.execute(CREATE_SET_LAST_NAME_SORT_KEY_FUNCTION)
+
+    for model in PROFILE_MODELS:
+        connection.execute(profile_version_trigger_ddl(model))
+        connection.execute(last_name_sort_key_trigger_ddl(model))
+
+        # Renaming profiles to themselves sets the sort keys of the ones from
+        # before the trigger
+        connection.execute(
+            f"UPDATE {model.__tablename__} SET name = name"
+            " WHERE last_name_sort_key IS NULL"
+        )
+
+
+SORTINGS = [
+    "starred",
+    "last_name_alphabetical",
+    "last_name_reverse_alphabetical",
+    "date_updated",
+    "relevance",
+]
+
+
+@blueprint.cli.command()
+@click.option("--profile-type", type=click.Choice(PROFILE_CLASSES), default="faculty")
+@click.option("--query", default="")
+@click.option("--tags", default="", help="Comma separated, as in the API.")
+@click.option("--degrees", default="", help="Comma separated; faculty only.")
+@click.option("--affiliations", default="", help="Comma separated.")
+@click.option("--search-mode", type=click.Choice(SEARCH_MODES), default="prefix")
+@click.option(
+    "--sorting",
+    type=click.Choice(SORTINGS),
+    default="starred",
+    help="relevance needs a fuzzy search.",
+)
+@click.option("--page-size", default=DEFAULT_PAGE_SIZE, show_default=True)
+@click.option("--email", help="Search as this user, for their stars.")
+@click.option(
+    "--analyze/--no-analyze",
+    default=True,
+    help="Run the query to show actual timings and buffers.",
+)
+def explain_search(
+    profile_type,
+    query,
+    tags,
+    degrees,
+    affiliations,
+    search_mode,
+    sorting,
+    page_size,
+    email,
+    analyze,
+):
+    """
+    Print the plan of a directory search's first page.
+    """
+    verification_email = verification_email_id = None
+
+    if email is not None:
+        verification_email = get_verification_email_by_email(email)
+
+        if verification_email is None:
+            raise click.ClickException(f"Email {email} not found.")
+
+        verification_email_id = verification_email.id
+
+    if search_mode == "fuzzy" and not trigram_search_available():
+        raise click.ClickException("Fuzzy search needs the pg_trgm extension.")
+
+    profile_class = PROFILE_CLASSES[profile_type]
+
+    if profile_class is FacultyProfile:
+        profiles_queryset = faculty_directory_queryset(
+            query, tags, degrees, affiliations, verification_email_id, search_mode
+        )
+    else:
+        profiles_queryset = student_directory_queryset(
+            query, tags, affiliations, verification_email_id, search_mode
+        )
+
+    relevance = get_search_relevance(profile_class, query, search_mode)
+
+    if sorting == "relevance" and relevance is None:
+        raise click.ClickException("Sorting by relevance needs a fuzzy search query.")
+
+    sort_keys = get_sort_keys(
+        sorting,
+        profile_class,
+        verification_email_id,
+        relevance,
+        lists_own_profile(verification_email, profile_class),
+    )
+
+    page_queryset = profiles_queryset.order_by(
+        *[sort_key.ordering() for sort_key in sort_keys]
+    ).limit(page_size)
+
+    options = "ANALYZE, BUFFERS" if analyze else "COSTS"
+
+    for (line,) in explain(page_queryset, options):
+        print(line)
+
+
+@blueprint.cli.command()
+def migrate_profile_tags():
+    """
+    Move tags from the old table per profile relation into profile_tag.
+    """
+    copied = profile_tag_migration.migrate_profile_tags(db.session.connection())
+
+    db.session.commit()
+
+    for table_name, count in copied.items():
+        print(f"Moved {count} tags from {table_name} and dropped it")
+
+
+@blueprint.cli.command()
+def migrate_profile_ids():
+    """
+    Convert profile ids stored as strings to uuids.
+    """
+    converted = profile_id_migration.migrate_profile_ids(db.session.connection())
+
+    db.session.commit()
+
+    for column in converted:
+        print(f"Converted {column} to uuid")
+
+
+@blueprint.cli.command()
+def reindex_search():
+    for profile_class in [FacultyProfile, StudentProfile]:
+        count = update_search_documents(profile_class)
+
+        print(f"Indexed {count} {profile_class.__tablename__} rows")
+
+    db.session.commit()
+
+
+@blueprint.cli.command()
+def rebuild_searchable_tags():
+    searchable_tags.rebuild_searchable_tags()
+
+    db.session.commit()
+
+
+@blueprint.cli.command()
+@click.pass_context
+def upgrade_db(context):
+    db.create_all()
+
+    add_missing_columns()
+    drop_unused_indexes()
+    create_missing_indexes()
+    create_trigram_indexes()
+    delete_dangling_profile_tags()
+    create_triggers()
+
+    db.session.commit()
+
+    context.invoke(migrate_profile_tags)
+    context.invoke(migrate_profile_ids)
+    context.invoke(reindex_search)
+    context.invoke(rebuild_searchable_tags)
+
+
+@blueprint.cli.command()
+@click.argument("file", type=click.File("r", encoding="utf-8"))
+@click.option("--profile-type", type=click.Choice(PROFILE_CLASSES), default="faculty")
+@click.option(
+    "--format",
+    "file_format",
+    type=click.Choice(["jsonl", "csv"]),
+    help="Defaults to the file's extension.",
+)
+@click.option("--batch-size", default=500, show_default=True)
+def import_profiles(file, profile_type, file_format, batch_size):
+    """
+    Import profiles with their tags from a JSON lines or CSV file.
+    """
+    profile_class = PROFILE_CLASSES[profile_type]
+
+    if file_format is None:
+        file_format = "csv" if file.name.endswith(".csv") else "jsonl"
+
+    if file_format == "csv":
+        rows = profile_import.read_csv(file, profile_class)
+    else:
+        rows = profile_import.read_json_lines(file)
+
+    try:
+        result = profile_import.import_profiles(rows, profile_class, batch_size)
+    except profile_import.ProfileImportError as e:
+        raise click.ClickException(str(e))
+
+    print(f"Imported {result.imported} profiles, skipped {result.skipped}")
+
+
+@blueprint.cli.command()
+@click.argument("table", type=click.Choice(exports.EXPORTABLE_MODELS))
+@click.argument("output", type=click.File("w", encoding="utf-8"))
+@click.option(
+    "--format",
+    "export_format",
+    type=click.Choice(exports.EXPORT_FORMATS),
+    help="Defaults to the file's extension.",
+)
+def export(table, export_format, output):
+    """
+    Stream a table to a CSV or JSON lines file, with profile tags flattened.
+    Profile exports can be loaded again with `import-profiles`.
+    """
+    model = exports.EXPORTABLE_MODELS[table]
+
+    if export_format is None:
+        export_format = "jsonl" if output.name.endswith(".jsonl") else "csv"
+
+    for line in exports.export_lines(model, export_format):
+        output.write(line)
+
+
+@blueprint.cli.command()
+@click.option("--faculty", default=10000, show_default=True)
+@click.option("--students", default=2000, show_default=True)
+@click.option("--tags-per-profile", default=3, show_default=True)
+@click.option(
+    "--star-density",
+    default=0.001,
+    show_default=True,
+    help="Fraction of faculty profiles starred by each profile's owner.",
+)
+@click.option(
+    "--custom-tags",
+    default=1000,
+    show_default=True,
+    help="Tag values that appear on a single profile each.",
+)
+@click.option("--seed", default=0, show_default=True)
+def generate_data(faculty, students, tags_per_profile, star_density, custom_tags, seed):
+    """
+    Load deterministic synthetic profiles, tags and stars for benchmarking.
+    """
+    config = synthetic_data.SyntheticDataConfig(
+        faculty_count=faculty,
+        student_count=students,
+        tags_per_profile=tags_per_profile,
+        star_density=star_density,
+        custom_tag_count=custom_tags,
+        seed=seed,
+    )
+
+    result = synthetic_data.generate_synthetic_data(config)
+
+    print(
+        f"Imported {result.faculty.imported} faculty and"
+        f" {result.students.imported} student profiles, added {result.stars} stars"
+    )
+
+
+@blueprint.cli.command("benchmark")
+@click.option("--iterations", default=20, show_default=True)
+@click.option("--filter", "name_filter", default="", help="Only run matching cases.")
+@click.option("--output", type=click.Path(dir_okay=False), help="Save results as JSON.")
+def run_benchmark(iterations, name_filter, output):
+    """
+    Time the search endpoints and queries against the current database.
+    """
+    try:
+        run = benchmark.run_benchmarks(iterations, name_filter)
+    except benchmark.BenchmarkError as e:
+        raise click.ClickException(str(e))
+
+    print(benchmark.format_results(run))
+
+    if output:
+        benchmark.save_results(run, output)
+
+
+@blueprint.cli.command()
+@click.option("--batch-size", default=10, show_default=True)
+@click.option("--poll-seconds", default=5.0, show_default=True)
+@click.option("--once", is_flag=True, help="Exit once no emails are due.")
+def send_emails(batch_size, poll_seconds, once):
+    """
+    Send emails queued in the outbox.
+    """
+    while True:
+        try:
+            attempted = deliver_pending_emails(current_app.email_backend, batch_size)
+        except Exception as e:
+            log.exception("Failed to deliver pending emails")
+
+            capture_exception(e)
+
+            db.session.rollback()
+
+            attempted = 0
+
+        if attempted:
+            continue
+
+        if once:
+            break
+
+        time.sleep(poll_seconds)
+
+
 @blueprint.cli.command()
 @click.argument("email")
 def create_admin(email):
@@ -145,3 +634,7 @@ def populate():
         save(profile)
 
         print(profile.id)
+
+    update_search_documents(FacultyProfile, [profile.id for profile in profiles])
+
+    db.session.commit()
@@ -1,12 +1,14 @@
 import os
+from typing import Optional
 
 from flask import current_app
 from structlog import get_logger
 
-from server.models import VerificationToken
+from server.models import OutboxEmail, VerificationToken, db
 
 from .console_email_backend import ConsoleEmailBackend
-from .email_backend import EmailBackend
+from .email_backend import EmailBackend, EmailRejectedError
+from .fake_email_backend import FakeEmailBackend
 from .sparkpost_email_backend import SparkPostEmailBackend
 
 
@@ -22,7 +24,9 @@ SPARKPOST_API_KEY = os.environ.get("SPARKPOST_API_KEY")
 def init_email(app):
     email_backend: EmailBackend
 
-    if SPARKPOST_API_KEY is None:
+    if os.environ.get("EMAIL_BACKEND") == "fake":
+        app.email_backend = FakeEmailBackend()
+    elif SPARKPOST_API_KEY is None:
         log.warning(
             "Configuring email to log to console because SPARKPOST_API_KEY is not set."
         )
@@ -31,6 +35,32 @@ def init_email(app):
         app.email_backend = SparkPostEmailBackend(SPARKPOST_API_KEY)
 
 
+def send_email(
+    to: str, subject: str, html: str, token: VerificationToken
+) -> Optional[str]:
+    """
+    Send an email and return the provider's response, including when it
+    refused the email. With EMAIL_OUTBOX set, the email is instead queued for
+    `flask send-emails`, committed with the token, and the response is written
+    to the token once it is sent.
+    """
+    if current_app.config["EMAIL_OUTBOX"]:
+        db.session.add(
+            OutboxEmail(
+                to=to, subject=subject, html=html, verification_token_id=token.id
+            )
+        )
+
+        return None
+
+    try:
+        return current_app.email_backend.send_email(to, subject, html)
+    except EmailRejectedError as e:
+        log.error("Email rejected", token_id=token.id, email_log=e.email_log)
+
+        return e.email_log
+
+
 EMAIL_CLOSING = """
 <p>
     Sincerely,
@@ -50,7 +80,9 @@ def self_link(href):
     return f'<a href="{href}">{href}</a>'
 
 
-def send_faculty_registration_email(email: str, token: VerificationToken) -> str:
+def send_faculty_registration_email(
+    email: str, token: VerificationToken
+) -> Optional[str]:
     verify_link = self_link(get_verification_url(token))
 
     log.info("Sending faculty registration link", token_id=token.id)
@@ -76,12 +108,12 @@ def send_faculty_registration_email(email: str, token: VerificationToken) -> str
     {EMAIL_CLOSING}
     """
 
-    return current_app.email_backend.send_email(
-        email, "Weave Faculty Registration", html
-    )
+    return send_email(email, "Weave Faculty Registration", html, token)
 
 
-def send_student_registration_email(email: str, token: VerificationToken) -> str:
+def send_student_registration_email(
+    email: str, token: VerificationToken
+) -> Optional[str]:
     verify_link = self_link(get_verification_url(token))
 
     log.info("Sending student registration link", token_id=token.id)
@@ -108,9 +140,7 @@ def send_student_registration_email(email: str, token: VerificationToken) -> str
     {EMAIL_CLOSING}
     """
 
-    return current_app.email_backend.send_email(
-        email, "Weave Student Registration", html
-    )
+    return send_email(email, "Weave Student Registration", html, token)
 
 
 def send_faculty_login_email(email, token):
@@ -132,7 +162,7 @@ def send_faculty_login_email(email, token):
     {EMAIL_CLOSING}
     """
 
-    return current_app.email_backend.send_email(email, "Weave Faculty Login", html)
+    return send_email(email, "Weave Faculty Login", html, token)
 
 
 def send_student_login_email(email, token):
@@ -153,4 +183,4 @@ def send_student_login_email(email, token):
     {EMAIL_CLOSING}
     """
 
-    return current_app.email_backend.send_email(email, "Weave Student Login", html)
+    return send_email(email, "Weave Student Login", html, token)
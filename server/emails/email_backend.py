@@ -1,6 +1,54 @@
+from typing import Dict, List, Optional
+
+
+class EmailDeliveryError(Exception):
+    """
+    The email may not have been sent and can be retried.
+    """
+
+
+class EmailRejectedError(Exception):
+    """
+    The email provider refused the email, so retrying won't help. `email_log`
+    is the provider's response.
+    """
+
+    def __init__(self, email_log: str):
+        super().__init__(email_log)
+
+        self.email_log = email_log
+
+
 class EmailBackend:
     def send_email(self, to, subject, html) -> str:
         """
         Send an email and return a text record of the email provider's response.
         """
         raise NotImplementedError
+
+    def send_many(
+        self,
+        recipients: List[str],
+        subject: str,
+        html: str,
+        substitution_data: Optional[List[Dict[str, str]]] = None,
+    ) -> str:
+        """
+        Send the same email to several recipients. `html` may contain
+        {{placeholders}} filled from each recipient's `substitution_data`.
+        Backends that can't batch send one email per recipient.
+        """
+        if substitution_data is None:
+            substitution_data = [{} for _ in recipients]
+
+        records = []
+
+        for to, data in zip(recipients, substitution_data):
+            recipient_html = html
+
+            for key, value in data.items():
+                recipient_html = recipient_html.replace(f"{{{{{key}}}}}", value)
+
+            records.append(self.send_email(to, subject, recipient_html))
+
+        return "\n".join(records)
@@ -0,0 +1,31 @@
+from .email_backend import EmailBackend, EmailDeliveryError, EmailRejectedError
+
+
+class FakeEmailDeliveryError(EmailDeliveryError):
+    pass
+
+
+class FakeEmailBackend(EmailBackend):
+    """
+    Records emails instead of sending them, so the outbox worker can be run
+    and tested offline. The first `failures` sends raise an error, and sends
+    to `rejected_recipients` are refused.
+    """
+
+    def __init__(self, failures=0, rejected_recipients=()):
+        self.failures = failures
+        self.rejected_recipients = set(rejected_recipients)
+        self.sent_emails = []
+
+    def send_email(self, to, subject, html):
+        if to in self.rejected_recipients:
+            raise EmailRejectedError(f"Fake email to {to} rejected")
+
+        if self.failures > 0:
+            self.failures -= 1
+
+            raise FakeEmailDeliveryError(f"Failed to send {subject!r} to {to}")
+
+        self.sent_emails.append({"to": to, "subject": subject, "html": html})
+
+        return f"Fake email sent to {to}"
@@ -0,0 +1,103 @@
+import datetime
+from typing import List
+
+from sentry_sdk import capture_exception
+from structlog import get_logger
+
+from server.models import OutboxEmail, db
+
+from .email_backend import EmailBackend, EmailRejectedError
+
+
+log = get_logger()
+
+
+MAX_ATTEMPTS = 5
+
+# Doubled after each failed attempt
+RETRY_DELAY_SECONDS = 60
+
+
+def claim_pending_emails(batch_size: int) -> List[OutboxEmail]:
+    """
+    Lock pending emails that are due. Rows locked by another worker are
+    skipped, so several workers can send at once without sending twice.
+    """
+    return (
+        OutboxEmail.query.filter(
+            OutboxEmail.status == "pending",
+            OutboxEmail.next_attempt_at <= datetime.datetime.utcnow(),
+        )
+        .order_by(OutboxEmail.next_attempt_at)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+
+
+def deliver_email(email_backend: EmailBackend, outbox_email: OutboxEmail) -> bool:
+    outbox_email.attempts += 1
+
+    try:
+        email_log = email_backend.send_email(
+            outbox_email.to, outbox_email.subject, outbox_email.html
+        )
+    except EmailRejectedError as e:
+        log.error("Email rejected", outbox_email_id=outbox_email.id)
+
+        outbox_email.last_error = e.email_log
+        outbox_email.status = "failed"
+
+        if outbox_email.verification_token is not None:
+            outbox_email.verification_token.email_log = e.email_log
+
+        return False
+    except Exception as e:
+        outbox_email.last_error = repr(e)
+
+        if outbox_email.attempts >= MAX_ATTEMPTS:
+            log.error("Giving up sending email", outbox_email_id=outbox_email.id)
+
+            capture_exception(e)
+
+            outbox_email.status = "failed"
+        else:
+            delay = RETRY_DELAY_SECONDS * 2 ** (outbox_email.attempts - 1)
+
+            log.warning(
+                "Failed to send email",
+                outbox_email_id=outbox_email.id,
+                attempts=outbox_email.attempts,
+                retry_seconds=delay,
+            )
+
+            outbox_email.next_attempt_at = (
+                datetime.datetime.utcnow() + datetime.timedelta(seconds=delay)
+            )
+
+        return False
+
+    outbox_email.status = "sent"
+    outbox_email.date_sent = datetime.datetime.utcnow()
+
+    if outbox_email.verification_token is not None:
+        outbox_email.verification_token.email_log = email_log
+
+    log.info("Sent email", outbox_email_id=outbox_email.id)
+
+    return True
+
+
+def deliver_pending_emails(email_backend: EmailBackend, batch_size: int = 10) -> int:
+    """
+    Send a batch of due emails, returning how many were attempted. Rows stay
+    locked until the batch is committed.
+    """
+    outbox_emails = claim_pending_emails(batch_size)
+
+    for outbox_email in outbox_emails:
+        deliver_email(email_backend, outbox_email)
+
+    db.session.commit()
+
+    return len(outbox_emails)
@@ -1,27 +1,105 @@
+import json
+from typing import Dict, List, Optional
+
 import requests
-from requests_toolbelt.utils.dump import dump_all
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .email_backend import EmailBackend, EmailDeliveryError, EmailRejectedError
+
+
+TRANSMISSIONS_URL = "https://api.sparkpost.com/api/v1/transmissions"
+
+# (connect, read) in seconds
+DEFAULT_TIMEOUT = (3.05, 10)
 
-from .email_backend import EmailBackend
+# Statuses worth retrying later; other errors raise EmailRejectedError with
+# the delivery record
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
 
 
 class SparkPostEmailBackend(EmailBackend):
-    def __init__(self, api_key):
-        self.api_key = api_key
+    def __init__(self, api_key, timeout=DEFAULT_TIMEOUT, pool_size=10):
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        self.session.headers["Authorization"] = api_key
+
+        # Only connection failures are retried here, since a transmission
+        # whose request was sent may already have been accepted.
+        adapter = HTTPAdapter(
+            pool_maxsize=pool_size, max_retries=Retry(total=2, read=0, status=0)
+        )
+        self.session.mount("https://", adapter)
 
     def send_email(self, to, subject, html) -> str:
-        response = requests.post(
-            "https://api.sparkpost.com/api/v1/transmissions",
-            headers={"Authorization": self.api_key},
-            json={
-                "content": {
-                    "from": "admin@hmsweave.com",
-                    "subject": subject,
-                    "html": html,
+        return self.send_many([to], subject, html)
+
+    def send_many(
+        self,
+        recipients: List[str],
+        subject: str,
+        html: str,
+        substitution_data: Optional[List[Dict[str, str]]] = None,
+    ) -> str:
+        """
+        Send one transmission to all of `recipients`, returning a compact JSON
+        delivery record. Raises EmailDeliveryError if it may be retried, and
+        EmailRejectedError if SparkPost refused it.
+        """
+        if substitution_data is None:
+            substitution_data = [{} for _ in recipients]
+
+        try:
+            response = self.session.post(
+                TRANSMISSIONS_URL,
+                json={
+                    "content": {
+                        "from": "admin@hmsweave.com",
+                        "subject": subject,
+                        "html": html,
+                    },
+                    "recipients": [
+                        {"address": to, "substitution_data": data}
+                        for to, data in zip(recipients, substitution_data)
+                    ],
                 },
-                "recipients": [{"address": to}],
-            },
-        )
+                timeout=self.timeout,
+            )
+        except requests.RequestException as e:
+            raise EmailDeliveryError(f"SparkPost request failed: {e!r}") from e
+
+        if response.status_code in RETRYABLE_STATUSES:
+            raise EmailDeliveryError(
+                f"SparkPost responded {response.status_code}: {response.text[:200]}"
+            )
+
+        email_log = delivery_record(response)
 
-        email_log = dump_all(response).decode("utf-8")
+        if not response.ok:
+            raise EmailRejectedError(email_log)
 
         return email_log
+
+
+def delivery_record(response) -> str:
+    try:
+        body = response.json()
+    except ValueError:
+        body = {}
+
+    results = body.get("results", {})
+
+    record = {
+        "status": response.status_code,
+        "id": results.get("id"),
+        "accepted": results.get("total_accepted_recipients"),
+        "rejected": results.get("total_rejected_recipients"),
+    }
+
+    if "errors" in body:
+        record["errors"] = [
+            error.get("message") for error in body["errors"] if isinstance(error, dict)
+        ]
+
+    return json.dumps(record, separators=(",", ":"))
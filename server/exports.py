@@ -0,0 +1,183 @@
+"""
+Streams tables out as CSV or JSON lines in constant memory, for the admin
+export links and `flask export`.
+
+Rows are read through a server-side cursor in batches, and each profile's
+tags are aggregated into arrays in the same query, so neither the table nor
+its relations are ever loaded at once. Profile exports use the field names
+of `import-profiles`, so an export can be imported again.
+"""
+import csv
+import datetime
+import json
+from typing import Any, Iterator, List
+
+from sqlalchemy import and_, func, sql
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+
+from .models import (
+    BaseProfile,
+    FacultyProfile,
+    StudentProfile,
+    VerificationEmail,
+    VerificationToken,
+    db,
+)
+from .profile_import import CSV_LIST_SEPARATOR, STUDENT_OPTION_FIELDS, TAG_FIELDS
+
+
+EXPORT_FORMATS = ["csv", "jsonl"]
+
+EXPORT_BATCH_SIZE = 1000
+
+EXPORTABLE_MODELS = {
+    "faculty-profiles": FacultyProfile,
+    "student-profiles": StudentProfile,
+    "verification-tokens": VerificationToken,
+    "verification-emails": VerificationEmail,
+}
+
+# Derived from the other columns, and not meaningful outside the database
+EXCLUDED_COLUMNS = {
+    "version",
+    "star_version",
+    "search_document",
+    "last_name_sort_key",
+    *FacultyProfile.TAG_ID_COLUMNS,
+}
+
+
+def _email_column(email_id_column):
+    return (
+        sql.select([VerificationEmail.email])
+        .where(VerificationEmail.id == email_id_column)
+        .as_scalar()
+        .label("email")
+    )
+
+
+def _tag_values_column(profile_class, relation, option_class, name: str):
+    # Relation ids keep the order the tags were saved in
+    tag_values = (
+        sql.select(
+            [func.array_agg(aggregate_order_by(option_class.value, relation.id))]
+        )
+        .select_from(
+            relation.__table__.join(
+                option_class.__table__, relation.tag_id == option_class.id
+            )
+        )
+        .where(
+            and_(relation.relation_filter(), relation.profile_id == profile_class.id)
+        )
+        .as_scalar()
+    )
+
+    return func.coalesce(tag_values, sql.literal_column("'{}'::varchar[]")).label(name)
+
+
+def export_query(model) -> sql.Select:
+    """
+    Every row of `model` ordered by id. Profiles also get their login email,
+    the values of their student options and an array of values for each tag
+    field; tokens get their email.
+    """
+    columns: List[Any] = [
+        column
+        for column in model.__table__.columns
+        if column.name not in EXCLUDED_COLUMNS
+    ]
+
+    if model is VerificationToken:
+        columns.append(_email_column(model.email_id))
+
+    if issubclass(model, BaseProfile):
+        columns.append(_email_column(model.verification_email_id))
+
+        for field, (relation, option_class) in TAG_FIELDS[model].items():
+            columns.append(_tag_values_column(model, relation, option_class, field))
+
+    if model is StudentProfile:
+        for field, (column_name, option_class) in STUDENT_OPTION_FIELDS.items():
+            columns.append(
+                sql.select([option_class.value])
+                .where(option_class.id == model.__table__.c[column_name])
+                .as_scalar()
+                .label(field)
+            )
+
+    return sql.select(columns).order_by(model.id)
+
+
+def stream_rows(query: sql.Select, batch_size: int = EXPORT_BATCH_SIZE) -> Iterator:
+    """
+    Rows of `query`, fetched `batch_size` at a time from a server-side cursor.
+    """
+    connection = db.session.connection().execution_options(stream_results=True)
+
+    result = connection.execute(query)
+
+    try:
+        while True:
+            rows = result.fetchmany(batch_size)
+
+            if not rows:
+                break
+
+            yield from rows
+    finally:
+        result.close()
+
+
+class _Echo:
+    """
+    A file-like object whose `write` returns what was written, so that
+    `csv.writer` can produce one line at a time.
+    """
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def _csv_value(value: Any) -> Any:
+    if isinstance(value, list):
+        return CSV_LIST_SEPARATOR.join(value)
+
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+
+    return value
+
+
+def _json_value(value: Any) -> Any:
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+
+    return value
+
+
+def csv_lines(query: sql.Select) -> Iterator[str]:
+    writer = csv.writer(_Echo())
+
+    yield writer.writerow([column.name for column in query.columns])
+
+    for row in stream_rows(query):
+        yield writer.writerow([_csv_value(value) for value in row])
+
+
+def json_lines(query: sql.Select) -> Iterator[str]:
+    names = [column.name for column in query.columns]
+
+    for row in stream_rows(query):
+        values = {name: _json_value(value) for name, value in zip(names, row)}
+
+        yield json.dumps(values) + "\n"
+
+
+def export_lines(model, export_format: str) -> Iterator[str]:
+    query = export_query(model)
+
+    if export_format == "csv":
+        return csv_lines(query)
+
+    return json_lines(query)
@@ -1,10 +1,12 @@
 import uuid
 from datetime import datetime
-from typing import Any
+from typing import Any, Dict, List, Tuple, Type, Union
 
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import DDL, event
+from sqlalchemy.dialects.postgresql import ARRAY, TSVECTOR, UUID
 from sqlalchemy.ext.declarative import declared_attr
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import foreign, relationship
 
 from server.session import token_expired
 
@@ -33,6 +35,17 @@ def generate_uuid():
     return str(uuid.uuid4())
 
 
+def parse_profile_id(value) -> str:
+    """
+    The canonical form of a profile id from a request. Raises ValueError if
+    `value` isn't a UUID, rather than leaving Postgres to fail on it.
+    """
+    if not isinstance(value, str):
+        raise ValueError(f"Invalid profile id {value!r}")
+
+    return str(uuid.UUID(value))
+
+
 class IDMixin:
     id = db.Column(db.Integer, primary_key=True)
 
@@ -42,6 +55,11 @@ class VerificationEmail(IDMixin, db.Model):
     is_admin = db.Column(db.Boolean)
     is_faculty = db.Column(db.Boolean)
 
+    # Bumped by a trigger whenever the stars from this email change, so that
+    # every process can tell when its cached stars are out of date. See
+    # `star_cache`.
+    star_version = db.Column(db.Integer, nullable=False, server_default="0")
+
     def __str__(self):
         return f"<VerificationEmail {self.id}: {self.email}>"
 
@@ -91,8 +109,29 @@ class ActivityOption(UserEditableTagMixin, db.Model):
     pass
 
 
+# Any of the option models. TagValueMixin is a plain mixin, so it lacks what
+# db.Model adds, such as `__tablename__` and `query`.
+OptionClass = Union[
+    Type[HospitalAffiliationOption],
+    Type[StudentProgramOption],
+    Type[StudentYearOption],
+    Type[StudentPCESiteOption],
+    Type[DegreeOption],
+    Type[ClinicalSpecialtyOption],
+    Type[ProfessionalInterestOption],
+    Type[PartsOfMeOption],
+    Type[ActivityOption],
+]
+
+
+# Profile versions of both kinds of profile are drawn from this sequence, so
+# that they increase across tables.
+PROFILE_VERSION_SEQUENCE = db.Sequence("profile_version_seq", metadata=db.metadata)
+
+
 class BaseProfile:
-    id = db.Column(db.String, primary_key=True, default=generate_uuid)
+    # Stored as uuid, but read and written as strings
+    id = db.Column(UUID, primary_key=True, default=generate_uuid)
     name = db.Column(db.String(255), nullable=False)
     contact_email = db.Column(db.String(120), nullable=False)
 
@@ -101,6 +140,16 @@ class BaseProfile:
     date_created = db.Column(db.DateTime, nullable=False, default=default_now)
     date_updated = db.Column(db.DateTime, nullable=False, default=default_now)
 
+    # Bumped by Postgres on every write to the row, including admin edits
+    # that leave `date_updated` alone, so that every process can tell when
+    # its cached serialization of the profile is out of date.
+    version = db.Column(
+        db.BigInteger,
+        nullable=False,
+        server_default=db.text("nextval('profile_version_seq')"),
+        server_onupdate=db.FetchedValue(),
+    )
+
     # TODO make not nullable and remove additional_information === null workarounds
     additional_information = db.Column(db.String(500), default="")
 
@@ -112,10 +161,70 @@ class BaseProfile:
     willing_discuss_personal = db.Column(db.Boolean, default=False)
     willing_student_group = db.Column(db.Boolean, default=False)
 
+    # The last word of the name, lowercased, so that sorting by last name can
+    # read an index instead of splitting every name. Set by a trigger when the
+    # profile is inserted or renamed, see `last_name_sort_key_trigger_ddl`.
+    last_name_sort_key = db.Column(
+        db.String(255),
+        server_default=db.FetchedValue(),
+        server_onupdate=db.FetchedValue(),
+    )
+
+    # Full-text search document built from the profile's own fields and the
+    # values of its tags. See `queries.update_search_documents`.
+    search_document = db.Column(TSVECTOR)
+
+    # The ids of the profile's tags of each kind, in the order they were
+    # saved. Copied from profile_tag so that tag filters and serialization
+    # only need the profile row. See `profile_tag_ids`.
+    affiliation_ids = db.Column(ARRAY(db.Integer), nullable=False, server_default="{}")
+    clinical_specialty_ids = db.Column(
+        ARRAY(db.Integer), nullable=False, server_default="{}"
+    )
+    professional_interest_ids = db.Column(
+        ARRAY(db.Integer), nullable=False, server_default="{}"
+    )
+    parts_of_me_ids = db.Column(ARRAY(db.Integer), nullable=False, server_default="{}")
+    activity_ids = db.Column(ARRAY(db.Integer), nullable=False, server_default="{}")
+
+    TAG_ID_COLUMNS = [
+        "affiliation_ids",
+        "clinical_specialty_ids",
+        "professional_interest_ids",
+        "parts_of_me_ids",
+        "activity_ids",
+    ]
+
+    @declared_attr
+    def __table_args__(cls):
+        return (
+            db.Index(
+                f"ix_{cls.__tablename__}_search_document",
+                "search_document",
+                postgresql_using="gin",
+            ),
+            # Containment (@>) and overlap (&&) tests of the tag filters
+            *[
+                db.Index(
+                    f"ix_{cls.__tablename__}_{column}", column, postgresql_using="gin"
+                )
+                for column in cls.TAG_ID_COLUMNS
+            ],
+            # Pages sorted by last name, read forwards or backwards
+            db.Index(
+                f"ix_{cls.__tablename__}_last_name_sort_key", "last_name_sort_key", "id"
+            ),
+            # The latest version, see `queries.get_option_values`
+            db.Index(f"ix_{cls.__tablename__}_version", "version"),
+            # Pages sorted by date updated. Not partial on availability, since
+            # listings also include the viewer's own profile.
+            db.Index(f"ix_{cls.__tablename__}_date_updated", "date_updated", "id"),
+        )
+
     @declared_attr
     def verification_email_id(cls):
         return db.Column(
-            db.Integer, db.ForeignKey(VerificationEmail.id), nullable=False
+            db.Integer, db.ForeignKey(VerificationEmail.id), nullable=False, index=True
         )
 
     @declared_attr
@@ -128,21 +237,51 @@ class BaseProfile:
 
 class FacultyProfile(BaseProfile, db.Model):
     # TODO rename to hospital_affiliations
-    affiliations = relationship("FacultyHospitalAffiliation", cascade="all, delete")
+    affiliations = relationship(
+        "FacultyHospitalAffiliation",
+        primaryjoin="FacultyProfile.id == foreign(FacultyHospitalAffiliation.profile_id)",
+        order_by="FacultyHospitalAffiliation.id",
+        cascade="all, delete",
+    )
 
     clinical_specialties = relationship(
-        "FacultyClinicalSpecialty", cascade="all, delete"
+        "FacultyClinicalSpecialty",
+        primaryjoin="FacultyProfile.id == foreign(FacultyClinicalSpecialty.profile_id)",
+        order_by="FacultyClinicalSpecialty.id",
+        cascade="all, delete",
     )
 
     professional_interests = relationship(
-        "FacultyProfessionalInterest", cascade="all, delete"
+        "FacultyProfessionalInterest",
+        primaryjoin="FacultyProfile.id == foreign(FacultyProfessionalInterest.profile_id)",
+        order_by="FacultyProfessionalInterest.id",
+        cascade="all, delete",
+    )
+
+    parts_of_me = relationship(
+        "FacultyPartsOfMe",
+        primaryjoin="FacultyProfile.id == foreign(FacultyPartsOfMe.profile_id)",
+        order_by="FacultyPartsOfMe.id",
+        cascade="all, delete",
+    )
+
+    activities = relationship(
+        "FacultyProfileActivity",
+        primaryjoin="FacultyProfile.id == foreign(FacultyProfileActivity.profile_id)",
+        order_by="FacultyProfileActivity.id",
+        cascade="all, delete",
     )
 
-    parts_of_me = relationship("FacultyPartsOfMe", cascade="all, delete")
+    degrees = relationship(
+        "FacultyProfileDegree",
+        primaryjoin="FacultyProfile.id == foreign(FacultyProfileDegree.profile_id)",
+        order_by="FacultyProfileDegree.id",
+        cascade="all, delete",
+    )
 
-    activities = relationship("FacultyProfileActivity", cascade="all, delete")
+    degree_ids = db.Column(ARRAY(db.Integer), nullable=False, server_default="{}")
 
-    degrees = relationship("FacultyProfileDegree", cascade="all, delete")
+    TAG_ID_COLUMNS = [*BaseProfile.TAG_ID_COLUMNS, "degree_ids"]
 
     willing_shadowing = db.Column(db.Boolean, default=False)
     willing_networking = db.Column(db.Boolean, default=False)
@@ -151,19 +290,40 @@ class FacultyProfile(BaseProfile, db.Model):
 
 
 class StudentProfile(BaseProfile, db.Model):
-    affiliations = relationship("StudentHospitalAffiliation", cascade="all, delete")
+    affiliations = relationship(
+        "StudentHospitalAffiliation",
+        primaryjoin="StudentProfile.id == foreign(StudentHospitalAffiliation.profile_id)",
+        order_by="StudentHospitalAffiliation.id",
+        cascade="all, delete",
+    )
 
     clinical_specialties = relationship(
-        "StudentClinicalSpecialty", cascade="all, delete"
+        "StudentClinicalSpecialty",
+        primaryjoin="StudentProfile.id == foreign(StudentClinicalSpecialty.profile_id)",
+        order_by="StudentClinicalSpecialty.id",
+        cascade="all, delete",
     )
 
     professional_interests = relationship(
-        "StudentProfessionalInterest", cascade="all, delete"
+        "StudentProfessionalInterest",
+        primaryjoin="StudentProfile.id == foreign(StudentProfessionalInterest.profile_id)",
+        order_by="StudentProfessionalInterest.id",
+        cascade="all, delete",
     )
 
-    parts_of_me = relationship("StudentPartsOfMe", cascade="all, delete")
+    parts_of_me = relationship(
+        "StudentPartsOfMe",
+        primaryjoin="StudentProfile.id == foreign(StudentPartsOfMe.profile_id)",
+        order_by="StudentPartsOfMe.id",
+        cascade="all, delete",
+    )
 
-    activities = relationship("StudentProfileActivity", cascade="all, delete")
+    activities = relationship(
+        "StudentProfileActivity",
+        primaryjoin="StudentProfile.id == foreign(StudentProfileActivity.profile_id)",
+        order_by="StudentProfileActivity.id",
+        cascade="all, delete",
+    )
 
     program_id = db.Column(
         db.Integer, db.ForeignKey(StudentProgramOption.id), nullable=True
@@ -186,99 +346,228 @@ class StudentProfile(BaseProfile, db.Model):
     willing_residency = db.Column(db.Boolean, default=False)
 
 
-class ProfileTagMixin(IDMixin):
+# Either profile model, for code that works with both. Like TagValueMixin,
+# BaseProfile lacks what db.Model and the tag relationships add.
+ProfileClass = Union[Type[FacultyProfile], Type[StudentProfile]]
+
+PROFILE_MODELS: List[ProfileClass] = [FacultyProfile, StudentProfile]
+
+
+class ProfileTag(IDMixin, db.Model):
+    """
+    A tag of a profile: the option `tag_id` of the `tag_type` option table,
+    on the profile `profile_id` of the `profile_type` profile table.
+
+    Every kind of tag of both kinds of profile is kept in this one table, so
+    a profile's tags are read, filtered and saved with one indexed access.
+    Each (profile type, tag type) pair is mapped as a subclass, such as
+    `FacultyProfileActivity`, which the profile relationships load.
+
+    Since the table doesn't know which tables its ids point to, it can't have
+    foreign keys. Triggers check the same constraints instead, see
+    `CREATE_PROFILE_TAG_REFERENCE_FUNCTIONS`. Core queries against a
+    subclass's columns must add its `relation_filter()`, which ORM queries add
+    by themselves.
+    """
+
+    profile_id = db.Column(UUID, nullable=False)
+    profile_type = db.Column(db.String(50), nullable=False)
+    tag_type = db.Column(db.String(50), nullable=False)
+    tag_id = db.Column(db.Integer, nullable=False)
+
+    # Set by each subclass
+    profile_class: Any = None
+    option_class: Any = None
+    # The profile column its tag ids are copied to
+    tag_ids_column: Any = None
+
+    __mapper_args__ = {"polymorphic_on": profile_type + ":" + tag_type}
+
+    __table_args__ = (
+        # Loading and saving a profile's tags, with the tag ids covered
+        db.Index(
+            "ix_profile_tag_profile", "profile_id", "profile_type", "tag_type", "tag_id"
+        ),
+        # Filtering profiles by tag and counting the profiles per tag
+        db.Index(
+            "ix_profile_tag_tag", "tag_type", "tag_id", "profile_type", "profile_id"
+        ),
+    )
+
+    def __init__(self, **kwargs):
+        # The discriminator is an expression, so it isn't set automatically
+        super().__init__(
+            profile_type=self.profile_class.__tablename__,
+            tag_type=self.option_class.__tablename__,
+            **kwargs,
+        )
+
     def __str__(self):
         return self.tag.value
 
     def __repr__(self):
         return "<{}: {}>".format(self.__class__.__name__, self.tag.value)
 
+    @classmethod
+    def relation_filter(cls):
+        return db.and_(
+            ProfileTag.profile_type == cls.profile_class.__tablename__,
+            ProfileTag.tag_type == cls.option_class.__tablename__,
+        )
 
-class FacultyProfileTagMixin(ProfileTagMixin):
-    @declared_attr
-    def profile_id(cls):
-        return db.Column(db.String, db.ForeignKey(FacultyProfile.id), nullable=False)
+    @classmethod
+    def relation_row(cls, profile_id: str, tag_id: int) -> dict:
+        return {
+            "profile_id": profile_id,
+            "profile_type": cls.profile_class.__tablename__,
+            "tag_type": cls.option_class.__tablename__,
+            "tag_id": tag_id,
+        }
 
-    @declared_attr
-    def profile(cls):
-        return relationship(FacultyProfile)
 
+class ProfileTagRelationMixin:
+    """
+    Maps a `ProfileTag` subclass for its `profile_class` and `option_class`.
+    """
 
-class StudentProfileTagMixin(ProfileTagMixin):
     @declared_attr
-    def profile_id(cls):
-        return db.Column(db.String, db.ForeignKey(StudentProfile.id), nullable=False)
+    def __mapper_args__(cls):
+        return {
+            "polymorphic_identity": (
+                f"{cls.profile_class.__tablename__}:{cls.option_class.__tablename__}"
+            )
+        }
 
     @declared_attr
     def profile(cls):
-        return relationship(StudentProfile)
+        return relationship(
+            cls.profile_class,
+            primaryjoin=lambda: cls.profile_class.id == foreign(ProfileTag.profile_id),
+        )
 
+    @declared_attr
+    def tag(cls):
+        return relationship(
+            cls.option_class,
+            primaryjoin=lambda: cls.option_class.id == foreign(ProfileTag.tag_id),
+        )
 
-class FacultyHospitalAffiliation(FacultyProfileTagMixin, db.Model):
-    tag_id = db.Column(
-        db.Integer, db.ForeignKey(HospitalAffiliationOption.id), nullable=False
-    )
-    tag = relationship(HospitalAffiliationOption)
 
+class FacultyHospitalAffiliation(ProfileTagRelationMixin, ProfileTag):
+    profile_class = FacultyProfile
+    option_class = HospitalAffiliationOption
+    tag_ids_column = "affiliation_ids"
 
-class FacultyClinicalSpecialty(FacultyProfileTagMixin, db.Model):
-    tag_id = db.Column(
-        db.Integer, db.ForeignKey(ClinicalSpecialtyOption.id), nullable=False
-    )
-    tag = relationship(ClinicalSpecialtyOption)
 
+class FacultyClinicalSpecialty(ProfileTagRelationMixin, ProfileTag):
+    profile_class = FacultyProfile
+    option_class = ClinicalSpecialtyOption
+    tag_ids_column = "clinical_specialty_ids"
 
-class FacultyPartsOfMe(FacultyProfileTagMixin, db.Model):
-    tag_id = db.Column(db.Integer, db.ForeignKey(PartsOfMeOption.id), nullable=False)
-    tag = relationship(PartsOfMeOption)
 
+class FacultyPartsOfMe(ProfileTagRelationMixin, ProfileTag):
+    profile_class = FacultyProfile
+    option_class = PartsOfMeOption
+    tag_ids_column = "parts_of_me_ids"
 
-class FacultyProfessionalInterest(FacultyProfileTagMixin, db.Model):
-    tag_id = db.Column(
-        db.Integer, db.ForeignKey(ProfessionalInterestOption.id), nullable=False
-    )
-    tag = relationship(ProfessionalInterestOption)
 
+class FacultyProfessionalInterest(ProfileTagRelationMixin, ProfileTag):
+    profile_class = FacultyProfile
+    option_class = ProfessionalInterestOption
+    tag_ids_column = "professional_interest_ids"
 
-class FacultyProfileActivity(FacultyProfileTagMixin, db.Model):
-    tag_id = db.Column(db.Integer, db.ForeignKey(ActivityOption.id), nullable=False)
-    tag = relationship(ActivityOption)
 
+class FacultyProfileActivity(ProfileTagRelationMixin, ProfileTag):
+    profile_class = FacultyProfile
+    option_class = ActivityOption
+    tag_ids_column = "activity_ids"
 
-class FacultyProfileDegree(FacultyProfileTagMixin, db.Model):
-    tag_id = db.Column(db.Integer, db.ForeignKey(DegreeOption.id), nullable=False)
-    tag = relationship(DegreeOption)
 
+class FacultyProfileDegree(ProfileTagRelationMixin, ProfileTag):
+    profile_class = FacultyProfile
+    option_class = DegreeOption
+    tag_ids_column = "degree_ids"
 
-class StudentHospitalAffiliation(StudentProfileTagMixin, db.Model):
-    tag_id = db.Column(
-        db.Integer, db.ForeignKey(HospitalAffiliationOption.id), nullable=False
-    )
-    tag = relationship(HospitalAffiliationOption)
 
+class StudentHospitalAffiliation(ProfileTagRelationMixin, ProfileTag):
+    profile_class = StudentProfile
+    option_class = HospitalAffiliationOption
+    tag_ids_column = "affiliation_ids"
 
-class StudentClinicalSpecialty(StudentProfileTagMixin, db.Model):
-    tag_id = db.Column(
-        db.Integer, db.ForeignKey(ClinicalSpecialtyOption.id), nullable=False
-    )
-    tag = relationship(ClinicalSpecialtyOption)
+
+class StudentClinicalSpecialty(ProfileTagRelationMixin, ProfileTag):
+    profile_class = StudentProfile
+    option_class = ClinicalSpecialtyOption
+    tag_ids_column = "clinical_specialty_ids"
 
 
-class StudentPartsOfMe(StudentProfileTagMixin, db.Model):
-    tag_id = db.Column(db.Integer, db.ForeignKey(PartsOfMeOption.id), nullable=False)
-    tag = relationship(PartsOfMeOption)
+class StudentPartsOfMe(ProfileTagRelationMixin, ProfileTag):
+    profile_class = StudentProfile
+    option_class = PartsOfMeOption
+    tag_ids_column = "parts_of_me_ids"
 
 
-class StudentProfessionalInterest(StudentProfileTagMixin, db.Model):
-    tag_id = db.Column(
-        db.Integer, db.ForeignKey(ProfessionalInterestOption.id), nullable=False
+class StudentProfessionalInterest(ProfileTagRelationMixin, ProfileTag):
+    profile_class = StudentProfile
+    option_class = ProfessionalInterestOption
+    tag_ids_column = "professional_interest_ids"
+
+
+class StudentProfileActivity(ProfileTagRelationMixin, ProfileTag):
+    profile_class = StudentProfile
+    option_class = ActivityOption
+    tag_ids_column = "activity_ids"
+
+
+# The relations of each type of profile, one per tag id column
+PROFILE_TAG_RELATIONS: Dict[ProfileClass, List[Type[ProfileTag]]] = {
+    FacultyProfile: [
+        FacultyHospitalAffiliation,
+        FacultyClinicalSpecialty,
+        FacultyProfessionalInterest,
+        FacultyPartsOfMe,
+        FacultyProfileActivity,
+        FacultyProfileDegree,
+    ],
+    StudentProfile: [
+        StudentHospitalAffiliation,
+        StudentClinicalSpecialty,
+        StudentProfessionalInterest,
+        StudentPartsOfMe,
+        StudentProfileActivity,
+    ],
+}
+
+# The option tables that profile tags point to
+TAG_OPTION_MODELS: List[OptionClass] = list(
+    dict.fromkeys(
+        relation.option_class
+        for relations in PROFILE_TAG_RELATIONS.values()
+        for relation in relations
     )
-    tag = relationship(ProfessionalInterestOption)
+)
+
 
+class SearchableTag(db.Model):
+    """
+    Tag values offered as search filters: those that at least one available
+    profile of `profile_type` has. Kept up to date by `searchable_tags`.
+    """
 
-class StudentProfileActivity(StudentProfileTagMixin, db.Model):
-    tag_id = db.Column(db.Integer, db.ForeignKey(ActivityOption.id), nullable=False)
-    tag = relationship(ActivityOption)
+    profile_type = db.Column(db.String(50), primary_key=True)
+    option_type = db.Column(db.String(50), primary_key=True)
+    tag_id = db.Column(db.Integer, primary_key=True)
+    value = db.Column(db.String(50), nullable=False)
+    profile_count = db.Column(db.Integer, nullable=False)
+
+
+class CatalogVersion(db.Model):
+    """
+    Change counters for the tag catalogs, see `searchable_tags`.
+    """
+
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False)
 
 
 class ProfileStar(db.Model):
@@ -286,14 +575,14 @@ class ProfileStar(db.Model):
         db.Integer, db.ForeignKey(VerificationEmail.id), primary_key=True
     )
     to_verification_email_id = db.Column(
-        db.Integer, db.ForeignKey(VerificationEmail.id), primary_key=True
+        db.Integer, db.ForeignKey(VerificationEmail.id), primary_key=True, index=True
     )
 
 
 class VerificationToken(db.Model, IDMixin):
     token = db.Column(db.String(36), unique=True)
     email_id = db.Column(
-        db.Integer, db.ForeignKey(VerificationEmail.id), nullable=False
+        db.Integer, db.ForeignKey(VerificationEmail.id), nullable=False, index=True
     )
     email = relationship(VerificationEmail, backref="verification_tokens")
     date_created = db.Column(db.DateTime, nullable=False, default=default_now)
@@ -319,3 +608,283 @@ class VerificationToken(db.Model, IDMixin):
     @property
     def is_anonymous(self):
         return False
+
+
+class OutboxEmail(IDMixin, db.Model):
+    """
+    An email waiting to be sent by `flask send-emails`, see `emails.outbox`.
+    """
+
+    to = db.Column(db.String(120), nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    html = db.Column(db.Text, nullable=False)
+
+    verification_token_id = db.Column(
+        db.Integer, db.ForeignKey(VerificationToken.id), nullable=True
+    )
+    verification_token = relationship(VerificationToken)
+
+    # One of "pending", "sent" or "failed"
+    status = db.Column(db.String(20), nullable=False, default="pending")
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=default_now)
+    last_error = db.Column(db.Text)
+
+    date_created = db.Column(db.DateTime, nullable=False, default=default_now)
+    date_sent = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index(
+            "ix_outbox_email_pending",
+            "next_attempt_at",
+            postgresql_where=db.text("status = 'pending'"),
+        ),
+    )
+
+
+# Substring and fuzzy search match these columns with trigram indexes, see
+# `queries.SEARCH_MODES`. They need the pg_trgm extension, so they are only
+# created where it is available.
+TRIGRAM_INDEXED_COLUMNS: List[Tuple[Any, str]] = [
+    (FacultyProfile, "name"),
+    (FacultyProfile, "additional_information"),
+    (StudentProfile, "name"),
+    (StudentProfile, "additional_information"),
+    (ActivityOption, "value"),
+    (ClinicalSpecialtyOption, "value"),
+    (PartsOfMeOption, "value"),
+    (ProfessionalInterestOption, "value"),
+]
+
+CREATE_TRIGRAM_EXTENSION = DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
+
+def trigram_index_ddl(model, column_name):
+    table_name = model.__tablename__
+
+    return DDL(
+        f"CREATE INDEX IF NOT EXISTS ix_{table_name}_{column_name}_trgm"
+        f" ON {table_name} USING gin ({column_name} gin_trgm_ops)"
+    )
+
+
+def trigram_extension_available(connection) -> bool:
+    return (
+        connection.execute(
+            "SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'"
+        ).first()
+        is not None
+    )
+
+
+def _if_trigram_extension_available(ddl, target, bind, **kwargs):
+    return trigram_extension_available(bind)
+
+
+event.listen(
+    db.metadata,
+    "before_create",
+    CREATE_TRIGRAM_EXTENSION.execute_if(callable_=_if_trigram_extension_available),
+)
+
+for model, column_name in TRIGRAM_INDEXED_COLUMNS:
+    event.listen(
+        model.__table__,
+        "after_create",
+        trigram_index_ddl(model, column_name).execute_if(
+            callable_=_if_trigram_extension_available
+        ),
+    )
+
+
+CREATE_BUMP_PROFILE_VERSION_FUNCTION = DDL(
+    """
+    CREATE OR REPLACE FUNCTION bump_profile_version() RETURNS trigger AS $$
+    BEGIN
+        NEW.version := nextval('profile_version_seq');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """
+)
+
+
+def profile_version_trigger_ddl(model):
+    table_name = model.__tablename__
+
+    return DDL(
+        f"DROP TRIGGER IF EXISTS {table_name}_bump_version ON {table_name};"
+        f" CREATE TRIGGER {table_name}_bump_version BEFORE UPDATE ON {table_name}"
+        " FOR EACH ROW EXECUTE PROCEDURE bump_profile_version()"
+    )
+
+
+# Generated columns would need Postgres 12
+CREATE_SET_LAST_NAME_SORT_KEY_FUNCTION = DDL(
+    r"""
+    CREATE OR REPLACE FUNCTION set_last_name_sort_key() RETURNS trigger AS $$
+    BEGIN
+        NEW.last_name_sort_key := lower(regexp_replace(btrim(NEW.name), '^.*\s', ''));
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """
+)
+
+
+def last_name_sort_key_trigger_ddl(model):
+    table_name = model.__tablename__
+
+    return DDL(
+        f"DROP TRIGGER IF EXISTS {table_name}_set_last_name_sort_key ON {table_name};"
+        f" CREATE TRIGGER {table_name}_set_last_name_sort_key"
+        f" BEFORE INSERT OR UPDATE OF name ON {table_name}"
+        " FOR EACH ROW EXECUTE PROCEDURE set_last_name_sort_key()"
+    )
+
+
+CREATE_BUMP_STAR_VERSION_FUNCTION = DDL(
+    """
+    CREATE OR REPLACE FUNCTION bump_star_version() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            UPDATE verification_email SET star_version = star_version + 1
+            WHERE id = OLD.from_verification_email_id;
+        END IF;
+
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            UPDATE verification_email SET star_version = star_version + 1
+            WHERE id = NEW.from_verification_email_id;
+        END IF;
+
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """
+)
+
+STAR_VERSION_TRIGGER = DDL(
+    "DROP TRIGGER IF EXISTS profile_star_bump_version ON profile_star;"
+    " CREATE TRIGGER profile_star_bump_version"
+    " AFTER INSERT OR UPDATE OR DELETE ON profile_star"
+    " FOR EACH ROW EXECUTE PROCEDURE bump_star_version()"
+)
+
+
+# The foreign keys of profile_tag, checked like Postgres checks real ones:
+# the referenced rows are locked when a tag is saved, and deleting a profile
+# or option that is still tagged is refused. The checks are deferred to the
+# commit, since the ORM doesn't order profile_tag writes after the rows they
+# point to. Percent signs are doubled for DDL.
+CREATE_PROFILE_TAG_REFERENCE_FUNCTIONS = DDL(
+    """
+    CREATE OR REPLACE FUNCTION check_profile_tag_references() RETURNS trigger AS $$
+    DECLARE
+        referenced_rows integer;
+    BEGIN
+        EXECUTE format('SELECT 1 FROM %%I WHERE id = $1 FOR KEY SHARE', NEW.profile_type)
+        USING NEW.profile_id;
+
+        GET DIAGNOSTICS referenced_rows = ROW_COUNT;
+
+        IF referenced_rows = 0 THEN
+            RAISE foreign_key_violation USING MESSAGE = format(
+                'profile_tag references missing %%s %%s', NEW.profile_type, NEW.profile_id
+            );
+        END IF;
+
+        EXECUTE format('SELECT 1 FROM %%I WHERE id = $1 FOR KEY SHARE', NEW.tag_type)
+        USING NEW.tag_id;
+
+        GET DIAGNOSTICS referenced_rows = ROW_COUNT;
+
+        IF referenced_rows = 0 THEN
+            RAISE foreign_key_violation USING MESSAGE = format(
+                'profile_tag references missing %%s %%s', NEW.tag_type, NEW.tag_id
+            );
+        END IF;
+
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION refuse_tagged_profile_delete() RETURNS trigger AS $$
+    BEGIN
+        IF EXISTS (
+            SELECT 1 FROM profile_tag
+            WHERE profile_id = OLD.id AND profile_type = TG_TABLE_NAME
+        ) THEN
+            RAISE foreign_key_violation USING MESSAGE = format(
+                '%%s %%s is still referenced by profile_tag', TG_TABLE_NAME, OLD.id
+            );
+        END IF;
+
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION refuse_used_option_delete() RETURNS trigger AS $$
+    BEGIN
+        IF EXISTS (
+            SELECT 1 FROM profile_tag
+            WHERE tag_type = TG_TABLE_NAME AND tag_id = OLD.id
+        ) THEN
+            RAISE foreign_key_violation USING MESSAGE = format(
+                '%%s %%s is still referenced by profile_tag', TG_TABLE_NAME, OLD.id
+            );
+        END IF;
+
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """
+)
+
+PROFILE_TAG_REFERENCES_TRIGGER = DDL(
+    "DROP TRIGGER IF EXISTS profile_tag_check_references ON profile_tag;"
+    " CREATE CONSTRAINT TRIGGER profile_tag_check_references"
+    " AFTER INSERT OR UPDATE ON profile_tag DEFERRABLE INITIALLY DEFERRED"
+    " FOR EACH ROW EXECUTE PROCEDURE check_profile_tag_references()"
+)
+
+
+def tagged_delete_trigger_ddl(model, function_name):
+    table_name = model.__tablename__
+
+    return DDL(
+        f"DROP TRIGGER IF EXISTS {table_name}_refuse_tagged_delete ON {table_name};"
+        f" CREATE CONSTRAINT TRIGGER {table_name}_refuse_tagged_delete"
+        f" AFTER DELETE ON {table_name} DEFERRABLE INITIALLY DEFERRED"
+        f" FOR EACH ROW EXECUTE PROCEDURE {function_name}()"
+    )
+
+
+def profile_tag_reference_ddls():
+    """
+    The triggers that stand in for profile_tag's foreign keys, by table.
+    """
+    return [
+        (ProfileTag, PROFILE_TAG_REFERENCES_TRIGGER),
+        *[
+            (model, tagged_delete_trigger_ddl(model, "refuse_tagged_profile_delete"))
+            for model in PROFILE_MODELS
+        ],
+        *[
+            (model, tagged_delete_trigger_ddl(model, "refuse_used_option_delete"))
+            for model in TAG_OPTION_MODELS
+        ],
+    ]
+
+
+event.listen(db.metadata, "before_create", CREATE_BUMP_PROFILE_VERSION_FUNCTION)
+event.listen(db.metadata, "before_create", CREATE_SET_LAST_NAME_SORT_KEY_FUNCTION)
+event.listen(db.metadata, "before_create", CREATE_BUMP_STAR_VERSION_FUNCTION)
+event.listen(ProfileStar.__table__, "after_create", STAR_VERSION_TRIGGER)
+event.listen(db.metadata, "before_create", CREATE_PROFILE_TAG_REFERENCE_FUNCTIONS)
+
+for model, trigger_ddl in profile_tag_reference_ddls():
+    event.listen(model.__table__, "after_create", trigger_ddl)
+
+for model in PROFILE_MODELS:
+    for trigger_ddl in [profile_version_trigger_ddl, last_name_sort_key_trigger_ddl]:
+        event.listen(model.__table__, "after_create", trigger_ddl(model))
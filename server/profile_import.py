@@ -0,0 +1,504 @@
+import csv
+import datetime
+import json
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Set,
+    TextIO,
+    Tuple,
+    Type,
+)
+
+from sqlalchemy import Boolean
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import DataError
+from structlog import get_logger
+
+from .models import (
+    ActivityOption,
+    ClinicalSpecialtyOption,
+    DegreeOption,
+    FacultyClinicalSpecialty,
+    FacultyHospitalAffiliation,
+    FacultyPartsOfMe,
+    FacultyProfessionalInterest,
+    FacultyProfile,
+    FacultyProfileActivity,
+    FacultyProfileDegree,
+    HospitalAffiliationOption,
+    OptionClass,
+    PartsOfMeOption,
+    ProfessionalInterestOption,
+    ProfileClass,
+    ProfileTag,
+    StudentClinicalSpecialty,
+    StudentHospitalAffiliation,
+    StudentPartsOfMe,
+    StudentPCESiteOption,
+    StudentProfessionalInterest,
+    StudentProfile,
+    StudentProfileActivity,
+    StudentProgramOption,
+    StudentYearOption,
+    VerificationEmail,
+    db,
+    generate_uuid,
+)
+from .queries import update_search_documents
+from .searchable_tags import (
+    PROFILE_TAGS_CATALOG,
+    bump_catalog_version,
+    refresh_stale_tags,
+)
+
+
+log = get_logger()
+
+
+# Tag fields of imported rows, named as in the API: relation and option class
+TAG_FIELDS: Dict[ProfileClass, Dict[str, Tuple[Type[ProfileTag], OptionClass]]] = {
+    FacultyProfile: {
+        "affiliations": (FacultyHospitalAffiliation, HospitalAffiliationOption),
+        "clinical_specialties": (FacultyClinicalSpecialty, ClinicalSpecialtyOption),
+        "professional_interests": (
+            FacultyProfessionalInterest,
+            ProfessionalInterestOption,
+        ),
+        "parts_of_me": (FacultyPartsOfMe, PartsOfMeOption),
+        "activities": (FacultyProfileActivity, ActivityOption),
+        "degrees": (FacultyProfileDegree, DegreeOption),
+    },
+    StudentProfile: {
+        "affiliations": (StudentHospitalAffiliation, HospitalAffiliationOption),
+        "clinical_specialties": (StudentClinicalSpecialty, ClinicalSpecialtyOption),
+        "professional_interests": (
+            StudentProfessionalInterest,
+            ProfessionalInterestOption,
+        ),
+        "parts_of_me": (StudentPartsOfMe, PartsOfMeOption),
+        "activities": (StudentProfileActivity, ActivityOption),
+    },
+}
+
+# Single option fields of student profiles: column and option class
+STUDENT_OPTION_FIELDS: Dict[str, Tuple[str, OptionClass]] = {
+    "program": ("program_id", StudentProgramOption),
+    "current_year": ("current_year_id", StudentYearOption),
+    "pce_site": ("pce_site_id", StudentPCESiteOption),
+}
+
+# Columns that are set by the import rather than read from rows
+GENERATED_COLUMNS = {
+    "id",
+    "verification_email_id",
+    "date_created",
+    "date_updated",
+    "version",
+    "search_document",
+    "last_name_sort_key",
+    *FacultyProfile.TAG_ID_COLUMNS,
+}
+
+# Separates the values of tag fields in CSV files
+CSV_LIST_SEPARATOR = ";"
+
+TRUE_VALUES = {"true", "yes", "1"}
+FALSE_VALUES = {"false", "no", "0"}
+
+OptionIds = Dict[OptionClass, Dict[str, int]]
+
+# An imported row, by field name, with the line it was read from
+Row = Dict[str, Any]
+
+
+class ProfileImportError(Exception):
+    pass
+
+
+class ImportResult(NamedTuple):
+    imported: int
+    skipped: int
+
+
+def profile_columns(profile_class: ProfileClass) -> Dict[str, bool]:
+    """
+    Columns that can be imported from rows, and whether each is a boolean.
+    """
+    option_columns = {column for column, _ in STUDENT_OPTION_FIELDS.values()}
+
+    return {
+        column.name: isinstance(column.type, Boolean)
+        for column in profile_class.__table__.columns
+        if column.name not in GENERATED_COLUMNS | option_columns
+    }
+
+
+def parse_boolean(value: str, line_number: int) -> bool:
+    if value.lower() in TRUE_VALUES:
+        return True
+
+    if value.lower() in FALSE_VALUES:
+        return False
+
+    raise ProfileImportError(f"Line {line_number}: {value!r} is not true or false")
+
+
+def read_json_lines(file: TextIO) -> Iterator[Row]:
+    for line_number, line in enumerate(file, start=1):
+        if not line.strip():
+            continue
+
+        try:
+            fields = json.loads(line)
+        except ValueError as e:
+            raise ProfileImportError(f"Line {line_number}: {e}")
+
+        if not isinstance(fields, dict):
+            raise ProfileImportError(f"Line {line_number}: expected an object")
+
+        yield {**fields, "line_number": line_number}
+
+
+def read_csv(file: TextIO, profile_class: ProfileClass) -> Iterator[Row]:
+    """
+    Rows of a CSV file with a header. Tag fields are lists separated by
+    semicolons, and empty cells are left out.
+    """
+    boolean_columns = {
+        name
+        for name, is_boolean in profile_columns(profile_class).items()
+        if is_boolean
+    }
+
+    # The header is line 1
+    for line_number, csv_row in enumerate(csv.DictReader(file), start=2):
+        row: Row = {"line_number": line_number}
+
+        for field, value in csv_row.items():
+            if value is None or value == "":
+                continue
+
+            if field in TAG_FIELDS[profile_class]:
+                row[field] = value.split(CSV_LIST_SEPARATOR)
+            elif field in boolean_columns:
+                row[field] = parse_boolean(value, line_number)
+            else:
+                row[field] = value
+
+        yield row
+
+
+def batches(rows: Iterable[Row], batch_size: int) -> Iterator[List[Row]]:
+    batch: List[Row] = []
+
+    for row in rows:
+        batch.append(row)
+
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
+
+
+def load_option_ids(option_classes: Iterable[OptionClass]) -> OptionIds:
+    return {
+        option_class: dict(db.session.query(option_class.value, option_class.id))
+        for option_class in option_classes
+    }
+
+
+def create_options(
+    connection, option_ids: OptionIds, values: Dict[OptionClass, Set[str]]
+):
+    """
+    Insert the option values missing from `option_ids` and add their ids.
+    Returns whether any options were created.
+    """
+    created = False
+
+    for option_class, option_values in values.items():
+        new_values = sorted(option_values - option_ids[option_class].keys())
+
+        if not new_values:
+            continue
+
+        option_insert = insert(option_class.__table__).values(
+            [{"value": value} for value in new_values]
+        )
+
+        inserted = connection.execute(
+            option_insert.on_conflict_do_update(
+                index_elements=[option_class.value],
+                set_={"value": option_insert.excluded.value},
+            ).returning(option_class.value, option_class.id)
+        )
+
+        option_ids[option_class].update(
+            {value: option_id for value, option_id in inserted}
+        )
+
+        created = True
+
+    return created
+
+
+def clean_row(row: Row, profile_class: ProfileClass) -> Row:
+    line_number = row["line_number"]
+
+    for field in ["name", "contact_email"]:
+        if not isinstance(row.get(field), str) or not row[field].strip():
+            raise ProfileImportError(f"Line {line_number}: {field} is required")
+
+    contact_email = row["contact_email"].strip()
+
+    if not isinstance(row.get("email") or "", str):
+        raise ProfileImportError(f"Line {line_number}: email must be a string")
+
+    tags: Dict[str, List[str]] = {}
+
+    for field in TAG_FIELDS[profile_class]:
+        values = row.get(field) or []
+
+        if not isinstance(values, list) or not all(
+            isinstance(value, str) for value in values
+        ):
+            raise ProfileImportError(
+                f"Line {line_number}: {field} must be a list of strings"
+            )
+
+        # Drop duplicates, keeping the order the tags were listed in
+        tags[field] = list(
+            dict.fromkeys(value.strip() for value in values if value.strip())
+        )
+
+    return {
+        **row,
+        "name": row["name"].strip(),
+        "contact_email": contact_email,
+        "email": (row.get("email") or contact_email).strip().lower(),
+        "tags": tags,
+    }
+
+
+def existing_emails(profile_class: ProfileClass, rows: List[Row]) -> Set[str]:
+    """
+    Contact and verification emails of `rows` that already have a profile.
+    """
+    contact_emails = {row["contact_email"] for row in rows}
+    emails = {row["email"] for row in rows}
+
+    contact_matches = db.session.query(profile_class.contact_email).filter(
+        profile_class.contact_email.in_(contact_emails)
+    )
+
+    email_matches = (
+        db.session.query(VerificationEmail.email)
+        .join(
+            profile_class, profile_class.verification_email_id == VerificationEmail.id
+        )
+        .filter(VerificationEmail.email.in_(emails))
+    )
+
+    return {email for email, in contact_matches.union_all(email_matches)}
+
+
+def import_batch(
+    profile_class: ProfileClass, rows: List[Row], option_ids: OptionIds
+) -> int:
+    """
+    Insert a batch of profiles with their verification emails, options and
+    tags, using one multi-row insert per table. Returns how many profiles
+    were imported; rows for emails that already have a profile are skipped.
+    """
+    connection = db.session.connection()
+
+    taken_emails = existing_emails(profile_class, rows)
+
+    new_rows = []
+
+    for row in rows:
+        if {row["contact_email"], row["email"]} & taken_emails:
+            log.info("Skipping existing profile", line_number=row["line_number"])
+            continue
+
+        taken_emails.update([row["contact_email"], row["email"]])
+        new_rows.append(row)
+
+    if not new_rows:
+        return 0
+
+    tag_fields = TAG_FIELDS[profile_class]
+    option_fields = STUDENT_OPTION_FIELDS if profile_class is StudentProfile else {}
+
+    option_values: Dict[OptionClass, Set[str]] = {
+        option_class: set() for option_class in option_ids
+    }
+
+    for row in new_rows:
+        for field, (_, option_class) in tag_fields.items():
+            option_values[option_class].update(row["tags"][field])
+
+        for field, (_, option_class) in option_fields.items():
+            if row.get(field):
+                option_values[option_class].add(row[field])
+
+    if create_options(connection, option_ids, option_values):
+        bump_catalog_version(connection, PROFILE_TAGS_CATALOG)
+
+    email_insert = insert(VerificationEmail.__table__).values(
+        [
+            {"email": row["email"], "is_faculty": profile_class is FacultyProfile}
+            for row in new_rows
+        ]
+    )
+
+    email_ids = dict(
+        connection.execute(
+            email_insert.on_conflict_do_update(
+                index_elements=[VerificationEmail.email],
+                set_={"email": email_insert.excluded.email},
+            ).returning(VerificationEmail.email, VerificationEmail.id)
+        ).fetchall()
+    )
+
+    columns = profile_columns(profile_class)
+
+    now = datetime.datetime.utcnow()
+
+    profiles: List[Dict[str, Any]] = []
+    profile_tags: List[Dict[str, Any]] = []
+
+    stale_tags: Dict[Type[ProfileTag], Set[int]] = {
+        relation: set() for relation, _ in tag_fields.values()
+    }
+
+    for row in new_rows:
+        profile: Dict[str, Any] = {
+            "id": generate_uuid(),
+            "verification_email_id": email_ids[row["email"]],
+            "date_created": now,
+            "date_updated": now,
+            **{column: row.get(column) for column in columns},
+        }
+
+        profile["cadence"] = profile["cadence"] or "monthly"
+        profile["additional_information"] = profile["additional_information"] or ""
+
+        if profile["available_for_mentoring"] is None:
+            profile["available_for_mentoring"] = True
+
+        for field, (column, option_class) in option_fields.items():
+            value = row.get(field)
+
+            profile[column] = option_ids[option_class][value] if value else None
+
+        profiles.append(profile)
+
+        for field, (relation, option_class) in tag_fields.items():
+            tag_ids = [option_ids[option_class][value] for value in row["tags"][field]]
+
+            profile_tags.extend(
+                relation.relation_row(profile["id"], tag_id) for tag_id in tag_ids
+            )
+
+            stale_tags[relation].update(tag_ids)
+
+    connection.execute(profile_class.__table__.insert().values(profiles))
+
+    if profile_tags:
+        connection.execute(ProfileTag.__table__.insert().values(profile_tags))
+
+    profile_ids = [profile["id"] for profile in profiles]
+
+    update_search_documents(profile_class, profile_ids)
+
+    refresh_stale_tags(connection, stale_tags)
+
+    return len(profiles)
+
+
+def find_unstorable_row(
+    profile_class: ProfileClass, rows: List[Row], option_ids: OptionIds
+) -> Tuple[Row, DataError]:
+    """
+    The first of `rows` whose values the database refuses, such as a name
+    longer than its column, found by importing each row on its own in a
+    savepoint that is rolled back.
+    """
+    for row in rows:
+        savepoint = db.session.begin_nested()
+
+        try:
+            import_batch(
+                profile_class,
+                [row],
+                {option_class: dict(ids) for option_class, ids in option_ids.items()},
+            )
+        except DataError as e:
+            return row, e
+        finally:
+            savepoint.rollback()
+
+    raise ProfileImportError(
+        f"Lines {rows[0]['line_number']}-{rows[-1]['line_number']} can't be stored"
+    )
+
+
+def import_profiles(
+    rows: Iterable[Row], profile_class: ProfileClass, batch_size: int = 500
+) -> ImportResult:
+    """
+    Import profiles from rows shaped like the profile API's payloads, with an
+    optional `email` to log in with (the contact email by default). Each
+    batch is committed separately; a row the database refuses rolls back its
+    batch and is reported.
+    """
+    option_classes = {
+        option_class for _, option_class in TAG_FIELDS[profile_class].values()
+    }
+
+    if profile_class is StudentProfile:
+        option_classes.update(
+            option_class for _, option_class in STUDENT_OPTION_FIELDS.values()
+        )
+
+    # Option ids are resolved in memory, and only new values are inserted
+    option_ids = load_option_ids(option_classes)
+
+    imported = 0
+    skipped = 0
+
+    for batch in batches(rows, batch_size):
+        cleaned_rows = [clean_row(row, profile_class) for row in batch]
+
+        try:
+            batch_imported = import_batch(profile_class, cleaned_rows, option_ids)
+        except DataError:
+            db.session.rollback()
+
+            # Options created by the batch were rolled back with it
+            option_ids = load_option_ids(option_classes)
+
+            row, error = find_unstorable_row(profile_class, cleaned_rows, option_ids)
+
+            db.session.rollback()
+
+            raise ProfileImportError(
+                f"Line {row['line_number']}: {error.orig.diag.message_primary}"
+            )
+
+        db.session.commit()
+
+        imported += batch_imported
+        skipped += len(batch) - batch_imported
+
+        log.info("Imported profiles", imported=imported, skipped=skipped)
+
+    return ImportResult(imported=imported, skipped=skipped)
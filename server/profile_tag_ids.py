@@ -0,0 +1,92 @@
+"""
+Maintains the tag id arrays of the profiles, such as
+`FacultyProfile.activity_ids`: copies of the ids in `profile_tag` of each
+kind of tag a profile has, in the order they were saved.
+
+Tag filters test the arrays with containment and overlap operators backed by
+GIN indexes, rather than probing profile_tag once per tag, and serialized
+profiles resolve their tag values from the arrays with an in-memory map of
+option values instead of loading their tags.
+
+Writes that go through the connection, such as `save_tags`, update the
+arrays in the same statement as the search document, see
+`queries.update_search_documents`. Tags added to or removed from profiles
+through the ORM are picked up by a flush hook.
+"""
+from collections import defaultdict
+from itertools import chain
+from typing import Dict, List, Set, Type
+
+from sqlalchemy import and_, event, func, sql
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import get_history
+
+from .models import PROFILE_TAG_RELATIONS, ProfileClass, ProfileTag
+
+
+def tag_ids_expression(profile_class: ProfileClass, relation: Type[ProfileTag]):
+    """
+    The ids of the profile's `relation` tags, in the order they were saved.
+    """
+    tag_ids = (
+        sql.select(
+            [func.array_agg(aggregate_order_by(ProfileTag.tag_id, ProfileTag.id))]
+        )
+        .where(
+            and_(relation.relation_filter(), ProfileTag.profile_id == profile_class.id)
+        )
+        .as_scalar()
+    )
+
+    return func.coalesce(tag_ids, sql.literal_column("'{}'::integer[]"))
+
+
+def tag_ids_values(profile_class: ProfileClass) -> Dict:
+    """
+    Values that set every tag id column of `profile_class` from profile_tag,
+    for an UPDATE of its table.
+    """
+    return {
+        getattr(profile_class, relation.tag_ids_column): tag_ids_expression(
+            profile_class, relation
+        )
+        for relation in PROFILE_TAG_RELATIONS[profile_class]
+    }
+
+
+def update_tag_ids(
+    connection, profile_class: ProfileClass, profile_ids: List[str]
+) -> None:
+    connection.execute(
+        profile_class.__table__.update()
+        .where(profile_class.id.in_(profile_ids))
+        .values(tag_ids_values(profile_class))
+    )
+
+
+@event.listens_for(Session, "after_flush")
+def update_flushed_tag_ids(session, flush_context):
+    changed_profiles: Dict[ProfileClass, Set[str]] = defaultdict(set)
+
+    for instance in chain(session.new, session.deleted, session.dirty):
+        if not isinstance(instance, ProfileTag):
+            continue
+
+        profile_ids = chain(*get_history(instance, "profile_id"))
+
+        changed_profiles[instance.profile_class].update(
+            profile_id for profile_id in profile_ids if profile_id is not None
+        )
+
+    for profile_class, profile_ids in changed_profiles.items():
+        update_tag_ids(session.connection(), profile_class, sorted(profile_ids))
+
+        # The loaded profiles still have the arrays from before the update
+        for profile_id in profile_ids:
+            profile = session.identity_map.get(
+                session.identity_key(profile_class, profile_id)
+            )
+
+            if profile is not None:
+                session.expire(profile, profile_class.TAG_ID_COLUMNS)
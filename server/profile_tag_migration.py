@@ -0,0 +1,115 @@
+"""
+Moves tags from the table per profile relation that databases created before
+`ProfileTag` have, such as faculty_profile_activity, into `profile_tag`.
+
+Each old table is copied and dropped in the caller's transaction, so the
+migration can be run again safely: tables that are already gone are skipped,
+and nothing is dropped unless its tags were copied.
+"""
+from typing import Dict, Type
+
+from sqlalchemy import and_, exists, inspect, sql
+from sqlalchemy.dialects.postgresql import UUID
+
+from .models import (
+    FacultyClinicalSpecialty,
+    FacultyHospitalAffiliation,
+    FacultyPartsOfMe,
+    FacultyProfessionalInterest,
+    FacultyProfileActivity,
+    FacultyProfileDegree,
+    ProfileTag,
+    StudentClinicalSpecialty,
+    StudentHospitalAffiliation,
+    StudentPartsOfMe,
+    StudentProfessionalInterest,
+    StudentProfileActivity,
+)
+
+
+LEGACY_RELATION_TABLES: Dict[str, Type[ProfileTag]] = {
+    "faculty_hospital_affiliation": FacultyHospitalAffiliation,
+    "faculty_clinical_specialty": FacultyClinicalSpecialty,
+    "faculty_parts_of_me": FacultyPartsOfMe,
+    "faculty_professional_interest": FacultyProfessionalInterest,
+    "faculty_profile_activity": FacultyProfileActivity,
+    "faculty_profile_degree": FacultyProfileDegree,
+    "student_hospital_affiliation": StudentHospitalAffiliation,
+    "student_clinical_specialty": StudentClinicalSpecialty,
+    "student_parts_of_me": StudentPartsOfMe,
+    "student_professional_interest": StudentProfessionalInterest,
+    "student_profile_activity": StudentProfileActivity,
+}
+
+
+def _legacy_tags(table_name: str, relation: Type[ProfileTag]):
+    """
+    The tags of an old relation table as profile_tag rows, in the order they
+    were saved. Duplicates, which the old tables allowed, and tags already in
+    profile_tag are left out.
+    """
+    legacy = sql.table(
+        table_name, sql.column("id"), sql.column("profile_id"), sql.column("tag_id")
+    )
+
+    earlier = legacy.alias("earlier")
+
+    # The old tables kept profile ids as strings
+    profile_id = sql.cast(legacy.c.profile_id, UUID)
+
+    first_of_duplicates = ~exists().where(
+        and_(
+            earlier.c.profile_id == legacy.c.profile_id,
+            earlier.c.tag_id == legacy.c.tag_id,
+            earlier.c.id < legacy.c.id,
+        )
+    )
+
+    already_copied = exists().where(
+        and_(
+            relation.relation_filter(),
+            ProfileTag.profile_id == profile_id,
+            ProfileTag.tag_id == legacy.c.tag_id,
+        )
+    )
+
+    return (
+        sql.select(
+            [
+                profile_id,
+                sql.literal(relation.profile_class.__tablename__),
+                sql.literal(relation.option_class.__tablename__),
+                legacy.c.tag_id,
+            ]
+        )
+        .where(and_(first_of_duplicates, ~already_copied))
+        .order_by(legacy.c.id)
+    )
+
+
+def migrate_profile_tags(connection) -> Dict[str, int]:
+    """
+    Copy the tags of each old relation table that still exists into
+    profile_tag, then drop the table. Returns the number of tags copied from
+    each table. The caller is responsible for committing.
+    """
+    existing_tables = set(inspect(connection).get_table_names())
+
+    copied = {}
+
+    for table_name, relation in LEGACY_RELATION_TABLES.items():
+        if table_name not in existing_tables:
+            continue
+
+        result = connection.execute(
+            ProfileTag.__table__.insert().from_select(
+                ["profile_id", "profile_type", "tag_type", "tag_id"],
+                _legacy_tags(table_name, relation),
+            )
+        )
+
+        copied[table_name] = result.rowcount
+
+        connection.execute(f"DROP TABLE {table_name}")
+
+    return copied
@@ -1,13 +1,19 @@
-import operator
-from functools import reduce
-from typing import List, Optional, Type
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple, Type, Union
 
+from flask import current_app
 from flask_sqlalchemy import BaseQuery
-from sqlalchemy import and_, func, or_, sql
+from sqlalchemy import and_, any_, exists, func, or_, sql
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.orm import selectinload
 
 from .models import (
+    PROFILE_MODELS,
+    PROFILE_TAG_RELATIONS,
     ActivityOption,
     BaseProfile,
+    CatalogVersion,
     ClinicalSpecialtyOption,
     DegreeOption,
     FacultyClinicalSpecialty,
@@ -18,9 +24,12 @@ from .models import (
     FacultyProfileActivity,
     FacultyProfileDegree,
     HospitalAffiliationOption,
+    OptionClass,
     PartsOfMeOption,
     ProfessionalInterestOption,
-    ProfileStar,
+    ProfileClass,
+    ProfileTag,
+    SearchableTag,
     StudentClinicalSpecialty,
     StudentHospitalAffiliation,
     StudentPartsOfMe,
@@ -34,6 +43,92 @@ from .models import (
     VerificationToken,
     db,
 )
+from .profile_tag_ids import tag_ids_values
+from .star_cache import load_starred_email_ids
+
+
+# The "simple" configuration lowercases words without stemming, so prefix
+# queries behave like the substring search users are used to.
+SEARCH_CONFIGURATION = "simple"
+
+# How the words of a search query are matched:
+#
+# - "prefix" matches the start of words in the full-text search document
+# - "substring" matches anywhere in profile names, additional information and
+#   searchable tag values
+# - "fuzzy" matches the same fields by trigram word similarity, so misspelled
+#   words still match, and can be sorted by relevance
+#
+# Substring and fuzzy matching use the trigram indexes from pg_trgm; fuzzy
+# matching isn't possible at all without the extension.
+SEARCH_MODES = ["prefix", "substring", "fuzzy"]
+
+FACULTY_SEARCHABLE_TAG_FIELDS = [
+    (FacultyClinicalSpecialty, ClinicalSpecialtyOption),
+    (FacultyProfessionalInterest, ProfessionalInterestOption),
+    (FacultyPartsOfMe, PartsOfMeOption),
+    (FacultyProfileActivity, ActivityOption),
+]
+
+STUDENT_SEARCHABLE_TAG_FIELDS = [
+    (StudentClinicalSpecialty, ClinicalSpecialtyOption),
+    (StudentProfessionalInterest, ProfessionalInterestOption),
+    (StudentPartsOfMe, PartsOfMeOption),
+    (StudentProfileActivity, ActivityOption),
+]
+
+# Tags offered as search filters for each type of profile: the relation, the
+# option class, the name of the tag type and whether only public options are
+# offered.
+SEARCH_FILTER_TAGS: Dict[
+    ProfileClass, List[Tuple[Type[ProfileTag], OptionClass, str, bool]]
+] = {
+    FacultyProfile: [
+        (
+            FacultyHospitalAffiliation,
+            HospitalAffiliationOption,
+            "hospital_affiliations",
+            False,
+        ),
+        (FacultyProfileDegree, DegreeOption, "degrees", False),
+        (FacultyProfileActivity, ActivityOption, "activities", True),
+        (
+            FacultyClinicalSpecialty,
+            ClinicalSpecialtyOption,
+            "clinical_specialties",
+            True,
+        ),
+        (FacultyPartsOfMe, PartsOfMeOption, "parts_of_me", True),
+        (
+            FacultyProfessionalInterest,
+            ProfessionalInterestOption,
+            "professional_interests",
+            True,
+        ),
+    ],
+    StudentProfile: [
+        (
+            StudentHospitalAffiliation,
+            HospitalAffiliationOption,
+            "hospital_affiliations",
+            False,
+        ),
+        (StudentProfileActivity, ActivityOption, "activities", True),
+        (
+            StudentClinicalSpecialty,
+            ClinicalSpecialtyOption,
+            "clinical_specialties",
+            True,
+        ),
+        (StudentPartsOfMe, PartsOfMeOption, "parts_of_me", True),
+        (
+            StudentProfessionalInterest,
+            ProfessionalInterestOption,
+            "professional_interests",
+            True,
+        ),
+    ],
+}
 
 
 def get_verification_email_by_email(email: str) -> Optional[VerificationEmail]:
@@ -57,138 +152,515 @@ def get_profile_by_token(
     ).one_or_none()
 
 
-def _filter_query_on_degrees(degree_list: List[str], query: BaseQuery) -> BaseQuery:
-    regular_degree_filters = [
-        degree for degree in degree_list if degree not in ["dmd / dds", "md / do"]
+def get_profile_by_id(
+    profile_id: str,
+) -> Optional[Union[FacultyProfile, StudentProfile]]:
+    """
+    The faculty or student profile with `profile_id`, which are in separate
+    tables but share one id space.
+    """
+    return FacultyProfile.query.get(profile_id) or StudentProfile.query.get(profile_id)
+
+
+def searchable_tag_fields(profile_class: ProfileClass):
+    if profile_class is FacultyProfile:
+        return FACULTY_SEARCHABLE_TAG_FIELDS
+
+    return STUDENT_SEARCHABLE_TAG_FIELDS
+
+
+def search_document_expression(profile_class: ProfileClass):
+    tag_values = [
+        sql.select([func.string_agg(option_class.value, " ")])
+        .where(
+            and_(
+                relation.relation_filter(),
+                relation.profile_id == profile_class.id,
+                relation.tag_id == option_class.id,
+            )
+        )
+        .as_scalar()
+        for relation, option_class in searchable_tag_fields(profile_class)
     ]
 
-    # TODO replace this with alias tags
-    md_do_filter = (
-        [
-            func.bool_or(func.lower(DegreeOption.value) == "md")
-            | func.bool_or(func.lower(DegreeOption.value) == "do")
-        ]
-        if "md / do" in degree_list
-        else []
+    return func.to_tsvector(
+        SEARCH_CONFIGURATION,
+        func.concat_ws(
+            " ",
+            profile_class.name,
+            profile_class.additional_information,
+            profile_class.cadence,
+            *tag_values,
+        ),
     )
 
-    dmd_dds_filter = (
-        [
-            func.bool_or(func.lower(DegreeOption.value) == "dmd")
-            | func.bool_or(func.lower(DegreeOption.value) == "dds")
-        ]
-        if "dmd / dds" in degree_list
-        else []
-    )
 
-    degree_filters = (
-        [
-            func.bool_or(func.lower(DegreeOption.value) == degree)
-            for degree in regular_degree_filters
-        ]
-        + md_do_filter
-        + dmd_dds_filter
+def update_search_documents(
+    profile_class: ProfileClass, profile_ids: Optional[List[str]] = None
+) -> int:
+    """
+    Rebuild the search document and tag id arrays of the given profiles, or
+    of every profile if no ids are given. Must be called whenever a profile's
+    searchable fields or tags change; the caller is responsible for
+    committing.
+    """
+    query = profile_class.query
+
+    if profile_ids is not None:
+        query = query.filter(profile_class.id.in_(profile_ids))
+
+    return query.update(
+        {
+            profile_class.search_document: search_document_expression(profile_class),
+            **tag_ids_values(profile_class),
+        },
+        synchronize_session=False,
     )
 
-    degree_filter = reduce(operator.and_, degree_filters)
-    return (
-        query.outerjoin(FacultyProfileDegree)
-        .outerjoin(DegreeOption)
-        .group_by(FacultyProfile.id)
-        .having(degree_filter)
-    )
 
+def search_words(query: str) -> List[str]:
+    return "".join(
+        character if character.isalnum() else " " for character in query.lower()
+    ).split()
 
-def _filter_faculty_query_on_affiliations(
-    affiliation_list: List[str], query: BaseQuery
-) -> BaseQuery:
-    affiliations_filters = reduce(
-        operator.and_,
-        [
-            func.bool_or(func.lower(HospitalAffiliationOption.value) == affilation)
-            for affilation in affiliation_list
-        ],
-    )
 
-    return (
-        query.outerjoin(
-            FacultyHospitalAffiliation,
-            FacultyProfile.id == FacultyHospitalAffiliation.profile_id,
+def trigram_search_available() -> bool:
+    """
+    Is pg_trgm installed? Checked once per cache period rather than on every
+    fuzzy search.
+    """
+    cache = current_app.caches["extensions"]
+
+    installed = cache.get("pg_trgm")
+
+    if installed is None:
+        installed = db.session.execute(
+            "SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')"
+        ).scalar()
+
+        cache.set("pg_trgm", installed)
+
+    return installed
+
+
+def _has_tag_matching(
+    profile_class: ProfileClass, relation, option_class, value_filter
+):
+    return exists().where(
+        and_(
+            relation.relation_filter(),
+            relation.profile_id == profile_class.id,
+            relation.tag_id == option_class.id,
+            value_filter,
         )
-        .outerjoin(HospitalAffiliationOption)
-        .group_by(FacultyProfile.id)
-        .having(affiliations_filters)
     )
 
 
-def _filter_student_query_on_affiliations(
-    affiliation_list: List[str], query: BaseQuery
-) -> BaseQuery:
-    affiliations_filters = reduce(
-        operator.and_,
-        [
-            func.bool_or(func.lower(HospitalAffiliationOption.value) == affilation)
-            for affilation in affiliation_list
-        ],
-    )
+def _trigram_words_filter(profile_class: ProfileClass, words: List[str], match) -> list:
+    """
+    One filter per word, requiring `match` to hold for the profile's name,
+    additional information or one of its searchable tag values.
+    """
+    return [
+        or_(
+            match(profile_class.name, word),
+            match(profile_class.additional_information, word),
+            *[
+                _has_tag_matching(
+                    profile_class,
+                    relation,
+                    option_class,
+                    match(option_class.value, word),
+                )
+                for relation, option_class in searchable_tag_fields(profile_class)
+            ],
+        )
+        for word in words
+    ]
 
-    return (
-        query.outerjoin(
-            StudentHospitalAffiliation,
-            StudentProfile.id == StudentHospitalAffiliation.profile_id,
+
+def _contains_word(column, word: str):
+    # Words only contain alphanumeric characters, so they cannot inject
+    # LIKE wildcards.
+    return column.ilike(f"%{word}%")
+
+
+def _similar_to_word(column, word: str):
+    # pg_trgm's word similarity operator; the % is doubled for psycopg2's
+    # parameter format.
+    return sql.literal(word).op("<%%")(column)
+
+
+def search_relevance(profile_class: ProfileClass, words: List[str]):
+    """
+    How well a profile matches fuzzy search `words`: for each word, its best
+    trigram word similarity with the profile's name, additional information
+    or tag values, summed.
+    """
+    word_relevances = [
+        func.coalesce(
+            func.greatest(
+                func.word_similarity(word, profile_class.name),
+                func.word_similarity(word, profile_class.additional_information),
+                *[
+                    sql.select(
+                        [func.max(func.word_similarity(word, option_class.value))]
+                    )
+                    .where(
+                        and_(
+                            relation.relation_filter(),
+                            relation.profile_id == profile_class.id,
+                            relation.tag_id == option_class.id,
+                        )
+                    )
+                    .as_scalar()
+                    for relation, option_class in searchable_tag_fields(profile_class)
+                ],
+            ),
+            0,
         )
-        .outerjoin(HospitalAffiliationOption)
-        .group_by(StudentProfile.id)
-        .having(affiliations_filters)
-    )
+        for word in words
+    ]
 
+    # Double precision, so that relevances round trip through cursors exactly
+    return sql.cast(sum(word_relevances[1:], word_relevances[0]), db.Float)
 
-def _filter_student_profiles(
-    available_profiles: BaseQuery,
-    words: List[str],
-    tags: List[str],
-    affiliation_list: List[str],
-) -> BaseQuery:
-    searchable_fields = [
-        StudentProfile.name,
-        StudentProfile.additional_information,
-        StudentProfile.cadence,
+
+def _search_words_filter(
+    profile_class: ProfileClass, words: List[str], search_mode: str
+) -> list:
+    if not words:
+        return []
+
+    if search_mode == "substring":
+        return _trigram_words_filter(profile_class, words, _contains_word)
+
+    if search_mode == "fuzzy":
+        return _trigram_words_filter(profile_class, words, _similar_to_word)
+
+    # Words only contain alphanumeric characters, so they cannot inject
+    # tsquery operators.
+    prefix_query = " & ".join(f"{word}:*" for word in words)
+
+    return [
+        profile_class.search_document.op("@@")(
+            func.to_tsquery(SEARCH_CONFIGURATION, prefix_query)
+        )
     ]
 
-    tag_fields = [
-        (StudentClinicalSpecialty, ClinicalSpecialtyOption),
-        (StudentProfessionalInterest, ProfessionalInterestOption),
-        (StudentPartsOfMe, PartsOfMeOption),
-        (StudentProfileActivity, ActivityOption),
+
+# TODO replace this with alias tags
+DEGREE_ALIASES = {"md / do": ["md", "do"], "dmd / dds": ["dmd", "dds"]}
+
+SEARCHABLE_OPTION_CLASSES: List[OptionClass] = [
+    ActivityOption,
+    ClinicalSpecialtyOption,
+    DegreeOption,
+    HospitalAffiliationOption,
+    PartsOfMeOption,
+    ProfessionalInterestOption,
+]
+
+# When a requested value is missing from the cached option ids, reload them
+# (at most this often) in case the option was created by another process.
+OPTION_ID_MISS_RELOAD_SECONDS = 5
+
+OptionIds = Dict[OptionClass, Dict[str, Set[int]]]
+
+# Options whose values serialized profiles are resolved from by id
+SERIALIZED_OPTION_CLASSES: List[OptionClass] = [
+    *SEARCHABLE_OPTION_CLASSES,
+    StudentProgramOption,
+    StudentYearOption,
+    StudentPCESiteOption,
+]
+
+OptionValues = Dict[OptionClass, Dict[int, str]]
+
+
+def _load_option_ids() -> OptionIds:
+    option_classes = {
+        option_class.__tablename__: option_class
+        for option_class in SEARCHABLE_OPTION_CLASSES
+    }
+
+    queries = [
+        db.session.query(
+            sql.expression.literal(name).label("option_type"),
+            func.lower(option_class.value).label("value"),
+            option_class.id.label("id"),
+        )
+        for name, option_class in option_classes.items()
     ]
 
-    query = available_profiles
+    option_ids: OptionIds = {
+        option_class: defaultdict(set) for option_class in SEARCHABLE_OPTION_CLASSES
+    }
 
-    for relation, option_class in tag_fields:
-        query = query.outerjoin(relation).outerjoin(option_class)
+    for option_type, value, option_id in queries[0].union_all(*queries[1:]):
+        option_ids[option_classes[option_type]][value].add(option_id)
 
-    search_filters = [
-        or_(
-            *[func.lower(field).contains(word) for field in searchable_fields]
-            + [
-                func.lower(option_class.value).contains(word)
-                for _, option_class in tag_fields
+    return {option_class: dict(values) for option_class, values in option_ids.items()}
+
+
+def get_option_ids(values: Set[str]) -> OptionIds:
+    """
+    Map each searchable option class to its lowercased values and their ids.
+
+    The map is cached per process, so tag filters can be resolved to ids
+    without querying the option tables.
+    """
+    cache = current_app.caches["option_ids"]
+
+    cached = cache.get("option_ids")
+
+    if cached is not None:
+        loaded_at, known_values, option_ids = cached
+
+        recently_loaded = time.monotonic() - loaded_at < OPTION_ID_MISS_RELOAD_SECONDS
+
+        if values <= known_values or recently_loaded:
+            return option_ids
+
+    option_ids = _load_option_ids()
+
+    known_values = set().union(*option_ids.values())
+
+    cache.set("option_ids", (time.monotonic(), known_values, option_ids))
+
+    return option_ids
+
+
+def _load_option_values() -> OptionValues:
+    queries = [
+        db.session.query(
+            sql.expression.literal(option_class.__tablename__).label("option_type"),
+            option_class.id,
+            option_class.value,
+        )
+        for option_class in SERIALIZED_OPTION_CLASSES
+    ]
+
+    option_classes = {
+        option_class.__tablename__: option_class
+        for option_class in SERIALIZED_OPTION_CLASSES
+    }
+
+    option_values: OptionValues = {
+        option_class: {} for option_class in SERIALIZED_OPTION_CLASSES
+    }
+
+    for option_type, option_id, value in queries[0].union_all(*queries[1:]):
+        option_values[option_classes[option_type]][option_id] = value
+
+    return option_values
+
+
+def latest_profile_version() -> int:
+    return (
+        db.session.query(
+            func.greatest(
+                *[
+                    db.session.query(func.max(profile_class.version)).as_scalar()
+                    for profile_class in PROFILE_MODELS
+                ]
+            )
+        ).scalar()
+        or 0
+    )
+
+
+def get_option_values(
+    option_ids: Dict[OptionClass, Set[int]], profile_version: int
+) -> OptionValues:
+    """
+    Map each option class to the values of its options by id, for
+    serializing profiles from their tag id arrays.
+
+    The map is cached per process like the option ids. It is reloaded when
+    one of `option_ids` is missing, since options are created by profile
+    saves in other processes; ids still missing afterwards belong to deleted
+    options. Renaming an option bumps the version of the profiles that have
+    it, so the map is also reloaded for profiles newer than it,
+    `profile_version` being the latest version of the profiles serialized.
+    """
+    cache = current_app.caches["option_ids"]
+
+    cached = cache.get("option_values")
+
+    if cached is not None:
+        loaded_version, option_values = cached
+
+        if profile_version <= loaded_version and all(
+            ids <= option_values[option_class].keys()
+            for option_class, ids in option_ids.items()
+        ):
+            return option_values
+
+    # Read before the values, so that no rename is newer than the version
+    loaded_version = latest_profile_version()
+
+    option_values = _load_option_values()
+
+    cache.set("option_values", (loaded_version, option_values))
+
+    return option_values
+
+
+def update_option_profiles(option_class: OptionClass, option_id: int) -> int:
+    """
+    Rebuild the search documents of every profile that has the option, after
+    it is renamed. Their versions are bumped along with them, so processes
+    that have the option's old value cached serialize them again. Returns how
+    many profiles were updated; the caller is responsible for committing.
+    """
+    updated = 0
+
+    for profile_class, relations in PROFILE_TAG_RELATIONS.items():
+        has_option = [
+            getattr(profile_class, relation.tag_ids_column).contains([option_id])
+            for relation in relations
+            if relation.option_class is option_class
+        ]
+
+        if profile_class is StudentProfile:
+            has_option += [
+                column == option_id
+                for column, column_option_class in [
+                    (StudentProfile.program_id, StudentProgramOption),
+                    (StudentProfile.current_year_id, StudentYearOption),
+                    (StudentProfile.pce_site_id, StudentPCESiteOption),
+                ]
+                if column_option_class is option_class
             ]
+
+        if has_option:
+            profile_ids = [
+                profile_id
+                for (profile_id,) in db.session.query(profile_class.id).filter(
+                    or_(*has_option)
+                )
+            ]
+
+            updated += update_search_documents(profile_class, profile_ids)
+
+    return updated
+
+
+# For each tag a profile is required to have, the ids that count as that tag
+# in each relation: a value can be an option of more than one kind of tag, or
+# of several options that differ in case.
+RequiredTag = Dict[Type[ProfileTag], Set[int]]
+
+
+def _tag_id_filters(
+    profile_class: ProfileClass, required_tags: List[RequiredTag]
+) -> list:
+    """
+    Predicates on the profile's tag id arrays that it has every one of
+    `required_tags`. Tags that are a single id of a single relation, which
+    is almost all of them, are combined into one containment test (@>) per
+    array; the others test whether any of their arrays overlap (&&) their
+    ids. Both are answered by the arrays' GIN indexes, without joins.
+    """
+    contained_ids: Dict[str, Set[int]] = defaultdict(set)
+
+    overlap_filters = []
+
+    for required_tag in required_tags:
+        relation_tag_ids = {
+            relation: tag_ids for relation, tag_ids in required_tag.items() if tag_ids
+        }
+
+        if not relation_tag_ids:
+            return [sql.false()]
+
+        if len(relation_tag_ids) == 1:
+            [(relation, tag_ids)] = relation_tag_ids.items()
+
+            if len(tag_ids) == 1:
+                contained_ids[relation.tag_ids_column].update(tag_ids)
+                continue
+
+        overlap_filters.append(
+            or_(
+                *[
+                    getattr(profile_class, relation.tag_ids_column).overlap(
+                        sorted(tag_ids)
+                    )
+                    for relation, tag_ids in relation_tag_ids.items()
+                ]
+            )
         )
-        for word in words
+
+    return [
+        *[
+            getattr(profile_class, column).contains(sorted(tag_ids))
+            for column, tag_ids in contained_ids.items()
+        ],
+        *overlap_filters,
     ]
 
-    tag_filters = [
-        or_(func.lower(option_class.value) == tag for _, option_class in tag_fields)
+
+def _required_tags(
+    profile_class: ProfileClass, tags: List[str], option_ids: OptionIds
+) -> List[RequiredTag]:
+    return [
+        {
+            relation: option_ids[option_class].get(tag, set())
+            for relation, option_class in searchable_tag_fields(profile_class)
+        }
         for tag in tags
     ]
 
-    query = query.filter(*search_filters, *tag_filters)
 
-    if affiliation_list:
-        query = _filter_student_query_on_affiliations(affiliation_list, query)
+def _expand_degrees(degree_list: List[str]) -> List[List[str]]:
+    return [DEGREE_ALIASES.get(degree, [degree]) for degree in degree_list]
+
+
+def _required_degrees(
+    degree_list: List[str], option_ids: OptionIds
+) -> List[RequiredTag]:
+    return [
+        {
+            FacultyProfileDegree: set().union(
+                *[option_ids[DegreeOption].get(degree, set()) for degree in degrees]
+            )
+        }
+        for degrees in _expand_degrees(degree_list)
+    ]
+
+
+def _required_affiliations(
+    relation, affiliation_list: List[str], option_ids: OptionIds
+) -> List[RequiredTag]:
+    return [
+        {relation: option_ids[HospitalAffiliationOption].get(affiliation, set())}
+        for affiliation in affiliation_list
+    ]
 
-    return query
+
+def _filter_student_profiles(
+    available_profiles: BaseQuery,
+    words: List[str],
+    tags: List[str],
+    affiliation_list: List[str],
+    search_mode: str,
+) -> BaseQuery:
+    search_filters = _search_words_filter(StudentProfile, words, search_mode)
+
+    option_ids = get_option_ids({*tags, *affiliation_list})
+
+    required_tags = [
+        *_required_tags(StudentProfile, tags, option_ids),
+        *_required_affiliations(
+            StudentHospitalAffiliation, affiliation_list, option_ids
+        ),
+    ]
+
+    return available_profiles.filter(
+        *search_filters, *_tag_id_filters(StudentProfile, required_tags)
+    )
 
 
 def _filter_faculty_profiles(
@@ -197,53 +669,96 @@ def _filter_faculty_profiles(
     tags: List[str],
     degree_list: List[str],
     affiliation_list: List[str],
+    search_mode: str,
 ) -> BaseQuery:
-    searchable_fields = [
-        FacultyProfile.name,
-        FacultyProfile.additional_information,
-        FacultyProfile.cadence,
+    search_filters = _search_words_filter(FacultyProfile, words, search_mode)
+
+    degree_values = [
+        degree for degrees in _expand_degrees(degree_list) for degree in degrees
     ]
 
-    tag_fields = [
-        (FacultyClinicalSpecialty, ClinicalSpecialtyOption),
-        (FacultyProfessionalInterest, ProfessionalInterestOption),
-        (FacultyPartsOfMe, PartsOfMeOption),
-        (FacultyProfileActivity, ActivityOption),
+    option_ids = get_option_ids({*tags, *degree_values, *affiliation_list})
+
+    # TODO affiliation_list could be changed to be a single value.
+    # Mentees are unlikely to be looking for a mentor affiliated with more than
+    # 1 specific institution.
+    required_tags = [
+        *_required_tags(FacultyProfile, tags, option_ids),
+        *_required_degrees(degree_list, option_ids),
+        *_required_affiliations(
+            FacultyHospitalAffiliation, affiliation_list, option_ids
+        ),
     ]
 
-    search_filters = [
-        or_(
-            *[func.lower(field).contains(word) for field in searchable_fields]
-            + [
-                func.lower(option_class.value).contains(word)
-                for _, option_class in tag_fields
-            ]
-        )
-        for word in words
+    return available_profiles.filter(
+        *search_filters, *_tag_id_filters(FacultyProfile, required_tags)
+    )
+
+
+def profile_load_options(profile_class: ProfileClass):
+    """
+    Loader options that fetch every relation serialized with a profile in one
+    query per relation for a whole page, rather than lazily per profile.
+    """
+    tag_relationships = [
+        profile_class.affiliations,
+        profile_class.clinical_specialties,
+        profile_class.professional_interests,
+        profile_class.parts_of_me,
+        profile_class.activities,
     ]
 
-    tag_filters = [
-        or_(func.lower(option_class.value) == tag for _, option_class in tag_fields)
-        for tag in tags
+    option_relationships = []
+
+    if profile_class is FacultyProfile:
+        tag_relationships.append(FacultyProfile.degrees)
+    else:
+        option_relationships = [
+            StudentProfile.program,
+            StudentProfile.current_year,
+            StudentProfile.pce_site,
+        ]
+
+    return [
+        *[
+            selectinload(relationship).joinedload("tag")
+            for relationship in tag_relationships
+        ],
+        *[selectinload(relationship) for relationship in option_relationships],
     ]
 
-    query = available_profiles
 
-    for relation, option_class in tag_fields:
-        query = query.outerjoin(relation).outerjoin(option_class)
+def load_profile(profile_class: ProfileClass, profile_id: str) -> BaseProfile:
+    """
+    Reload a profile with everything its schema serializes, rather than
+    lazy loading each relationship and tag while it is dumped.
+    """
+    return (
+        profile_class.query.filter(profile_class.id == profile_id)
+        .options(*profile_load_options(profile_class))
+        .populate_existing()
+        .one()
+    )
 
-    query = query.filter(*search_filters, *tag_filters)
 
-    if degree_list:
-        query = _filter_query_on_degrees(degree_list, query)
+def profile_starred(profile_class: ProfileClass, verification_email_id: int):
+    """
+    Whether the viewer starred the profile, tested against the viewer's cached
+    stars so that profiles don't have to be joined with and grouped by them.
+    The stars are read when the query is executed.
+    """
 
-    # TODO affiliation_list could be changed to be a single value.
-    # Mentees are unlikely to be looking for a mentor affiliated with more than
-    # 1 specific institution.
-    if affiliation_list:
-        query = _filter_faculty_query_on_affiliations(affiliation_list, query)
+    def starred_email_ids():
+        return sorted(load_starred_email_ids(verification_email_id))
 
-    return query
+    return profile_class.verification_email_id == any_(
+        sql.bindparam(
+            "starred_email_ids",
+            callable_=starred_email_ids,
+            type_=ARRAY(db.Integer),
+            unique=True,
+        )
+    )
 
 
 def query_faculty_profiles_and_stars(verification_email_id: int):
@@ -255,81 +770,85 @@ def query_student_profiles_and_stars(verification_email_id: int):
 
 
 def query_profiles_and_stars(
-    verification_email_id: int, profile_class: Type[BaseProfile]
+    verification_email_id: int, profile_class: ProfileClass
 ) -> BaseQuery:
-    return (
-        db.session.query(
-            profile_class,
-            func.count(ProfileStar.from_verification_email_id).label(
-                "profile_star_count"
-            ),
-        )
-        .filter(
-            or_(
-                profile_class.available_for_mentoring,
-                profile_class.verification_email_id == verification_email_id,
-            )
-        )
-        .outerjoin(
-            ProfileStar,
-            and_(
-                ProfileStar.from_verification_email_id == verification_email_id,
-                profile_class.verification_email_id
-                == ProfileStar.to_verification_email_id,
-            ),
+    return db.session.query(
+        profile_class,
+        profile_starred(profile_class, verification_email_id).label("profile_starred"),
+    ).filter(
+        or_(
+            profile_class.available_for_mentoring,
+            profile_class.verification_email_id == verification_email_id,
         )
-        .group_by(profile_class.id)
     )
 
 
 def matching_student_profiles(
-    query: str, tags: str, affiliations: str, verification_email_id: int,
+    query: str,
+    tags: str,
+    affiliations: str,
+    verification_email_id: int,
+    search_mode: str = "prefix",
 ) -> BaseQuery:
     profiles_and_stars = query_student_profiles_and_stars(verification_email_id)
 
-    words = "".join(
-        character if character.isalnum() else " " for character in query.lower()
-    ).split()
+    words = search_words(query)
 
     tag_list = tags.lower().split(",") if tags else []
     affiliation_list = affiliations.lower().split(",") if affiliations else []
 
     filtered_profiles = _filter_student_profiles(
-        profiles_and_stars, words, tag_list, affiliation_list,
+        profiles_and_stars, words, tag_list, affiliation_list, search_mode
     )
 
     return filtered_profiles
 
 
 def matching_faculty_profiles(
-    query: str, tags: str, degrees: str, affiliations: str, verification_email_id: int,
+    query: str,
+    tags: str,
+    degrees: str,
+    affiliations: str,
+    verification_email_id: int,
+    search_mode: str = "prefix",
 ) -> BaseQuery:
     profiles_and_stars = query_faculty_profiles_and_stars(verification_email_id)
 
-    words = "".join(
-        character if character.isalnum() else " " for character in query.lower()
-    ).split()
+    words = search_words(query)
 
     tag_list = tags.lower().split(",") if tags else []
     degree_list = degrees.lower().split(",") if degrees else []
     affiliation_list = affiliations.lower().split(",") if affiliations else []
 
     filtered_profiles = _filter_faculty_profiles(
-        profiles_and_stars, words, tag_list, degree_list, affiliation_list,
+        profiles_and_stars, words, tag_list, degree_list, affiliation_list, search_mode
     )
 
     return filtered_profiles
 
 
-def add_stars_to_profiles(profiles_and_stars):
-    # TODO do this without mutating profile
-    available_profiles = []
+def explain(query: BaseQuery, options: str = "FORMAT JSON"):
+    """
+    Run EXPLAIN with `options` on a query and return the plan.
+    """
+    statement = query.statement
+    compiled = statement.compile(dialect=db.engine.dialect)
 
-    for profile, star_count in profiles_and_stars:
-        profile.starred = star_count > 0
-        available_profiles.append(profile)
+    return (
+        db.session.connection()
+        .execute(f"EXPLAIN ({options}) {compiled}", compiled.params)
+        .fetchall()
+    )
+
+
+def estimate_count(query: BaseQuery) -> int:
+    """
+    The planner's estimate of how many rows `query` returns. Much cheaper than
+    running the query, but only as accurate as the table statistics.
+    """
+    [(plan,)] = explain(query)
 
-    return available_profiles
+    return int(plan[0]["Plan"]["Plan Rows"])
 
 
 def query_value_with_option_type_label(query, tag_class, name):
@@ -339,65 +858,10 @@ def query_value_with_option_type_label(query, tag_class, name):
     )
 
 
-def query_tag_related_to_active_profile(
-    tag_class, profile_relation_class, name, profile_class
-):
-    query = (
-        tag_class.query.join(
-            profile_relation_class, tag_class.id == profile_relation_class.tag_id
-        )
-        .outerjoin(
-            FacultyProfile, profile_relation_class.profile_id == FacultyProfile.id,
-        )
-        .outerjoin(
-            StudentProfile, profile_relation_class.profile_id == StudentProfile.id,
-        )
-        .filter(profile_class.available_for_mentoring.is_(True))
-    )
-
-    return query_value_with_option_type_label(query, tag_class, name)
-
-
 def union_queries(queries):
     return queries[0].union(*queries[1:])
 
 
-def query_tags_with_active_profiles(
-    config_tag_classes, public_tag_classes, profile_class
-):
-    config_tag_queries = [
-        query_tag_related_to_active_profile(
-            tag_class, profile_relation_class, name, profile_class
-        )
-        for tag_class, profile_relation_class, name in config_tag_classes
-    ]
-
-    public_tag_queries = [
-        query_tag_related_to_active_profile(
-            tag_class, profile_relation_class, name, profile_class,
-        ).filter(tag_class.public.is_(True))
-        for tag_class, profile_relation_class, name in public_tag_classes
-    ]
-
-    queries = config_tag_queries + public_tag_queries
-
-    select = union_queries(queries)
-
-    cte = select.cte("tags")
-
-    result = db.session.query(
-        cte.columns.option_type, func.array_agg(cte.columns.value)
-    ).group_by(cte.columns.option_type)
-
-    # Need to default to empty list for each tag type, since tags with no
-    # searchable values will not be in the result
-    empty_values = {
-        name: [] for _, _, name in [*config_tag_classes, *public_tag_classes]
-    }
-
-    return {**empty_values, **dict(result)}
-
-
 def query_profile_tag_classes(config_tag_classes, public_tag_classes):
     config_tag_queries = [
         query_value_with_option_type_label(tag_class.query, tag_class, name)
@@ -446,52 +910,37 @@ def query_profile_tags():
     return query_profile_tag_classes(config_tag_classes, public_tag_classes)
 
 
-def query_faculty_searchable_tags():
-    config_tag_classes = [
-        (
-            HospitalAffiliationOption,
-            FacultyHospitalAffiliation,
-            "hospital_affiliations",
-        ),
-        (DegreeOption, FacultyProfileDegree, "degrees"),
-    ]
+def get_catalog_version(catalog_name: str) -> int:
+    version = (
+        db.session.query(CatalogVersion.version)
+        .filter(CatalogVersion.name == catalog_name)
+        .scalar()
+    )
+
+    return version or 0
 
-    public_tag_classes = [
-        (ActivityOption, FacultyProfileActivity, "activities"),
-        (ClinicalSpecialtyOption, FacultyClinicalSpecialty, "clinical_specialties"),
-        (PartsOfMeOption, FacultyPartsOfMe, "parts_of_me"),
-        (
-            ProfessionalInterestOption,
-            FacultyProfessionalInterest,
-            "professional_interests",
-        ),
-    ]
 
-    return query_tags_with_active_profiles(
-        config_tag_classes, public_tag_classes, profile_class=FacultyProfile
+def query_searchable_tags(profile_class: ProfileClass) -> Dict[str, List[str]]:
+    rows = (
+        db.session.query(SearchableTag.option_type, SearchableTag.value)
+        .filter(SearchableTag.profile_type == profile_class.__tablename__)
+        .order_by(SearchableTag.option_type, SearchableTag.value)
     )
 
+    # Default to an empty list for tag types that have no searchable values
+    tags: Dict[str, List[str]] = {
+        name: [] for _, _, name, _ in SEARCH_FILTER_TAGS[profile_class]
+    }
 
-def query_student_searchable_tags():
-    config_tag_classes = [
-        (
-            HospitalAffiliationOption,
-            StudentHospitalAffiliation,
-            "hospital_affiliations",
-        ),
-    ]
+    for option_type, value in rows:
+        tags[option_type].append(value)
 
-    public_tag_classes = [
-        (ActivityOption, StudentProfileActivity, "activities"),
-        (ClinicalSpecialtyOption, StudentClinicalSpecialty, "clinical_specialties"),
-        (PartsOfMeOption, StudentPartsOfMe, "parts_of_me"),
-        (
-            ProfessionalInterestOption,
-            StudentProfessionalInterest,
-            "professional_interests",
-        ),
-    ]
+    return tags
 
-    return query_tags_with_active_profiles(
-        config_tag_classes, public_tag_classes, profile_class=StudentProfile
-    )
+
+def query_faculty_searchable_tags():
+    return query_searchable_tags(FacultyProfile)
+
+
+def query_student_searchable_tags():
+    return query_searchable_tags(StudentProfile)
@@ -0,0 +1,205 @@
+"""
+Statistics of the SQL statements each request runs: how many, how long they
+took in total and which was slowest. They are logged after every request
+that queries the database, and sent as a `Server-Timing` header in debug
+mode so they show up in the browser's network panel.
+
+Statements slower than SLOW_QUERY_MS are logged with their parameters and
+route. A sample of the slow SELECTs (SLOW_QUERY_EXPLAIN_RATE) is run again
+under EXPLAIN (ANALYZE, BUFFERS) in a background thread, and the plan is
+logged too, since slow searches usually depend on the terms searched for.
+"""
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Iterator, List, Optional
+
+from flask import current_app, g, has_app_context, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from structlog import get_logger
+
+from .models import db
+
+
+log = get_logger()
+
+# Logged statements are cut to this many characters
+MAX_LOGGED_STATEMENT_LENGTH = 500
+
+# Slow statements waiting to be explained beyond this many are not explained
+MAX_PENDING_EXPLAINS = 10
+
+# Explaining a statement runs it again, so give up on very slow ones
+EXPLAIN_TIMEOUT_MS = 30000
+
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.total_seconds = 0.0
+        self.slowest_seconds = 0.0
+        self.slowest_statement: Optional[str] = None
+
+    def record(self, statement: str, seconds: float) -> None:
+        self.count += 1
+        self.total_seconds += seconds
+
+        if seconds >= self.slowest_seconds:
+            self.slowest_seconds = seconds
+            self.slowest_statement = statement
+
+    def log_fields(self) -> dict:
+        return {
+            "query_count": self.count,
+            "db_ms": round(self.total_seconds * 1000, 2),
+            "slowest_query_ms": round(self.slowest_seconds * 1000, 2),
+            "slowest_query": (self.slowest_statement or "")[
+                :MAX_LOGGED_STATEMENT_LENGTH
+            ],
+        }
+
+    def server_timing(self) -> str:
+        return (
+            f'db;dur={self.total_seconds * 1000:.2f};desc="{self.count} queries",'
+            f" db-slowest;dur={self.slowest_seconds * 1000:.2f}"
+        )
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def start_statement_timer(connection, cursor, statement, parameters, context, many):
+    connection.info.setdefault("statement_start_times", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def record_statement_time(connection, cursor, statement, parameters, context, many):
+    seconds = time.perf_counter() - connection.info["statement_start_times"].pop()
+
+    if not has_app_context():
+        return
+
+    if "query_stats" in g:
+        g.query_stats.record(statement, seconds)
+
+    slow_query_ms = current_app.config.get("SLOW_QUERY_MS")
+
+    if slow_query_ms and seconds * 1000 >= slow_query_ms and not many:
+        log_slow_statement(statement, parameters, seconds)
+
+
+def explain_statement(connection, statement: str, parameters) -> str:
+    """
+    The EXPLAIN (ANALYZE, BUFFERS) plan of `statement`, run in a read-only
+    transaction that is rolled back.
+    """
+    transaction = connection.begin()
+
+    try:
+        connection.execute("SET TRANSACTION READ ONLY")
+        connection.execute(f"SET LOCAL statement_timeout = {EXPLAIN_TIMEOUT_MS}")
+
+        rows = connection.execute(
+            f"EXPLAIN (ANALYZE, BUFFERS) {statement}", parameters
+        ).fetchall()
+    finally:
+        transaction.rollback()
+
+    return "\n".join(line for line, in rows)
+
+
+def _explain_in_background(app, statement: str, parameters, fields: dict):
+    try:
+        with app.app_context():
+            with db.engine.connect() as connection:
+                plan = explain_statement(connection, statement, parameters)
+
+        log.warning("Slow query plan", plan=plan, **fields)
+    except Exception as e:
+        log.warning("Could not explain slow query", error=str(e), **fields)
+    finally:
+        app.pending_explains.release()
+
+
+def log_slow_statement(statement: str, parameters, seconds: float) -> None:
+    # The plans of slow statements are themselves slow statements
+    if statement.lstrip().upper().startswith(("EXPLAIN", "SET")):
+        return
+
+    fields = {
+        "duration_ms": round(seconds * 1000, 2),
+        "statement": statement,
+        "parameters": repr(parameters),
+        "route": request.endpoint if has_request_context() else None,
+        "path": request.path if has_request_context() else None,
+    }
+
+    log.warning("Slow query", **fields)
+
+    app = current_app._get_current_object()
+
+    is_select = statement.lstrip().upper().startswith(("SELECT", "WITH"))
+
+    if (
+        is_select
+        and random.random() < app.config.get("SLOW_QUERY_EXPLAIN_RATE", 0)
+        and app.pending_explains.acquire(blocking=False)
+    ):
+        app.slow_query_executor.submit(
+            _explain_in_background, app, statement, parameters, fields
+        )
+
+
+def start_request_stats():
+    g.query_stats = QueryStats()
+
+
+def report_request_stats(response):
+    stats = g.pop("query_stats", None)
+
+    if stats is None or not stats.count:
+        return response
+
+    log.info(
+        "Request queries",
+        method=request.method,
+        path=request.path,
+        status=response.status_code,
+        **stats.log_fields(),
+    )
+
+    if current_app.debug:
+        response.headers.add("Server-Timing", stats.server_timing())
+
+    return response
+
+
+def init_query_stats(app):
+    app.before_request(start_request_stats)
+    app.after_request(report_request_stats)
+
+    app.slow_query_executor = ThreadPoolExecutor(
+        max_workers=1, thread_name_prefix="explain"
+    )
+    app.pending_explains = threading.BoundedSemaphore(MAX_PENDING_EXPLAINS)
+
+
+@contextmanager
+def record_statements() -> Iterator[List[tuple]]:
+    """
+    Collect the (statement, parameters) of every query run in the block.
+    """
+    statements: List[tuple] = []
+
+    def before_cursor_execute(
+        connection, cursor, statement, parameters, context, executemany
+    ):
+        statements.append((statement, parameters))
+
+    event.listen(db.engine, "before_cursor_execute", before_cursor_execute)
+
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, "before_cursor_execute", before_cursor_execute)
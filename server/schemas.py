@@ -106,4 +106,22 @@ faculty_profiles_schema = FacultyProfileSchema(many=True)
 student_profile_schema = StudentProfileSchema()
 student_profiles_schema = StudentProfileSchema(many=True)
 
+# Serialized profiles are cached and shared between viewers, so they leave out
+# the viewer's `starred` flag. Their tags and options are serialized from the
+# profiles' id columns, see `views.api.utils.dump_option_fields`.
+TAG_FIELDS = [
+    "affiliations",
+    "clinical_specialties",
+    "professional_interests",
+    "parts_of_me",
+    "activities",
+]
+
+faculty_profile_fragment_schema = FacultyProfileSchema(
+    exclude=["starred", *TAG_FIELDS, "degrees"]
+)
+student_profile_fragment_schema = StudentProfileSchema(
+    exclude=["starred", *TAG_FIELDS, "program", "current_year", "pce_site"]
+)
+
 valid_email_schema = ValidEmailSchema()
@@ -0,0 +1,297 @@
+"""
+Maintains the `SearchableTag` catalog behind the search filter endpoints.
+
+Rather than recomputing which tags have available profiles on every request,
+the catalog is refreshed for just the tags a flush touches: tags added to or
+removed from profiles, tags of profiles whose availability changed, and
+options that were renamed or made public or private.
+
+Each tag catalog also has a version in `CatalogVersion`, bumped whenever the
+values it serves change, which the tag endpoints use as their ETag.
+
+Transactions that refresh the same tag take turns, see `lock_stale_tags`.
+"""
+import zlib
+from collections import defaultdict
+from itertools import chain
+from typing import Dict, Iterable, List, Mapping, Optional, Set, Tuple, Type, Union
+
+from sqlalchemy import and_, event, func, sql
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import get_history
+
+from .models import (
+    BaseProfile,
+    CatalogVersion,
+    FacultyProfile,
+    OptionClass,
+    ProfileClass,
+    ProfileTag,
+    SearchableTag,
+    StudentProfile,
+    TagValueMixin,
+    UserEditableTagMixin,
+    db,
+)
+from .queries import SEARCH_FILTER_TAGS
+
+
+# Relation class -> (profile class, option class, tag type, public only)
+SEARCH_FILTER_RELATIONS: Dict[
+    Type[ProfileTag], Tuple[ProfileClass, OptionClass, str, bool]
+] = {
+    relation: (profile_class, option_class, name, public_only)
+    for profile_class, fields in SEARCH_FILTER_TAGS.items()
+    for relation, option_class, name, public_only in fields
+}
+
+# Tag ids to refresh by relation; None refreshes every tag of the relation
+StaleTags = Mapping[Type[ProfileTag], Optional[Set[int]]]
+
+# Stale tags collected from a flush
+FlushedTags = Dict[Type[ProfileTag], Set[int]]
+
+# The catalog of all options, served by /api/profile-tags
+PROFILE_TAGS_CATALOG = "profile_tags"
+
+
+def search_tags_catalog(profile_class: ProfileClass) -> str:
+    return f"{profile_class.__tablename__}_search_tags"
+
+
+def bump_catalog_version(connection, catalog_name: str) -> None:
+    statement = insert(CatalogVersion.__table__).values(name=catalog_name, version=1)
+
+    connection.execute(
+        statement.on_conflict_do_update(
+            index_elements=[CatalogVersion.name],
+            set_={"version": CatalogVersion.version + 1},
+        )
+    )
+
+
+def refresh_searchable_tags(
+    connection, relation: Type[ProfileTag], tag_ids: Optional[Iterable[int]]
+) -> bool:
+    """
+    Recompute the catalog rows of `relation` for `tag_ids`, or for every tag
+    if `tag_ids` is None. Returns whether the served tag values changed.
+    """
+    profile_class, option_class, name, public_only = SEARCH_FILTER_RELATIONS[relation]
+
+    catalog = SearchableTag.__table__
+
+    row_filter = and_(
+        catalog.c.profile_type == profile_class.__tablename__,
+        catalog.c.option_type == name,
+    )
+
+    criteria = [
+        relation.relation_filter(),
+        profile_class.available_for_mentoring.is_(True),
+    ]
+
+    if public_only:
+        criteria.append(option_class.public.is_(True))
+
+    if tag_ids is not None:
+        sorted_tag_ids = sorted(tag_ids)
+
+        if not sorted_tag_ids:
+            return False
+
+        row_filter = and_(row_filter, catalog.c.tag_id.in_(sorted_tag_ids))
+        criteria.append(option_class.id.in_(sorted_tag_ids))
+
+    rows = (
+        sql.select(
+            [
+                sql.literal(profile_class.__tablename__),
+                sql.literal(name),
+                option_class.id,
+                option_class.value,
+                func.count(func.distinct(relation.profile_id)),
+            ]
+        )
+        .select_from(
+            option_class.__table__.join(
+                relation.__table__, relation.tag_id == option_class.id
+            ).join(profile_class.__table__, relation.profile_id == profile_class.id)
+        )
+        .where(and_(*criteria))
+        .group_by(option_class.id, option_class.value)
+    )
+
+    deleted = connection.execute(
+        catalog.delete().where(row_filter).returning(catalog.c.tag_id, catalog.c.value)
+    )
+    deleted_values = {tuple(row) for row in deleted}
+
+    inserted = connection.execute(
+        catalog.insert()
+        .from_select(
+            ["profile_type", "option_type", "tag_id", "value", "profile_count"], rows
+        )
+        .returning(catalog.c.tag_id, catalog.c.value)
+    )
+
+    # Only the values are served, so a change in profile counts alone doesn't
+    # change the catalog's version
+    return {tuple(row) for row in inserted} != deleted_values
+
+
+def rebuild_searchable_tags() -> None:
+    connection = db.session.connection()
+
+    # Rather than locking every tag, wait for the transactions refreshing
+    # tags and keep new ones from starting until the rebuild is committed
+    connection.execute(
+        f"LOCK TABLE {SearchableTag.__tablename__} IN SHARE ROW EXCLUSIVE MODE"
+    )
+
+    refresh_stale_tags(
+        connection, {relation: None for relation in SEARCH_FILTER_RELATIONS}
+    )
+
+
+def _relation_lock_key(relation: Type[ProfileTag]) -> int:
+    """
+    A key for the catalog rows of `relation` that is the same in every
+    process, as a signed 32 bit integer.
+    """
+    profile_class, _, name, _ = SEARCH_FILTER_RELATIONS[relation]
+
+    key = zlib.crc32(f"searchable_tag:{profile_class.__tablename__}:{name}".encode())
+
+    return key - (1 << 32) if key >= (1 << 31) else key
+
+
+def lock_stale_tags(connection, stale_tags: StaleTags) -> None:
+    """
+    Take a transaction level advisory lock on each of `stale_tags`, so that
+    a transaction refreshing a tag waits for any other refreshing it to
+    commit. It then recomputes the tag's row with the other's changes
+    visible, rather than both replacing the row and the second failing on
+    the primary key or leaving a stale row.
+
+    Locks are taken in the same order by every transaction, so that two
+    refreshing the same tags don't deadlock.
+    """
+    locks: List[Tuple[int, int]] = sorted(
+        (_relation_lock_key(relation), tag_id)
+        for relation, tag_ids in stale_tags.items()
+        if tag_ids is not None
+        for tag_id in tag_ids
+    )
+
+    if not locks:
+        return
+
+    lock_keys, tag_ids = zip(*locks)
+
+    connection.execute(
+        sql.text(
+            "SELECT pg_advisory_xact_lock(lock_key, tag_id)"
+            " FROM unnest(:lock_keys, :tag_ids) AS lock (lock_key, tag_id)"
+        ),
+        lock_keys=list(lock_keys),
+        tag_ids=list(tag_ids),
+    )
+
+
+def refresh_stale_tags(connection, stale_tags: StaleTags) -> None:
+    lock_stale_tags(connection, stale_tags)
+
+    changed_profile_classes = set()
+
+    for relation, tag_ids in stale_tags.items():
+        if refresh_searchable_tags(connection, relation, tag_ids):
+            profile_class, *_ = SEARCH_FILTER_RELATIONS[relation]
+
+            changed_profile_classes.add(profile_class)
+
+    for profile_class in changed_profile_classes:
+        bump_catalog_version(connection, search_tags_catalog(profile_class))
+
+
+def _changed(instance, attribute: str) -> bool:
+    return get_history(instance, attribute).has_changes()
+
+
+def _profile_tag_ids(
+    connection, profile: Union[FacultyProfile, StudentProfile], stale_tags: FlushedTags
+):
+    relations = {
+        relation.option_class.__tablename__: relation
+        for relation, (profile_class, *_) in SEARCH_FILTER_RELATIONS.items()
+        if isinstance(profile, profile_class)
+    }
+
+    tags = connection.execute(
+        sql.select([ProfileTag.tag_type, ProfileTag.tag_id]).where(
+            and_(
+                ProfileTag.profile_id == profile.id,
+                ProfileTag.profile_type == profile.__tablename__,
+            )
+        )
+    )
+
+    for tag_type, tag_id in tags:
+        if tag_type in relations:
+            stale_tags[relations[tag_type]].add(tag_id)
+
+
+def _option_relations(option: TagValueMixin, stale_tags: FlushedTags):
+    for relation, (_, option_class, *_) in SEARCH_FILTER_RELATIONS.items():
+        if isinstance(option, option_class):
+            stale_tags[relation].add(option.id)
+
+
+@event.listens_for(Session, "after_flush")
+def refresh_flushed_tags(session, flush_context):
+    connection = session.connection()
+
+    stale_tags: FlushedTags = defaultdict(set)
+
+    options_changed = False
+
+    for instance in chain(session.new, session.deleted):
+        if type(instance) in SEARCH_FILTER_RELATIONS:
+            stale_tags[type(instance)].add(instance.tag_id)
+
+        if isinstance(instance, TagValueMixin):
+            options_changed = True
+
+    for instance in session.deleted:
+        if isinstance(instance, TagValueMixin):
+            _option_relations(instance, stale_tags)
+
+    for instance in session.dirty:
+        if type(instance) in SEARCH_FILTER_RELATIONS:
+            stale_tags[type(instance)].update(
+                tag_id
+                for tag_id in chain(*get_history(instance, "tag_id"))
+                if tag_id is not None
+            )
+
+        if isinstance(instance, BaseProfile) and _changed(
+            instance, "available_for_mentoring"
+        ):
+            _profile_tag_ids(connection, instance, stale_tags)
+
+        if isinstance(instance, TagValueMixin) and (
+            _changed(instance, "value")
+            or (
+                isinstance(instance, UserEditableTagMixin)
+                and _changed(instance, "public")
+            )
+        ):
+            options_changed = True
+
+            _option_relations(instance, stale_tags)
+
+    refresh_stale_tags(connection, stale_tags)
+
+    if options_changed:
+        bump_catalog_version(connection, PROFILE_TAGS_CATALOG)
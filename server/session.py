@@ -1,7 +1,7 @@
 import datetime
 from dateutil.relativedelta import relativedelta
 
-from flask import current_app
+from flask import current_app, has_request_context, request
 
 from structlog import get_logger
 
@@ -10,6 +10,23 @@ logger = get_logger()
 
 
 def token_expired(verification_token):
+    """
+    Whether the token is logged out or expired, computed once per request.
+    """
+    if not has_request_context():
+        return compute_token_expired(verification_token)
+
+    expired_tokens = request.environ.setdefault("weave.token_expired", {})
+
+    key = (verification_token.id, verification_token.logged_out)
+
+    if key not in expired_tokens:
+        expired_tokens[key] = compute_token_expired(verification_token)
+
+    return expired_tokens[key]
+
+
+def compute_token_expired(verification_token):
     log = logger.bind(
         email=verification_token.email.email, token_id=verification_token.id,
     )
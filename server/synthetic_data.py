@@ -0,0 +1,229 @@
+"""
+Deterministic synthetic profiles for measuring search at scale.
+
+Tags are drawn from a fixed vocabulary per field with a Zipf-like skew, so a
+few values are shared by many profiles and most by few, plus a long tail of
+custom values that each appear on a single profile, like the ones users type
+in themselves. The same configuration always produces the same data, so
+benchmark runs against it can be compared across commits.
+"""
+import random
+from itertools import accumulate
+from typing import Dict, Iterator, List, NamedTuple, Tuple
+
+from sqlalchemy.dialects.postgresql import insert
+
+from .models import (
+    FacultyProfile,
+    ProfileClass,
+    ProfileStar,
+    StudentProfile,
+    VerificationEmail,
+    db,
+)
+from .profile_import import (
+    STUDENT_OPTION_FIELDS,
+    TAG_FIELDS,
+    ImportResult,
+    Row,
+    batches,
+    import_profiles,
+)
+
+
+SYNTHETIC_EMAIL_DOMAIN = "synthetic.test"
+
+# Distinct standard values per tag field
+VOCABULARY_SIZE = 150
+
+# Standard values of the single option fields of student profiles
+STUDENT_OPTION_VALUES = {
+    "program": ["MD", "DMD", "MD-PhD", "MMSc"],
+    "current_year": ["Year 1", "Year 2", "Year 3", "Year 4"],
+    "pce_site": [f"PCE Site {index}" for index in range(1, 9)],
+}
+
+# Tag fields that users can't add their own values to
+FIXED_TAG_FIELDS = {"affiliations", "degrees"}
+
+FIRST_NAMES = (
+    "Ada Ben Chen Dana Eli Fatima Gus Hana Ivan Jo Kofi Lena Mateo Nia Omar"
+    " Priya Quinn Rosa Sam Tariq Uma Vik Wen Xavi Yara Zoe"
+).split()
+
+LAST_NAMES = (
+    "Abbott Bauer Castillo Diaz Eriksen Fischer Garcia Haddad Ito Jensen"
+    " Kim Lopez Moreau Nguyen Okafor Patel Quinlan Rossi Silva Tanaka Usman"
+    " Varga Weiss Xu Yilmaz Zhang"
+).split()
+
+WORDS = (
+    "research teaching global health surgery outcomes pediatrics policy"
+    " equity imaging genetics wellness writing leadership innovation"
+    " community data clinic"
+).split()
+
+
+class SyntheticDataConfig(NamedTuple):
+    faculty_count: int = 10000
+    student_count: int = 2000
+    tags_per_profile: int = 3
+    # Fraction of faculty profiles that each profile owner has starred
+    star_density: float = 0.001
+    # Values that appear on a single profile, spread across the tag fields
+    custom_tag_count: int = 1000
+    seed: int = 0
+
+
+class SyntheticDataResult(NamedTuple):
+    faculty: ImportResult
+    students: ImportResult
+    stars: int
+
+
+def synthetic_email(profile_class: ProfileClass, index: int) -> str:
+    return f"{profile_class.__tablename__}{index}@{SYNTHETIC_EMAIL_DOMAIN}"
+
+
+def _vocabulary(field: str) -> List[str]:
+    label = field.replace("_", " ").capitalize()
+
+    return [f"{label} {index}" for index in range(1, VOCABULARY_SIZE + 1)]
+
+
+def _zipf_weights(size: int) -> List[float]:
+    return list(accumulate(1 / rank for rank in range(1, size + 1)))
+
+
+def synthetic_profile_rows(
+    profile_class: ProfileClass, count: int, config: SyntheticDataConfig
+) -> Iterator[Row]:
+    """
+    Rows for `import_profiles`. Seeded by the profile type as well as the
+    configured seed, so changing the student count doesn't change faculty.
+    """
+    rng = random.Random(f"{config.seed}:{profile_class.__tablename__}")
+
+    fields = list(TAG_FIELDS[profile_class])
+
+    vocabularies = {field: _vocabulary(field) for field in fields}
+    cumulative_weights = _zipf_weights(VOCABULARY_SIZE)
+
+    custom_fields = [field for field in fields if field not in FIXED_TAG_FIELDS]
+
+    # Each custom value goes to one profile, picked up front so that the
+    # number of custom values matches the configuration exactly
+    total_profiles = config.faculty_count + config.student_count
+    custom_count = config.custom_tag_count * count // max(total_profiles, 1)
+
+    custom_tags: Dict[int, List[Tuple[str, str]]] = {}
+
+    for custom_index in range(custom_count):
+        field = rng.choice(custom_fields)
+        label = field.replace("_", " ")
+        value = f"Custom {label} {profile_class.__tablename__} {custom_index}"
+
+        custom_tags.setdefault(rng.randrange(count), []).append((field, value))
+
+    for index in range(count):
+        tags: Dict[str, List[str]] = {field: [] for field in fields}
+
+        for _ in range(config.tags_per_profile):
+            field = rng.choice(fields)
+
+            (value,) = rng.choices(vocabularies[field], cum_weights=cumulative_weights)
+
+            tags[field].append(value)
+
+        for field, value in custom_tags.get(index, []):
+            tags[field].append(value)
+
+        row: Row = {
+            "line_number": index + 1,
+            "name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            "contact_email": synthetic_email(profile_class, index),
+            "additional_information": " ".join(rng.sample(WORDS, 4)),
+            # Most profiles are listed, like in production
+            "available_for_mentoring": rng.random() < 0.9,
+            **tags,
+        }
+
+        if profile_class is StudentProfile:
+            for field in STUDENT_OPTION_FIELDS:
+                row[field] = rng.choice(STUDENT_OPTION_VALUES[field])
+
+        yield row
+
+
+def create_synthetic_stars(config: SyntheticDataConfig, batch_size: int = 5000) -> int:
+    """
+    Star `star_density` of the synthetic faculty profiles from each synthetic
+    profile's email. Returns how many stars were added.
+    """
+    rng = random.Random(f"{config.seed}:stars")
+
+    pattern = f"%@{SYNTHETIC_EMAIL_DOMAIN}"
+
+    faculty_email_ids = [
+        email_id
+        for email_id, in db.session.query(FacultyProfile.verification_email_id)
+        .join(VerificationEmail)
+        .filter(VerificationEmail.email.like(pattern))
+        .order_by(VerificationEmail.id)
+    ]
+
+    viewer_email_ids = [
+        email_id
+        for email_id, in db.session.query(VerificationEmail.id)
+        .filter(VerificationEmail.email.like(pattern))
+        .order_by(VerificationEmail.id)
+    ]
+
+    stars_per_viewer = round(len(faculty_email_ids) * config.star_density)
+
+    if not stars_per_viewer:
+        return 0
+
+    stars = (
+        {
+            "from_verification_email_id": viewer_id,
+            "to_verification_email_id": starred_id,
+        }
+        for viewer_id in viewer_email_ids
+        for starred_id in rng.sample(faculty_email_ids, stars_per_viewer)
+    )
+
+    connection = db.session.connection()
+
+    added = 0
+
+    for batch in batches(stars, batch_size):
+        result = connection.execute(
+            insert(ProfileStar.__table__).values(batch).on_conflict_do_nothing()
+        )
+
+        added += result.rowcount
+
+    db.session.commit()
+
+    return added
+
+
+def generate_synthetic_data(config: SyntheticDataConfig) -> SyntheticDataResult:
+    """
+    Import the configured synthetic profiles and stars. Profiles that already
+    exist are skipped, so running it again only adds what's missing.
+    """
+    faculty = import_profiles(
+        synthetic_profile_rows(FacultyProfile, config.faculty_count, config),
+        FacultyProfile,
+    )
+
+    students = import_profiles(
+        synthetic_profile_rows(StudentProfile, config.student_count, config),
+        StudentProfile,
+    )
+
+    stars = create_synthetic_stars(config)
+
+    return SyntheticDataResult(faculty=faculty, students=students, stars=stars)
@@ -0,0 +1,89 @@
+"""
+Loads the verification token of each request. The columns of a token that
+never change after it is created are cached per process, so that requests
+only read its state by primary key: whether it was verified or logged out,
+and its email, including the email's star version. Logging out or starring
+in one process is honored by every other on its next request.
+"""
+from flask import current_app
+from sqlalchemy import inspect
+from sqlalchemy.orm import joinedload, make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+
+from .models import VerificationEmail, VerificationToken, db
+
+
+# Columns that change after the token is created. The email log isn't used
+# by requests, so it is left to load on access.
+TOKEN_STATE_COLUMNS = ["verified", "logged_out"]
+UNCACHED_TOKEN_COLUMNS = [*TOKEN_STATE_COLUMNS, "email_log"]
+
+
+def _cached_column_values(verification_token):
+    return {
+        attribute.key: getattr(verification_token, attribute.key)
+        for attribute in inspect(VerificationToken).column_attrs
+        if attribute.key not in UNCACHED_TOKEN_COLUMNS
+    }
+
+
+def _attach(values):
+    """
+    Add a token built from column values to the session as if it had been
+    loaded. Columns missing from `values` are loaded when accessed.
+    """
+    verification_token = VerificationToken(**values)
+
+    make_transient_to_detached(verification_token)
+
+    return db.session.merge(verification_token, load=False)
+
+
+def load_verification_token(token: str):
+    """
+    The verification token with its email. The first request for a token
+    loads it with a joined query and caches its unchanging columns for
+    TOKEN_CACHE_SECONDS; later ones load its state and email by id.
+    """
+    cache = current_app.caches["tokens"]
+
+    cached_values = cache.get(token)
+
+    if cached_values is None:
+        verification_token = (
+            VerificationToken.query.options(joinedload(VerificationToken.email))
+            .filter(VerificationToken.token == token)
+            .populate_existing()
+            .first()
+        )
+
+        if verification_token is not None:
+            cache.set(token, _cached_column_values(verification_token))
+
+        return verification_token
+
+    state = (
+        db.session.query(
+            *[getattr(VerificationToken, column) for column in TOKEN_STATE_COLUMNS],
+            VerificationEmail,
+        )
+        .join(VerificationEmail, VerificationToken.email)
+        .filter(VerificationToken.id == cached_values["id"])
+        .populate_existing()
+        .first()
+    )
+
+    if state is None:
+        cache.delete(token)
+
+        return None
+
+    *state_values, verification_email = state
+
+    verification_token = _attach(
+        {**cached_values, **dict(zip(TOKEN_STATE_COLUMNS, state_values))}
+    )
+
+    set_committed_value(verification_token, "email", verification_email)
+
+    return verification_token
@@ -4,10 +4,10 @@ from http import HTTPStatus
 
 import flask_login
 from cloudinary import uploader
-from flask import jsonify, make_response, request
+from flask import current_app, jsonify, make_response, request
 from marshmallow import ValidationError
 from sentry_sdk import capture_exception
-from sqlalchemy import and_, asc, desc, exists, func, text
+from sqlalchemy import and_, exists, func
 from structlog import get_logger
 
 from server.emails import (
@@ -35,27 +35,49 @@ from server.models import (
     VerificationEmail,
     VerificationToken,
     db,
+    parse_profile_id,
     save,
 )
 from server.queries import (
-    add_stars_to_profiles,
+    SEARCH_MODES,
+    estimate_count,
+    get_catalog_version,
+    get_profile_by_id,
     get_profile_by_token,
     get_verification_email_by_email,
+    load_profile,
     matching_faculty_profiles,
     matching_student_profiles,
+    profile_starred,
     query_faculty_profiles_and_stars,
-    query_profile_tags,
     query_faculty_searchable_tags,
+    query_profile_tags,
     query_student_searchable_tags,
+    search_relevance,
+    search_words,
+    trigram_search_available,
+    update_search_documents,
 )
 from server.schemas import (
+    faculty_profile_fragment_schema,
     faculty_profile_schema,
-    faculty_profiles_schema,
-    student_profiles_schema,
+    student_profile_fragment_schema,
     valid_email_schema,
 )
+from server.searchable_tags import PROFILE_TAGS_CATALOG, search_tags_catalog
 from server.session import token_expired
-from server.views.pagination import paginate
+from server.views.pagination import (
+    DEFAULT_PAGE_SIZE,
+    InvalidCursorError,
+    SortKey,
+    decode_cursor,
+    encode_cursor,
+    keyset_predicate,
+    paginate,
+    parse_bool,
+    parse_float,
+    parse_string,
+)
 
 from . import student_profile
 from .blueprint import api
@@ -66,7 +88,7 @@ from .exceptions import (
     UnauthorizedError,
     UserError,
 )
-from .utils import get_base_fields, save_tags
+from .utils import dump_profiles, get_base_fields, get_profile_id, save_tags
 
 
 __all__ = ["student_profile"]
@@ -75,82 +97,297 @@ __all__ = ["student_profile"]
 log = get_logger()
 
 
+def get_page_size():
+    try:
+        page_size = int(request.args.get("page_size", DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise InvalidPayloadError({"page_size": ["invalid"]})
+
+    if page_size < 1:
+        raise InvalidPayloadError({"page_size": ["invalid"]})
+
+    return min(page_size, current_app.config["MAX_PAGE_SIZE"])
+
+
+def lists_own_profile(verification_email, profile_class):
+    """
+    Whether the viewer can have a profile in the directory of
+    `profile_class`, which is then listed first. Directories only list
+    profiles of faculty or of students, see `faculty_directory_queryset`.
+    """
+    if verification_email is None:
+        return False
+
+    return verification_email.is_faculty == (profile_class is FacultyProfile)
+
+
+def get_sort_keys(
+    sorting,
+    profile_class,
+    verification_email_id,
+    relevance=None,
+    own_profile_first=True,
+):
+    """
+    The ordering for `sorting`. Key values are read from a result row, of the
+    profile, whether the viewer starred it and for "relevance" sorting its
+    `search_relevance`.
+
+    Only fuzzy searches have a `relevance` to sort by. Viewers who can't be in
+    the directory don't need their own profile sorted first, which lets the
+    last name ordering be read from its index.
+    """
+
+    def get_last_name(row):
+        return row[0].last_name_sort_key
+
+    def get_starred(row):
+        return row.profile_starred
+
+    def get_date_updated(row):
+        return row[0].date_updated.isoformat()
+
+    def get_is_other_profile(row):
+        return row[0].verification_email_id != verification_email_id
+
+    def get_id(row):
+        return row[0].id
+
+    def get_relevance(row):
+        return row.search_relevance
+
+    date_updated = SortKey(
+        profile_class.date_updated,
+        descending=True,
+        get_value=get_date_updated,
+        parse_value=datetime.datetime.fromisoformat,
+    )
+
+    last_name = SortKey(
+        profile_class.last_name_sort_key,
+        descending=False,
+        get_value=get_last_name,
+        parse_value=parse_string,
+    )
+
+    sort_options = {
+        "starred": [
+            SortKey(
+                profile_starred(profile_class, verification_email_id),
+                descending=True,
+                get_value=get_starred,
+                parse_value=parse_bool,
+            ),
+            date_updated,
+        ],
+        "last_name_alphabetical": [last_name],
+        "last_name_reverse_alphabetical": [last_name._replace(descending=True)],
+        "date_updated": [date_updated],
+    }
+
+    if relevance is not None:
+        sort_options["relevance"] = [
+            SortKey(
+                relevance,
+                descending=True,
+                get_value=get_relevance,
+                parse_value=parse_float,
+            ),
+            date_updated,
+        ]
+
+    if sorting not in sort_options:
+        raise InvalidPayloadError({"sorting": ["invalid"]})
+
+    sort_keys = sort_options[sorting]
+
+    if own_profile_first:
+        sort_keys = [
+            # Is this the logged-in user's profile? If so, return it first (false)
+            SortKey(
+                profile_class.verification_email_id != verification_email_id,
+                descending=False,
+                get_value=get_is_other_profile,
+                parse_value=parse_bool,
+            ),
+            *sort_keys,
+        ]
+
+    return [
+        *sort_keys,
+        # Break ties so that pages never overlap or skip profiles. Ties go the
+        # same way as the last key, so that one index on (key, id) serves both
+        # directions.
+        SortKey(
+            profile_class.id,
+            descending=sort_keys[-1].descending,
+            get_value=get_id,
+            parse_value=parse_profile_id,
+        ),
+    ]
+
+
+COUNT_MODES = {"exact", "estimate", "none"}
+
+
+def get_count_mode():
+    count_mode = request.args.get("count", "exact")
+
+    if count_mode not in COUNT_MODES:
+        raise InvalidPayloadError({"count": ["invalid"]})
+
+    return count_mode
+
+
+def get_search_mode():
+    search_mode = request.args.get("search_mode", "prefix")
+
+    if search_mode not in SEARCH_MODES:
+        raise InvalidPayloadError({"search_mode": ["invalid"]})
+
+    if search_mode == "fuzzy" and not trigram_search_available():
+        raise InvalidPayloadError({"search_mode": ["unavailable"]})
+
+    return search_mode
+
+
+def get_search_relevance(profile_class, query, search_mode):
+    """
+    The relevance to sort a fuzzy search by, or None for other searches.
+    """
+    words = search_words(query)
+
+    if search_mode != "fuzzy" or not words:
+        return None
+
+    return search_relevance(profile_class, words)
+
+
 def render_matching_profiles(
     profiles_queryset,
     verification_email_id,
     profile_class,
-    role_specific_profiles_schema,
+    fragment_schema,
+    relevance=None,
+    own_profile_first=True,
 ):
+    """
+    Render a page of profiles. Pages are selected either by `page` number, or
+    by passing the `next_cursor` of the previous page as `cursor` (empty for
+    the first page), which seeks past the last profile instead of counting
+    through every earlier page.
+
+    `count` selects how `profile_count` is computed: "exact" (in the same
+    statement as the page), "estimate" (from the query planner) or "none".
+    """
     page = int(request.args.get("page", 1))
 
+    page_size = get_page_size()
+
     sorting = request.args.get("sorting", "starred")
 
-    start, end = paginate(page)
+    cursor = request.args.get("cursor")
 
-    def get_ordering(sorting):
-        last_name_sorting = func.split_part(
-            profile_class.name,
-            " ",
-            func.array_length(
-                func.string_to_array(profile_class.name, " "),
-                1,  # Length in the 1st dimension
-            ),
+    count_mode = get_count_mode()
+
+    sort_keys = get_sort_keys(
+        sorting, profile_class, verification_email_id, relevance, own_profile_first
+    )
+
+    sorted_queryset = profiles_queryset.order_by(
+        *[sort_key.ordering() for sort_key in sort_keys]
+    )
+
+    if sorting == "relevance":
+        # Selected so cursors can be made from it
+        sorted_queryset = sorted_queryset.add_columns(
+            relevance.label("search_relevance")
         )
 
-        sort_options = {
-            "starred": [
-                desc(text("profile_star_count")),
-                desc(profile_class.date_updated),
-            ],
-            "last_name_alphabetical": [asc(last_name_sorting)],
-            "last_name_reverse_alphabetical": [desc(last_name_sorting)],
-            "date_updated": [desc(profile_class.date_updated)],
-        }
+    profile_count = None
 
-        if sorting not in sort_options:
-            raise InvalidPayloadError({"sorting": ["invalid"]})
+    if cursor:
+        try:
+            values, profile_count = decode_cursor(cursor, sorting, sort_keys)
+        except InvalidCursorError:
+            raise InvalidPayloadError({"cursor": ["invalid"]})
 
-        return sort_options[sorting]
+        sorted_queryset = sorted_queryset.filter(keyset_predicate(sort_keys, values))
 
-    ordering = [
-        # Is this the logged-in user's profile? If so, return it first (false)
-        profile_class.verification_email_id != verification_email_id,
-        *get_ordering(sorting),
-    ]
+    # Later cursor pages only see the rows after the cursor, so their window
+    # count would not be the total. The first page's count is carried in the
+    # cursor instead.
+    count_in_page = count_mode == "exact" and not cursor
 
-    sorted_queryset = profiles_queryset.order_by(*ordering)
+    if count_in_page:
+        sorted_queryset = sorted_queryset.add_columns(
+            func.count().over().label("profile_count")
+        )
 
-    sliced_queryset = sorted_queryset[start:end]
+    pagination = {}
 
-    profiles_with_stars = add_stars_to_profiles(sliced_queryset)
+    if cursor is None:
+        start, end = paginate(page, page_size)
+
+        rows = sorted_queryset[start:end]
+    else:
+        start = 0
+
+        rows = sorted_queryset.limit(page_size + 1).all()
+
+        has_next_page = len(rows) > page_size
+
+        rows = rows[:page_size]
+
+    if count_mode == "exact":
+        if count_in_page and rows:
+            profile_count = rows[0].profile_count
+        elif count_in_page and start == 0:
+            profile_count = 0
+        elif profile_count is None:
+            profile_count = profiles_queryset.count()
+    elif count_mode == "estimate":
+        profile_count = estimate_count(profiles_queryset)
+    else:
+        profile_count = None
+
+    if cursor is not None:
+        last_row = rows[-1] if rows else None
+
+        pagination["next_cursor"] = (
+            encode_cursor(
+                sorting,
+                [sort_key.get_value(last_row) for sort_key in sort_keys],
+                profile_count if count_mode == "exact" else None,
+            )
+            if has_next_page
+            else None
+        )
 
     return jsonify(
         {
-            "profile_count": profiles_queryset.count(),
-            "profiles": role_specific_profiles_schema.dump(profiles_with_stars),
+            "profile_count": profile_count,
+            "profiles": dump_profiles(rows, profile_class, fragment_schema),
+            **pagination,
         }
     )
 
 
-@api.route("/profiles")
-@flask_login.login_required
-def get_profiles():
-    verification_token = flask_login.current_user
-
-    query = request.args.get("query", "")
-    tags = request.args.get("tags", "")
-    degrees = request.args.get("degrees", "")
-    affiliations = request.args.get("affiliations", "")
-
-    verification_email_id = verification_token.email_id
-
-    profiles_queryset = (
+def faculty_directory_queryset(
+    query, tags, degrees, affiliations, verification_email_id, search_mode="prefix"
+):
+    """
+    The faculty profiles listed by /api/profiles for these search parameters,
+    before sorting and pagination.
+    """
+    return (
         matching_faculty_profiles(
             query,
             tags,
             degrees,
             affiliations,
             verification_email_id=verification_email_id,
+            search_mode=search_mode,
         )
         .join(
             VerificationEmail,
@@ -159,11 +396,54 @@ def get_profiles():
         .filter(VerificationEmail.is_faculty.is_(True))
     )
 
+
+def student_directory_queryset(
+    query, tags, affiliations, verification_email_id, search_mode="prefix"
+):
+    """
+    The student profiles listed by /api/peer-profiles, before sorting and
+    pagination.
+    """
+    return (
+        matching_student_profiles(
+            query,
+            tags,
+            affiliations,
+            verification_email_id=verification_email_id,
+            search_mode=search_mode,
+        )
+        .join(
+            VerificationEmail,
+            StudentProfile.verification_email_id == VerificationEmail.id,
+        )
+        .filter(VerificationEmail.is_faculty.is_(False))
+    )
+
+
+@api.route("/profiles")
+@flask_login.login_required
+def get_profiles():
+    verification_token = flask_login.current_user
+
+    query = request.args.get("query", "")
+    tags = request.args.get("tags", "")
+    degrees = request.args.get("degrees", "")
+    affiliations = request.args.get("affiliations", "")
+    search_mode = get_search_mode()
+
+    verification_email_id = verification_token.email_id
+
+    profiles_queryset = faculty_directory_queryset(
+        query, tags, degrees, affiliations, verification_email_id, search_mode
+    )
+
     return render_matching_profiles(
         profiles_queryset,
         verification_email_id,
         profile_class=FacultyProfile,
-        role_specific_profiles_schema=faculty_profiles_schema,
+        fragment_schema=faculty_profile_fragment_schema,
+        relevance=get_search_relevance(FacultyProfile, query, search_mode),
+        own_profile_first=lists_own_profile(verification_token.email, FacultyProfile),
     )
 
 
@@ -180,49 +460,61 @@ def peer_profiles():
     query = request.args.get("query", "")
     tags = request.args.get("tags", "")
     affiliations = request.args.get("affiliations", "")
+    search_mode = get_search_mode()
 
     verification_email_id = verification_token.email_id
 
-    profiles_queryset = (
-        matching_student_profiles(
-            query, tags, affiliations, verification_email_id=verification_email_id,
-        )
-        .join(
-            VerificationEmail,
-            StudentProfile.verification_email_id == VerificationEmail.id,
-        )
-        .filter(VerificationEmail.is_faculty.is_(False))
+    profiles_queryset = student_directory_queryset(
+        query, tags, affiliations, verification_email_id, search_mode
     )
+
     return render_matching_profiles(
         profiles_queryset,
         verification_email_id,
         profile_class=StudentProfile,
-        role_specific_profiles_schema=student_profiles_schema,
+        fragment_schema=student_profile_fragment_schema,
+        relevance=get_search_relevance(StudentProfile, query, search_mode),
     )
 
 
+def render_versioned_tags(catalog_name, query_tags):
+    """
+    Render tags with the catalog's version as the ETag. If the client already
+    has the current version, answer 304 Not Modified without querying tags.
+    """
+    etag = f"{catalog_name}-{get_catalog_version(catalog_name)}"
+
+    if request.if_none_match.contains(etag):
+        response = make_response("", HTTPStatus.NOT_MODIFIED.value)
+    else:
+        response = make_response({"tags": query_tags()})
+
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "private, no-cache"
+
+    return response
+
+
 @api.route("/profile-tags")
 @flask_login.login_required
 def get_profile_tags():
-    tags = query_profile_tags()
-
-    return {"tags": tags}
+    return render_versioned_tags(PROFILE_TAGS_CATALOG, query_profile_tags)
 
 
 @api.route("/faculty-search-tags")
 @flask_login.login_required
 def get_faculty_search_tags():
-    tags = query_faculty_searchable_tags()
-
-    return {"tags": tags}
+    return render_versioned_tags(
+        search_tags_catalog(FacultyProfile), query_faculty_searchable_tags
+    )
 
 
 @api.route("/student-search-tags")
 @flask_login.login_required
 def get_student_search_tags():
-    tags = query_student_searchable_tags()
-
-    return {"tags": tags}
+    return render_versioned_tags(
+        search_tags_catalog(StudentProfile), query_student_searchable_tags
+    )
 
 
 @api.route("/profiles/<profile_id>")
@@ -230,19 +522,24 @@ def get_student_search_tags():
 def get_profile(profile_id=None):
     verification_token = flask_login.current_user
 
-    profile_and_star_list = query_faculty_profiles_and_stars(
-        verification_email_id=verification_token.email_id
-    ).filter(FacultyProfile.id == profile_id)
+    profile_id = get_profile_id(profile_id)
 
-    if not profile_and_star_list.first():
-        raise UserError({"profile_id": ["Not found"]}, HTTPStatus.NOT_FOUND.value)
+    profile_and_star = (
+        query_faculty_profiles_and_stars(
+            verification_email_id=verification_token.email_id
+        )
+        .filter(FacultyProfile.id == profile_id)
+        .first()
+    )
 
-    profile, star_count = profile_and_star_list[0]
+    if profile_and_star is None:
+        raise UserError({"profile_id": ["Not found"]}, HTTPStatus.NOT_FOUND.value)
 
-    # TODO do this without mutating profile
-    profile.starred = star_count > 0
+    [profile_data] = dump_profiles(
+        [profile_and_star], FacultyProfile, faculty_profile_fragment_schema
+    )
 
-    response = make_response(jsonify(faculty_profile_schema.dump(profile)))
+    response = make_response(jsonify(profile_data))
 
     response.headers["Cache-Control"] = "public, max-age=0"
     response.headers["Pragma"] = "no-cache"
@@ -254,25 +551,27 @@ def get_profile(profile_id=None):
 def save_all_tags(profile, schema):
     save_tags(
         profile,
-        schema["affiliations"],
-        HospitalAffiliationOption,
-        FacultyHospitalAffiliation,
-    )
-    save_tags(
-        profile,
-        schema["clinical_specialties"],
-        ClinicalSpecialtyOption,
-        FacultyClinicalSpecialty,
-    )
-    save_tags(
-        profile,
-        schema["professional_interests"],
-        ProfessionalInterestOption,
-        FacultyProfessionalInterest,
+        [
+            (
+                schema["affiliations"],
+                HospitalAffiliationOption,
+                FacultyHospitalAffiliation,
+            ),
+            (
+                schema["clinical_specialties"],
+                ClinicalSpecialtyOption,
+                FacultyClinicalSpecialty,
+            ),
+            (
+                schema["professional_interests"],
+                ProfessionalInterestOption,
+                FacultyProfessionalInterest,
+            ),
+            (schema["parts_of_me"], PartsOfMeOption, FacultyPartsOfMe),
+            (schema["activities"], ActivityOption, FacultyProfileActivity),
+            (schema["degrees"], DegreeOption, FacultyProfileDegree),
+        ],
     )
-    save_tags(profile, schema["parts_of_me"], PartsOfMeOption, FacultyPartsOfMe)
-    save_tags(profile, schema["activities"], ActivityOption, FacultyProfileActivity)
-    save_tags(profile, schema["degrees"], DegreeOption, FacultyProfileDegree)
 
 
 def basic_faculty_profile_data(schema):
@@ -312,10 +611,18 @@ def create_faculty_profile():
         **basic_faculty_profile_data(schema),
     }
 
-    profile = save(FacultyProfile(**profile_data))
+    profile = FacultyProfile(**profile_data)
+
+    db.session.add(profile)
+    db.session.flush()
 
     save_all_tags(profile, schema)
 
+    update_search_documents(FacultyProfile, [profile.id])
+    db.session.commit()
+
+    profile = load_profile(FacultyProfile, profile.id)
+
     return jsonify(faculty_profile_schema.dump(profile)), HTTPStatus.CREATED.value
 
 
@@ -330,7 +637,7 @@ def update_faculty_profile(profile_id=None):
 
     verification_token = flask_login.current_user
 
-    profile = FacultyProfile.query.get(profile_id)
+    profile = FacultyProfile.query.get(get_profile_id(profile_id))
 
     is_admin = VerificationEmail.query.filter(
         VerificationEmail.id == verification_token.email_id
@@ -358,24 +665,15 @@ def update_faculty_profile(profile_id=None):
     if not editing_as_admin:
         profile.date_updated = datetime.datetime.utcnow()
 
-    save(profile)
-
-    # TODO rather than deleting all, delete only ones that haven't changed
-    profile_relation_classes = {
-        FacultyProfessionalInterest,
-        FacultyProfileActivity,
-        FacultyHospitalAffiliation,
-        FacultyPartsOfMe,
-        FacultyClinicalSpecialty,
-        FacultyProfileDegree,
-    }
-    for profile_relation_class in profile_relation_classes:
-        profile_relation_class.query.filter(
-            profile_relation_class.profile_id == profile.id
-        ).delete()
+    db.session.flush()
 
     save_all_tags(profile, schema)
 
+    update_search_documents(FacultyProfile, [profile.id])
+    db.session.commit()
+
+    profile = load_profile(FacultyProfile, profile.id)
+
     return jsonify(faculty_profile_schema.dump(profile))
 
 
@@ -662,8 +960,15 @@ def star_profile():
             HTTPStatus.UNPROCESSABLE_ENTITY.value,
         )
 
-    to_profile_id = request.json["profile_id"]
-    to_profile = FacultyProfile.query.get(to_profile_id) or StudentProfile.query.get(to_profile_id)
+    try:
+        to_profile_id = parse_profile_id(request.json["profile_id"])
+    except ValueError:
+        return (
+            jsonify({"profile_id": ["`profile_id` invalid"]}),
+            HTTPStatus.UNPROCESSABLE_ENTITY.value,
+        )
+
+    to_profile = get_profile_by_id(to_profile_id)
 
     if to_profile is None:
         return (
@@ -718,8 +1023,15 @@ def unstar_profile():
             HTTPStatus.UNPROCESSABLE_ENTITY.value,
         )
 
-    to_profile_id = request.json["profile_id"]
-    to_profile = FacultyProfile.query.get(to_profile_id) or StudentProfile.query.get(to_profile_id)
+    try:
+        to_profile_id = parse_profile_id(request.json["profile_id"])
+    except ValueError:
+        return (
+            jsonify({"profile_id": ["`profile_id` invalid"]}),
+            HTTPStatus.UNPROCESSABLE_ENTITY.value,
+        )
+
+    to_profile = get_profile_by_id(to_profile_id)
 
     if to_profile is None:
         return (
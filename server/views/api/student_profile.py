@@ -22,14 +22,17 @@ from server.models import (
     StudentProfileActivity,
     VerificationEmail,
     db,
-    save,
 )
-from server.schemas import student_profile_schema
-from server.queries import query_student_profiles_and_stars
+from server.schemas import student_profile_fragment_schema, student_profile_schema
+from server.queries import (
+    load_profile,
+    query_student_profiles_and_stars,
+    update_search_documents,
+)
 
 from .blueprint import api
 from .exceptions import InvalidPayloadError, UserError
-from .utils import get_base_fields, save_tags
+from .utils import dump_profiles, get_base_fields, get_profile_id, save_tags
 
 
 log = get_logger()
@@ -38,24 +41,26 @@ log = get_logger()
 def save_student_tags(profile, schema):
     save_tags(
         profile,
-        schema["affiliations"],
-        HospitalAffiliationOption,
-        StudentHospitalAffiliation,
+        [
+            (
+                schema["affiliations"],
+                HospitalAffiliationOption,
+                StudentHospitalAffiliation,
+            ),
+            (
+                schema["clinical_specialties"],
+                ClinicalSpecialtyOption,
+                StudentClinicalSpecialty,
+            ),
+            (
+                schema["professional_interests"],
+                ProfessionalInterestOption,
+                StudentProfessionalInterest,
+            ),
+            (schema["parts_of_me"], PartsOfMeOption, StudentPartsOfMe),
+            (schema["activities"], ActivityOption, StudentProfileActivity),
+        ],
     )
-    save_tags(
-        profile,
-        schema["clinical_specialties"],
-        ClinicalSpecialtyOption,
-        StudentClinicalSpecialty,
-    )
-    save_tags(
-        profile,
-        schema["professional_interests"],
-        ProfessionalInterestOption,
-        StudentProfessionalInterest,
-    )
-    save_tags(profile, schema["parts_of_me"], PartsOfMeOption, StudentPartsOfMe)
-    save_tags(profile, schema["activities"], ActivityOption, StudentProfileActivity)
 
 
 def basic_student_profile_data(schema):
@@ -104,10 +109,18 @@ def create_student_profile():
         **basic_student_profile_data(schema),
     }
 
-    profile = save(StudentProfile(**profile_data))
+    profile = StudentProfile(**profile_data)
+
+    db.session.add(profile)
+    db.session.flush()
 
     save_student_tags(profile, schema)
 
+    update_search_documents(StudentProfile, [profile.id])
+    db.session.commit()
+
+    profile = load_profile(StudentProfile, profile.id)
+
     return jsonify(student_profile_schema.dump(profile)), http.HTTPStatus.CREATED.value
 
 
@@ -116,19 +129,24 @@ def create_student_profile():
 def get_student_profile(profile_id=None):
     verification_token = flask_login.current_user
 
-    profile_and_star_list = query_student_profiles_and_stars(
-        verification_email_id=verification_token.email_id
-    ).filter(StudentProfile.id == profile_id)
+    profile_id = get_profile_id(profile_id)
 
-    if not profile_and_star_list.first():
-        raise UserError({"profile_id": ["Not found"]}, http.HTTPStatus.NOT_FOUND.value)
+    profile_and_star = (
+        query_student_profiles_and_stars(
+            verification_email_id=verification_token.email_id
+        )
+        .filter(StudentProfile.id == profile_id)
+        .first()
+    )
 
-    profile, star_count = profile_and_star_list[0]
+    if profile_and_star is None:
+        raise UserError({"profile_id": ["Not found"]}, http.HTTPStatus.NOT_FOUND.value)
 
-    # TODO do this without mutating profile
-    profile.starred = star_count > 0
+    [profile_data] = dump_profiles(
+        [profile_and_star], StudentProfile, student_profile_fragment_schema
+    )
 
-    response = make_response(jsonify(student_profile_schema.dump(profile)))
+    response = make_response(jsonify(profile_data))
 
     response.headers["Cache-Control"] = "public, max-age=0"
     response.headers["Pragma"] = "no-cache"
@@ -148,7 +166,7 @@ def update_student_profile(profile_id=None):
 
     verification_token = flask_login.current_user
 
-    profile = StudentProfile.query.get_or_404(profile_id)
+    profile = StudentProfile.query.get_or_404(get_profile_id(profile_id))
 
     is_admin = VerificationEmail.query.filter(
         VerificationEmail.id == verification_token.email_id
@@ -176,21 +194,13 @@ def update_student_profile(profile_id=None):
     if not editing_as_admin:
         profile.date_updated = datetime.datetime.utcnow()
 
-    save(profile)
-
-    # TODO rather than deleting all, delete only ones that haven't changed
-    profile_relation_classes = {
-        StudentProfessionalInterest,
-        StudentProfileActivity,
-        StudentHospitalAffiliation,
-        StudentPartsOfMe,
-        StudentClinicalSpecialty,
-    }
-    for profile_relation_class in profile_relation_classes:
-        profile_relation_class.query.filter(
-            profile_relation_class.profile_id == profile.id
-        ).delete()
+    db.session.flush()
 
     save_student_tags(profile, schema)
 
+    update_search_documents(StudentProfile, [profile.id])
+    db.session.commit()
+
+    profile = load_profile(StudentProfile, profile.id)
+
     return student_profile_schema.dump(profile)
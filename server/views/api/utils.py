@@ -1,8 +1,22 @@
-from server.models import db
+from collections import defaultdict
+from http import HTTPStatus
+from typing import Dict, List, Optional, Union
 
+from flask import current_app
+from sqlalchemy import and_, or_, sql
+from sqlalchemy.dialects.postgresql import insert
 
-def flat_values(values):
-    return [tup[0] for tup in values]
+from server.cache import profile_cache_key
+from server.models import ProfileTag, StudentProfile, db, parse_profile_id
+from server.profile_import import STUDENT_OPTION_FIELDS, TAG_FIELDS
+from server.queries import OptionValues, get_option_values
+from server.searchable_tags import (
+    PROFILE_TAGS_CATALOG,
+    bump_catalog_version,
+    refresh_stale_tags,
+)
+
+from .exceptions import UserError
 
 
 TRIMMED_FIELDS = {"name", "contact_email"}
@@ -25,40 +39,258 @@ def get_base_fields(schema):
     return {**base_fields, **trimmed_fields}
 
 
-def save_tags(profile, tag_values, option_class, profile_relation_class):
-    activity_values = [value["tag"]["value"].strip() for value in tag_values]
+def get_profile_id(profile_id: str) -> str:
+    """
+    The canonical form of a profile id from a URL. Ids that aren't UUIDs
+    can't belong to any profile, so they are not found.
+    """
+    try:
+        return parse_profile_id(profile_id)
+    except ValueError:
+        raise UserError({"profile_id": ["Not found"]}, HTTPStatus.NOT_FOUND.value)
 
-    existing_activity_options = option_class.query.filter(
-        option_class.value.in_(activity_values)
-    )
 
-    existing_activity_values = flat_values(
-        existing_activity_options.values(option_class.value)
-    )
+def get_tag_values(tag_values):
+    # Drop duplicates, keeping the order the tags were entered in
+    return list(dict.fromkeys(value["tag"]["value"].strip() for value in tag_values))
+
 
-    new_activity_values = [
-        value for value in activity_values if value not in existing_activity_values
+def get_or_create_options(connection, option_values):
+    """
+    Ids of the options with the given values, as {option class: {value: id}},
+    creating options that don't exist yet. Returns the ids and whether any
+    options were created.
+    """
+    lookups = [
+        sql.select(
+            [
+                sql.literal(option_class.__tablename__).label("option_type"),
+                option_class.value,
+                option_class.id,
+            ]
+        ).where(option_class.value.in_(values))
+        for option_class, values in option_values
+        if values
     ]
 
-    new_activities = [option_class(value=value) for value in new_activity_values]
+    option_ids = {option_class: {} for option_class, _ in option_values}
+
+    if not lookups:
+        return option_ids, False
+
+    option_classes = {
+        option_class.__tablename__: option_class for option_class, _ in option_values
+    }
+
+    for option_type, value, option_id in connection.execute(sql.union_all(*lookups)):
+        option_ids[option_classes[option_type]][value] = option_id
+
+    created = False
+
+    for option_class, values in option_values:
+        new_values = [
+            value for value in values if value not in option_ids[option_class]
+        ]
+
+        if not new_values:
+            continue
+
+        statement = insert(option_class.__table__).values(
+            [{"value": value} for value in new_values]
+        )
+
+        # Another request may have created the same option in the meantime
+        inserted = connection.execute(
+            statement.on_conflict_do_update(
+                index_elements=[option_class.value],
+                set_={"value": statement.excluded.value},
+            ).returning(option_class.value, option_class.id)
+        )
+
+        option_ids[option_class].update(
+            {value: option_id for value, option_id in inserted}
+        )
+
+        created = True
+
+    return option_ids, created
 
-    db.session.add_all(new_activities)
-    db.session.commit()
 
-    existing_profile_relation_tag_ids = flat_values(
-        profile_relation_class.query.filter(
-            profile_relation_class.tag_id.in_(
-                flat_values(existing_activity_options.values(profile_relation_class.id))
-            ),
-            profile_relation_class.profile_id == profile.id,
-        ).values(profile_relation_class.tag_id)
+def save_tags(profile, tags):
+    """
+    Make the profile's tags match `tags`, a list of (tag values from the
+    schema, option class, profile relation class). Options that don't exist
+    are created, and only the tags that changed are inserted or deleted.
+
+    Nothing is committed, so that the caller can save the whole profile in one
+    transaction.
+    """
+    connection = db.session.connection()
+
+    option_values = [
+        (option_class, get_tag_values(tag_values))
+        for tag_values, option_class, _ in tags
+    ]
+
+    option_ids, options_created = get_or_create_options(connection, option_values)
+
+    # A profile has one relation per option table
+    relation_classes = {
+        profile_relation_class.option_class.__tablename__: profile_relation_class
+        for _, _, profile_relation_class in tags
+    }
+
+    existing_tag_ids = {
+        profile_relation_class: set()
+        for profile_relation_class in relation_classes.values()
+    }
+
+    profile_tags = and_(
+        ProfileTag.profile_id == profile.id,
+        ProfileTag.profile_type == profile.__tablename__,
     )
 
-    new_profile_relations = [
-        profile_relation_class(tag_id=activity.id, profile_id=profile.id)
-        for activity in existing_activity_options  # All activities exist by this point
-        if activity.id not in existing_profile_relation_tag_ids
+    existing_relations = sql.select([ProfileTag.tag_type, ProfileTag.tag_id]).where(
+        profile_tags
+    )
+
+    for tag_type, tag_id in connection.execute(existing_relations):
+        if tag_type in relation_classes:
+            existing_tag_ids[relation_classes[tag_type]].add(tag_id)
+
+    removed_tags = []
+    added_tags = []
+
+    stale_tags = {}
+
+    for (option_class, values), (_, _, profile_relation_class) in zip(
+        option_values, tags
+    ):
+        tag_ids = {option_ids[option_class][value] for value in values}
+
+        existing = existing_tag_ids[profile_relation_class]
+
+        removed_tag_ids = existing - tag_ids
+        added_tag_ids = tag_ids - existing
+
+        if removed_tag_ids:
+            removed_tags.append(
+                and_(
+                    ProfileTag.tag_type == option_class.__tablename__,
+                    ProfileTag.tag_id.in_(sorted(removed_tag_ids)),
+                )
+            )
+
+        added_tags.extend(
+            profile_relation_class.relation_row(profile.id, tag_id)
+            for tag_id in sorted(added_tag_ids)
+        )
+
+        # Writes through the connection aren't seen by the flush hook that
+        # maintains the searchable tag catalog, so refresh the changed tags
+        stale_tags[profile_relation_class] = removed_tag_ids | added_tag_ids
+
+    if removed_tags:
+        connection.execute(
+            ProfileTag.__table__.delete().where(and_(profile_tags, or_(*removed_tags)))
+        )
+
+    if added_tags:
+        connection.execute(ProfileTag.__table__.insert(), added_tags)
+
+    refresh_stale_tags(connection, stale_tags)
+
+    if options_created:
+        bump_catalog_version(connection, PROFILE_TAGS_CATALOG)
+
+        current_app.caches["option_ids"].clear()
+
+
+def _option_ids(profiles, profile_class):
+    """
+    The ids of the options the tags and student options of `profiles` refer
+    to, by option class.
+    """
+    option_ids = defaultdict(set)
+
+    for profile in profiles:
+        for relation, option_class in TAG_FIELDS[profile_class].values():
+            option_ids[option_class].update(getattr(profile, relation.tag_ids_column))
+
+        if profile_class is StudentProfile:
+            for column, option_class in STUDENT_OPTION_FIELDS.values():
+                if getattr(profile, column) is not None:
+                    option_ids[option_class].add(getattr(profile, column))
+
+    return option_ids
+
+
+def dump_option_fields(profile, profile_class, option_values: OptionValues) -> dict:
+    """
+    The tag fields of a profile, and the options of students, serialized from
+    the profile's own id columns. Tags of options that no longer exist are
+    left out.
+    """
+    fields: Dict[str, Union[List[str], Optional[str]]] = {
+        field: [
+            option_values[option_class][tag_id]
+            for tag_id in getattr(profile, relation.tag_ids_column)
+            if tag_id in option_values[option_class]
+        ]
+        for field, (relation, option_class) in TAG_FIELDS[profile_class].items()
+    }
+
+    if profile_class is StudentProfile:
+        for field, (column, option_class) in STUDENT_OPTION_FIELDS.items():
+            fields[field] = option_values[option_class].get(getattr(profile, column))
+
+    return fields
+
+
+def dump_profiles(profiles_and_stars, profile_class, fragment_schema):
+    """
+    Serialize (profile, starred) result rows. Each profile is dumped once
+    per `version` and the fragment cached, so that only profiles missing
+    from the cache are serialized. Their tags are resolved from their tag id
+    arrays with the cached option values, so no tags are loaded. The viewer's
+    `starred` flag is added to each fragment.
+    """
+    cache = current_app.caches["profiles"]
+
+    fragments = {}
+
+    for profile, starred, *_ in profiles_and_stars:
+        entry = cache.get(profile_cache_key(profile_class, profile.id))
+
+        if entry is not None and entry[0] == profile.version:
+            fragments[profile.id] = entry[1]
+
+    missing_profiles = [
+        profile
+        for profile, starred, *_ in profiles_and_stars
+        if profile.id not in fragments
     ]
 
-    db.session.add_all(new_profile_relations)
-    db.session.commit()
+    if missing_profiles:
+        option_values = get_option_values(
+            _option_ids(missing_profiles, profile_class),
+            max(profile.version for profile in missing_profiles),
+        )
+
+        for profile in missing_profiles:
+            fragment = {
+                **fragment_schema.dump(profile),
+                **dump_option_fields(profile, profile_class, option_values),
+            }
+
+            cache.set(
+                profile_cache_key(profile_class, profile.id),
+                (profile.version, fragment),
+            )
+
+            fragments[profile.id] = fragment
+
+    return [
+        {**fragments[profile.id], "starred": starred}
+        for profile, starred, *_ in profiles_and_stars
+    ]
@@ -1,8 +1,122 @@
-def paginate(page):
-    size = 20
+import base64
+import binascii
+import json
+from typing import Any, Callable, List, NamedTuple, Optional, Tuple
 
+from sqlalchemy import and_, asc, desc, literal, or_
+
+
+DEFAULT_PAGE_SIZE = 20
+
+
+def paginate(page, size=DEFAULT_PAGE_SIZE):
     start = (page - 1) * size
 
     end = start + size
 
     return start, end
+
+
+def parse_string(value) -> str:
+    if not isinstance(value, str):
+        raise TypeError(f"Expected a string, got {value!r}")
+
+    return value
+
+
+def parse_bool(value) -> bool:
+    if not isinstance(value, bool):
+        raise TypeError(f"Expected a boolean, got {value!r}")
+
+    return value
+
+
+def parse_float(value) -> float:
+    # JSON has no separate integers, but bool is a subclass of int
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise TypeError(f"Expected a number, got {value!r}")
+
+    return float(value)
+
+
+class SortKey(NamedTuple):
+    """
+    One column of an ordering. `get_value` extracts the key from a result
+    row so it can be stored in a cursor, and
+    `parse_value` turns the stored JSON value back into something comparable
+    with `expression`, raising TypeError or ValueError if it has the wrong
+    type, since cursors come from clients.
+    """
+
+    expression: Any
+    descending: bool
+    get_value: Callable
+    parse_value: Callable
+
+    def ordering(self):
+        return desc(self.expression) if self.descending else asc(self.expression)
+
+
+class InvalidCursorError(Exception):
+    pass
+
+
+def encode_cursor(
+    sorting: str, values: List[Any], profile_count: Optional[int] = None
+) -> str:
+    data = json.dumps(
+        {"sorting": sorting, "values": values, "profile_count": profile_count}
+    ).encode("utf-8")
+
+    return base64.urlsafe_b64encode(data).decode("ascii")
+
+
+def decode_cursor(
+    cursor: str, sorting: str, sort_keys: List[SortKey]
+) -> Tuple[List[Any], Optional[int]]:
+    """
+    Return the sort key values and profile count stored in `cursor`.
+    """
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+
+        values = data["values"]
+        profile_count = data["profile_count"]
+
+        if data["sorting"] != sorting or len(values) != len(sort_keys):
+            raise InvalidCursorError
+
+        if profile_count is not None and not isinstance(profile_count, int):
+            raise InvalidCursorError
+
+        parsed_values = [
+            key.parse_value(value) for key, value in zip(sort_keys, values)
+        ]
+
+        return parsed_values, profile_count
+    except (binascii.Error, UnicodeError, TypeError, ValueError, KeyError):
+        raise InvalidCursorError
+
+
+def keyset_predicate(sort_keys: List[SortKey], values: List[Any]):
+    """
+    Rows that sort strictly after `values`: (a, b, c) > (x, y, z) expanded to
+    a > x OR (a = x AND b > y) OR (a = x AND b = y AND c > z), with the
+    comparison flipped for descending keys.
+    """
+    # Bind values explicitly, since SQLAlchemy won't compare with True/False
+    values = [literal(value) for value in values]
+
+    clauses = []
+
+    for index, (key, value) in enumerate(zip(sort_keys, values)):
+        preceding_equal = [
+            preceding.expression == preceding_value
+            for preceding, preceding_value in zip(sort_keys[:index], values)
+        ]
+
+        after = key.expression < value if key.descending else key.expression > value
+
+        clauses.append(and_(*preceding_equal, after))
+
+    return or_(*clauses)
@@ -1,4 +1,5 @@
 import os
+from contextlib import contextmanager
 from urllib.parse import urlparse
 
 import psycopg2
@@ -6,6 +7,7 @@ import pytest
 from pytest_postgresql.factories import DatabaseJanitor
 from server.app import create_app
 from server.models import db
+from server.query_stats import record_statements
 
 
 PG_VERSION = 12.2
@@ -83,3 +85,25 @@ class AuthActions:
 @pytest.fixture
 def auth(client):
     return AuthActions(client)
+
+
+@pytest.fixture
+def query_budget(_db):
+    """
+    Fail if the block runs more than `max_queries` statements, so that N+1
+    queries fail the test that introduces them:
+
+        with query_budget(2):
+            client.get("/api/profiles")
+    """
+
+    @contextmanager
+    def budget(max_queries: int):
+        with record_statements() as statements:
+            yield statements
+
+        assert len(statements) <= max_queries, "\n\n".join(
+            statement for statement, _ in statements
+        )
+
+    return budget
@@ -0,0 +1,81 @@
+from server.benchmark import percentile, run_benchmarks
+from server.models import FacultyProfile, ProfileStar, StudentProfile, VerificationToken
+from server.synthetic_data import (
+    SyntheticDataConfig,
+    generate_synthetic_data,
+    synthetic_profile_rows,
+)
+
+
+CONFIG = SyntheticDataConfig(
+    faculty_count=20,
+    student_count=5,
+    tags_per_profile=3,
+    star_density=0.1,
+    custom_tag_count=10,
+)
+
+
+def test_synthetic_rows_are_deterministic():
+    rows = list(synthetic_profile_rows(FacultyProfile, 20, CONFIG))
+
+    assert rows == list(synthetic_profile_rows(FacultyProfile, 20, CONFIG))
+    assert rows != list(
+        synthetic_profile_rows(FacultyProfile, 20, CONFIG._replace(seed=1))
+    )
+
+    custom_values = [
+        value
+        for row in rows
+        for values in row.values()
+        if isinstance(values, list)
+        for value in values
+        if value.startswith("Custom")
+    ]
+
+    # Faculty get their share of the custom tags, each on one profile
+    assert len(custom_values) == len(set(custom_values)) == 8
+
+
+def test_generate_synthetic_data(app, client):
+    result = generate_synthetic_data(CONFIG)
+
+    assert result.faculty.imported == 20
+    assert result.students.imported == 5
+    assert result.stars == 25 * 2
+
+    assert FacultyProfile.query.count() == 20
+    assert StudentProfile.query.count() == 5
+    assert ProfileStar.query.count() == 50
+
+    # Running it again doesn't duplicate anything
+    result = generate_synthetic_data(CONFIG)
+
+    assert result.faculty.imported == 0
+    assert result.stars == 0
+
+
+def test_run_benchmarks(app, client):
+    generate_synthetic_data(CONFIG)
+
+    run = run_benchmarks(iterations=2, name_filter="search-tags")
+
+    [result] = run["results"]
+
+    assert result["name"] == "GET /api/faculty-search-tags"
+    assert result["iterations"] == 2
+    assert result["p95_ms"] >= result["p50_ms"] > 0
+    assert result["query_count"] >= 1
+    assert result["rows_scanned"] > 0
+    assert run["profile_counts"]["faculty"] == 20
+
+    # The viewer's token is deleted after the run
+    assert VerificationToken.query.count() == 0
+
+
+def test_percentile():
+    samples = list(range(1, 101))
+
+    assert percentile(samples, 0.5) == 50
+    assert percentile(samples, 0.95) == 95
+    assert percentile([3.0], 0.95) == 3.0
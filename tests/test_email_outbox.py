@@ -0,0 +1,163 @@
+import datetime
+import http
+
+import pytest
+
+from server.emails.fake_email_backend import FakeEmailBackend
+from server.emails.outbox import MAX_ATTEMPTS, deliver_pending_emails
+from server.models import OutboxEmail, VerificationToken, save
+
+from .utils import create_test_verification_email
+
+
+EMAIL = "test@hms.harvard.edu"
+
+
+@pytest.fixture
+def outbox_app(app):
+    app.config["EMAIL_OUTBOX"] = True
+    app.email_backend = FakeEmailBackend()
+
+    return app
+
+
+def request_login(client):
+    create_test_verification_email(email=EMAIL)
+
+    response = client.post("/api/login", json={"email": EMAIL})
+
+    assert response.status_code == http.HTTPStatus.OK.value
+
+
+def make_due(outbox_email):
+    outbox_email.next_attempt_at = datetime.datetime.utcnow()
+    save(outbox_email)
+
+
+def test_login_email_queued_until_delivered(outbox_app, client):
+    request_login(client)
+
+    assert outbox_app.email_backend.sent_emails == []
+
+    outbox_email = OutboxEmail.query.one()
+
+    assert outbox_email.status == "pending"
+    assert outbox_email.verification_token.email_log is None
+
+    assert deliver_pending_emails(outbox_app.email_backend) == 1
+
+    [sent_email] = outbox_app.email_backend.sent_emails
+
+    assert sent_email["to"] == EMAIL
+    assert sent_email["subject"] == "Weave Faculty Login"
+
+    token = VerificationToken.query.one()
+
+    assert token.token in sent_email["html"]
+    assert token.email_log == f"Fake email sent to {EMAIL}"
+    assert OutboxEmail.query.one().status == "sent"
+
+    assert deliver_pending_emails(outbox_app.email_backend) == 0
+
+
+def test_failed_email_retried_later(outbox_app, client):
+    outbox_app.email_backend.failures = 1
+
+    request_login(client)
+
+    assert deliver_pending_emails(outbox_app.email_backend) == 1
+
+    outbox_email = OutboxEmail.query.one()
+
+    assert outbox_email.status == "pending"
+    assert outbox_email.attempts == 1
+    assert outbox_email.next_attempt_at > datetime.datetime.utcnow()
+    assert "FakeEmailDeliveryError" in outbox_email.last_error
+
+    # Not due yet
+    assert deliver_pending_emails(outbox_app.email_backend) == 0
+
+    make_due(outbox_email)
+
+    assert deliver_pending_emails(outbox_app.email_backend) == 1
+
+    assert OutboxEmail.query.one().status == "sent"
+    assert len(outbox_app.email_backend.sent_emails) == 1
+
+
+def test_email_abandoned_after_max_attempts(outbox_app, client):
+    outbox_app.email_backend.failures = MAX_ATTEMPTS
+
+    request_login(client)
+
+    for _ in range(MAX_ATTEMPTS):
+        make_due(OutboxEmail.query.one())
+
+        deliver_pending_emails(outbox_app.email_backend)
+
+    outbox_email = OutboxEmail.query.one()
+
+    assert outbox_email.status == "failed"
+    assert outbox_email.attempts == MAX_ATTEMPTS
+
+    make_due(outbox_email)
+
+    assert deliver_pending_emails(outbox_app.email_backend) == 0
+
+
+def test_rejected_email_marked_failed(outbox_app, client):
+    outbox_app.email_backend.rejected_recipients.add(EMAIL)
+
+    request_login(client)
+
+    assert deliver_pending_emails(outbox_app.email_backend) == 1
+
+    outbox_email = OutboxEmail.query.one()
+
+    assert outbox_email.status == "failed"
+    assert outbox_email.attempts == 1
+    assert outbox_email.last_error == f"Fake email to {EMAIL} rejected"
+    assert outbox_email.verification_token.email_log == outbox_email.last_error
+    assert outbox_app.email_backend.sent_emails == []
+
+
+def test_email_sent_immediately_without_outbox(app, client):
+    app.config["EMAIL_OUTBOX"] = False
+    app.email_backend = FakeEmailBackend()
+
+    request_login(client)
+
+    assert len(app.email_backend.sent_emails) == 1
+    assert OutboxEmail.query.count() == 0
+
+
+def test_send_emails_worker_survives_errors(outbox_app, client, monkeypatch):
+    request_login(client)
+
+    def fail_delivery(email_backend, batch_size):
+        raise RuntimeError("Database went away")
+
+    monkeypatch.setattr("server.cli.deliver_pending_emails", fail_delivery)
+
+    runner = outbox_app.test_cli_runner()
+
+    result = runner.invoke(args=["send-emails", "--once", "--poll-seconds", "0"])
+
+    assert result.exit_code == 0
+    assert OutboxEmail.query.one().status == "pending"
+
+    monkeypatch.undo()
+
+    result = runner.invoke(args=["send-emails", "--once", "--poll-seconds", "0"])
+
+    assert result.exit_code == 0
+    assert OutboxEmail.query.one().status == "sent"
+
+
+def test_rejected_email_recorded_without_outbox(app, client):
+    app.config["EMAIL_OUTBOX"] = False
+    app.email_backend = FakeEmailBackend(rejected_recipients=[EMAIL])
+
+    request_login(client)
+
+    assert VerificationToken.query.one().email_log == f"Fake email to {EMAIL} rejected"
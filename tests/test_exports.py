@@ -0,0 +1,97 @@
+import json
+
+from server.models import (
+    ActivityOption,
+    DegreeOption,
+    FacultyProfileActivity,
+    FacultyProfileDegree,
+    StudentProfile,
+    StudentProgramOption,
+    save,
+)
+from server.profile_import import read_csv
+
+from .utils import (
+    add_test_tags,
+    create_test_profile,
+    create_test_student_profile,
+    create_test_verification_token,
+)
+
+
+def run_export(app, tmp_path, file_name, *args):
+    path = tmp_path / file_name
+
+    runner = app.test_cli_runner()
+
+    result = runner.invoke(args=["export", *args, str(path)])
+
+    assert result.exit_code == 0, result.output
+
+    return path.read_text()
+
+
+def test_export_faculty_json_lines(app, client, tmp_path):
+    profile = create_test_profile(name="Jane Doe")
+
+    add_test_tags(profile, FacultyProfileActivity, ActivityOption, ["Surfing", "Art"])
+    add_test_tags(profile, FacultyProfileDegree, DegreeOption, ["MD"])
+
+    create_test_profile(name="John Smith")
+
+    # The command removes the session, so read the expected values first
+    profile_id = profile.id
+    email = profile.verification_email.email
+    date_created = profile.date_created.isoformat()
+
+    content = run_export(app, tmp_path, "faculty.jsonl", "faculty-profiles")
+
+    rows = [json.loads(line) for line in content.splitlines()]
+
+    assert sorted(row["name"] for row in rows) == ["Jane Doe", "John Smith"]
+
+    jane = next(row for row in rows if row["id"] == profile_id)
+
+    assert jane["email"] == email
+    assert jane["activities"] == ["Surfing", "Art"]
+    assert jane["degrees"] == ["MD"]
+    assert jane["clinical_specialties"] == []
+    assert jane["date_created"] == date_created
+    assert "search_document" not in jane
+
+
+def test_export_student_csv_can_be_imported(app, client, tmp_path):
+    program = save(StudentProgramOption(value="MD"))
+
+    profile = create_test_student_profile(name="Sam Student")
+    profile.program_id = program.id
+    save(profile)
+
+    profile_id = profile.id
+    available_for_mentoring = profile.available_for_mentoring
+
+    content = run_export(
+        app, tmp_path, "students.csv", "student-profiles", "--format", "csv"
+    )
+
+    (row,) = read_csv(content.splitlines(), StudentProfile)
+
+    assert row["id"] == profile_id
+    assert row["name"] == "Sam Student"
+    assert row["program"] == "MD"
+    assert row["available_for_mentoring"] is available_for_mentoring
+    assert "activities" not in row
+
+
+def test_export_tokens_with_emails(app, client, tmp_path):
+    token = create_test_verification_token()
+
+    token_value = token.token
+    email = token.email.email
+
+    content = run_export(app, tmp_path, "tokens.jsonl", "verification-tokens")
+
+    (row,) = [json.loads(line) for line in content.splitlines()]
+
+    assert row["token"] == token_value
+    assert row["email"] == email
@@ -94,3 +94,15 @@ def test_get_profile_starred_by_other_user(client, auth):
     assert response.status_code == HTTPStatus.OK.value
 
     assert not response.json["starred"]
+
+
+def test_get_profile_malformed_id(client, auth):
+    verification_token = create_test_verification_token()
+
+    auth.login(verification_token.token)
+
+    response = client.get("/api/profiles/not-a-profile-id")
+
+    assert response.status_code == HTTPStatus.NOT_FOUND.value
+
+    assert response.json["profile_id"] == ["Not found"]
@@ -1,8 +1,20 @@
 import http
 
-from server.models import ProfileStar, VerificationEmail, VerificationToken, save
+from sqlalchemy import event
 
-from .utils import create_test_profile, create_test_verification_token
+from server.models import (
+    ActivityOption,
+    DegreeOption,
+    FacultyProfileActivity,
+    FacultyProfileDegree,
+    ProfileStar,
+    VerificationEmail,
+    VerificationToken,
+    db,
+    save,
+)
+
+from .utils import add_test_tags, create_test_profile, create_test_verification_token
 
 
 def test_get_profiles_missing_token(client):
@@ -87,3 +99,75 @@ def test_get_profile_other_user_starred(client, auth):
     response = client.get("/api/profiles")
 
     assert not response.json["profiles"][0]["starred"]
+
+
+def test_get_profiles_count_modes(client, auth):
+    verification_token = create_test_verification_token()
+
+    for _ in range(3):
+        create_test_profile(available_for_mentoring=True)
+
+    auth.login(verification_token.token)
+
+    response = client.get("/api/profiles", query_string={"page_size": 2})
+    assert response.json["profile_count"] == 3
+    assert len(response.json["profiles"]) == 2
+
+    response = client.get("/api/profiles", query_string={"page_size": 2, "page": 3})
+    assert response.json == {"profile_count": 3, "profiles": []}
+
+    response = client.get("/api/profiles", query_string={"count": "none"})
+    assert response.json["profile_count"] is None
+    assert len(response.json["profiles"]) == 3
+
+    response = client.get("/api/profiles", query_string={"count": "estimate"})
+    assert isinstance(response.json["profile_count"], int)
+    assert len(response.json["profiles"]) == 3
+
+
+def test_get_profiles_invalid_count_mode(client, auth):
+    verification_token = create_test_verification_token()
+
+    auth.login(verification_token.token)
+
+    response = client.get("/api/profiles", query_string={"count": "lots"})
+
+    assert response.status_code == http.HTTPStatus.UNPROCESSABLE_ENTITY.value
+    assert response.json == {"count": ["invalid"]}
+
+
+def count_profile_page_queries(client, profile_count):
+    for _ in range(profile_count):
+        profile = create_test_profile(available_for_mentoring=True)
+
+        add_test_tags(profile, FacultyProfileActivity, ActivityOption, ["A", "B"])
+        add_test_tags(profile, FacultyProfileDegree, DegreeOption, ["MD", "PhD"])
+
+    # Warm up per-process caches so only the page queries are counted
+    client.get("/api/profiles")
+
+    statements = []
+
+    def count_statement(*args):
+        statements.append(args[2])
+
+    event.listen(db.engine, "before_cursor_execute", count_statement)
+
+    try:
+        response = client.get("/api/profiles")
+    finally:
+        event.remove(db.engine, "before_cursor_execute", count_statement)
+
+    assert len(response.json["profiles"]) >= profile_count
+
+    return len(statements)
+
+
+def test_get_profiles_query_count_independent_of_page_size(client, auth):
+    verification_token = create_test_verification_token()
+
+    auth.login(verification_token.token)
+
+    assert count_profile_page_queries(client, 2) == count_profile_page_queries(
+        client, 5
+    )
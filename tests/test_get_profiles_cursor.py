@@ -0,0 +1,158 @@
+import base64
+import datetime
+import http
+import json
+
+import pytest
+
+from server.models import ProfileStar, save
+
+from .utils import create_test_profile, create_test_verification_token
+
+
+SORTINGS = [
+    "starred",
+    "last_name_alphabetical",
+    "last_name_reverse_alphabetical",
+    "date_updated",
+]
+
+
+def create_profiles():
+    own_profile = create_test_profile(name="Own Profile", available_for_mentoring=True)
+
+    token = create_test_verification_token(
+        verification_email=own_profile.verification_email
+    )
+
+    names = ["Ann Zed", "Bob Young", "Cat Young", "Dee Xu", "Eve Wu", "Fay Wu"]
+
+    profiles = [
+        create_test_profile(
+            name=name,
+            date_updated=datetime.datetime(2019, 1, 1 + index % 3),
+            available_for_mentoring=True,
+        )
+        for index, name in enumerate(names)
+    ]
+
+    for profile in profiles[1:3]:
+        save(
+            ProfileStar(
+                from_verification_email_id=token.email_id,
+                to_verification_email_id=profile.verification_email_id,
+            )
+        )
+
+    return token
+
+
+@pytest.mark.parametrize("sorting", SORTINGS)
+def test_cursor_pages_match_offset_pages(client, auth, sorting):
+    token = create_profiles()
+
+    auth.login(token.token)
+
+    response = client.get(
+        "/api/profiles", query_string={"sorting": sorting, "page_size": 100}
+    )
+
+    expected_ids = [profile["id"] for profile in response.json["profiles"]]
+
+    assert len(expected_ids) == 7
+
+    cursor_ids = []
+    cursor = ""
+
+    while cursor is not None:
+        response = client.get(
+            "/api/profiles",
+            query_string={"sorting": sorting, "page_size": 2, "cursor": cursor},
+        )
+
+        assert response.status_code == http.HTTPStatus.OK.value, response.json
+        assert response.json["profile_count"] == 7
+        assert len(response.json["profiles"]) <= 2
+
+        cursor_ids.extend(profile["id"] for profile in response.json["profiles"])
+        cursor = response.json["next_cursor"]
+
+    assert cursor_ids == expected_ids
+
+
+def test_cursor_for_other_sorting_rejected(client, auth):
+    token = create_profiles()
+
+    auth.login(token.token)
+
+    response = client.get(
+        "/api/profiles",
+        query_string={"sorting": "date_updated", "page_size": 2, "cursor": ""},
+    )
+
+    response = client.get(
+        "/api/profiles",
+        query_string={"sorting": "starred", "cursor": response.json["next_cursor"]},
+    )
+
+    assert response.status_code == http.HTTPStatus.UNPROCESSABLE_ENTITY.value
+    assert response.json == {"cursor": ["invalid"]}
+
+
+def test_invalid_cursor(client, auth):
+    token = create_test_verification_token()
+
+    auth.login(token.token)
+
+    response = client.get("/api/profiles", query_string={"cursor": "not a cursor"})
+
+    assert response.status_code == http.HTTPStatus.UNPROCESSABLE_ENTITY.value
+    assert response.json == {"cursor": ["invalid"]}
+
+
+@pytest.mark.parametrize(
+    "sorting, values",
+    [
+        ("last_name_alphabetical", [True, {"a": 1}, "x"]),
+        ("starred", [True, "yes", "2019-01-01T00:00:00", "x"]),
+        ("date_updated", [1, "2019-01-01T00:00:00", "x"]),
+    ],
+)
+def test_wrongly_typed_cursor_rejected(client, auth, sorting, values):
+    token = create_profiles()
+
+    auth.login(token.token)
+
+    data = {"sorting": sorting, "values": values, "profile_count": None}
+    cursor = base64.urlsafe_b64encode(json.dumps(data).encode("utf-8"))
+
+    response = client.get(
+        "/api/profiles", query_string={"sorting": sorting, "cursor": cursor}
+    )
+
+    assert response.status_code == http.HTTPStatus.UNPROCESSABLE_ENTITY.value
+    assert response.json == {"cursor": ["invalid"]}
+
+
+def test_page_size_capped(client, auth, app):
+    app.config["MAX_PAGE_SIZE"] = 3
+
+    token = create_profiles()
+
+    auth.login(token.token)
+
+    response = client.get("/api/profiles", query_string={"page_size": 50})
+
+    assert response.json["profile_count"] == 7
+    assert len(response.json["profiles"]) == 3
+
+
+def test_invalid_page_size(client, auth):
+    token = create_test_verification_token()
+
+    auth.login(token.token)
+
+    response = client.get("/api/profiles", query_string={"page_size": 0})
+
+    assert response.status_code == http.HTTPStatus.UNPROCESSABLE_ENTITY.value
+    assert response.json == {"page_size": ["invalid"]}
@@ -1,6 +1,7 @@
 import datetime
 import http
 
+from server.models import save
 
 from .utils import create_test_profile, create_test_verification_token
 
@@ -44,3 +45,52 @@ def test_sort_profiles_by_date_updated(client, auth):
     assert results[0]["id"] == own_profile.id
     assert results[1]["id"] == recently_updated_profile.id
     assert results[2]["id"] == not_recently_updated_profile.id
+
+
+def test_sort_profiles_by_last_name(client, auth):
+    token = create_test_verification_token(is_faculty=False)
+
+    names = ["Ann Zimmer ", "bo baker", "Cy  Moss", "Adams"]
+
+    for name in names:
+        create_test_profile(name=name, available_for_mentoring=True)
+
+    auth.login(token.token)
+
+    # Sorted by the last word of the name, ignoring case and extra spaces
+    response = client.get("/api/profiles?sorting=last_name_alphabetical")
+
+    assert [profile["name"] for profile in response.json["profiles"]] == [
+        "Adams",
+        "bo baker",
+        "Cy  Moss",
+        "Ann Zimmer ",
+    ]
+
+    response = client.get("/api/profiles?sorting=last_name_reverse_alphabetical")
+
+    assert [profile["name"] for profile in response.json["profiles"]] == [
+        "Ann Zimmer ",
+        "Cy  Moss",
+        "bo baker",
+        "Adams",
+    ]
+
+
+def test_sort_by_last_name_after_rename(client, auth):
+    token = create_test_verification_token(is_faculty=False)
+
+    profile = create_test_profile(name="Ann Adams", available_for_mentoring=True)
+    create_test_profile(name="Bo Baker", available_for_mentoring=True)
+
+    profile.name = "Ann Young"
+    save(profile)
+
+    auth.login(token.token)
+
+    response = client.get("/api/profiles?sorting=last_name_alphabetical")
+
+    assert [profile["name"] for profile in response.json["profiles"]] == [
+        "Bo Baker",
+        "Ann Young",
+    ]
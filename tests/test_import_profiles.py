@@ -0,0 +1,143 @@
+import json
+
+from server.models import FacultyProfile, StudentProfile, VerificationEmail
+from server.queries import query_faculty_searchable_tags
+
+from .utils import create_test_profile
+
+
+FACULTY_ROWS = [
+    {
+        "name": "Jane Doe",
+        "contact_email": "jane@test.com",
+        "clinical_specialties": ["Cardiology", " Cardiology "],
+        "activities": ["Hiking"],
+        "degrees": ["MD"],
+        "willing_shadowing": True,
+    },
+    {
+        "name": "John Smith",
+        "contact_email": "john@test.com",
+        "email": "John@hms.harvard.edu",
+        "activities": ["Hiking", "Surfing"],
+        "available_for_mentoring": False,
+    },
+]
+
+
+def run_import(app, tmp_path, file_name, content, *args):
+    path = tmp_path / file_name
+    path.write_text(content)
+
+    runner = app.test_cli_runner()
+
+    return runner.invoke(args=["import-profiles", str(path), *args])
+
+
+def test_import_faculty_json_lines(app, client, tmp_path):
+    content = "\n".join(json.dumps(row) for row in FACULTY_ROWS)
+
+    result = run_import(app, tmp_path, "faculty.jsonl", content, "--batch-size", "1")
+
+    assert result.exit_code == 0, result.output
+    assert "Imported 2 profiles, skipped 0" in result.output
+
+    jane = FacultyProfile.query.filter_by(name="Jane Doe").one()
+
+    assert [tag.tag.value for tag in jane.clinical_specialties] == ["Cardiology"]
+    assert [tag.tag.value for tag in jane.degrees] == ["MD"]
+    assert jane.willing_shadowing is True
+    assert jane.available_for_mentoring is True
+    assert jane.cadence == "monthly"
+    assert jane.verification_email.email == "jane@test.com"
+    assert jane.verification_email.is_faculty is True
+    assert jane.search_document is not None
+
+    john = FacultyProfile.query.filter_by(name="John Smith").one()
+
+    assert john.verification_email.email == "john@hms.harvard.edu"
+    assert sorted(tag.tag.value for tag in john.activities) == ["Hiking", "Surfing"]
+
+    # Only available profiles' tags are searchable
+    tags = query_faculty_searchable_tags()
+
+    assert tags["activities"] == ["Hiking"]
+    assert tags["clinical_specialties"] == ["Cardiology"]
+
+
+def test_import_skips_existing_profiles(app, client, tmp_path):
+    create_test_profile(email="jane@test.com")
+
+    content = "\n".join(json.dumps(row) for row in FACULTY_ROWS + FACULTY_ROWS)
+
+    result = run_import(app, tmp_path, "faculty.jsonl", content)
+
+    assert result.exit_code == 0, result.output
+    assert "Imported 1 profiles, skipped 3" in result.output
+
+    assert FacultyProfile.query.count() == 2
+
+
+def test_import_students_csv(app, client, tmp_path):
+    content = (
+        "name,contact_email,program,activities,willing_research\n"
+        "Sam Lee,sam@test.com,MD,Running;Chess,yes\n"
+        "Kim Park,kim@test.com,,,\n"
+    )
+
+    result = run_import(
+        app, tmp_path, "students.csv", content, "--profile-type", "student"
+    )
+
+    assert result.exit_code == 0, result.output
+
+    sam = StudentProfile.query.filter_by(name="Sam Lee").one()
+
+    assert sam.program.value == "MD"
+    assert [tag.tag.value for tag in sam.activities] == ["Running", "Chess"]
+    assert sam.willing_research is True
+    assert sam.verification_email.is_faculty is False
+
+    kim = StudentProfile.query.filter_by(name="Kim Park").one()
+
+    assert kim.program is None
+    assert kim.activities == []
+
+
+def test_import_reports_invalid_rows(app, client, tmp_path):
+    content = json.dumps({"name": "No Email"})
+
+    result = run_import(app, tmp_path, "faculty.jsonl", content)
+
+    assert result.exit_code != 0
+    assert "Line 1: contact_email is required" in result.output
+    assert VerificationEmail.query.count() == 0
+
+
+def test_import_reports_tags_that_are_not_strings(app, client, tmp_path):
+    row = {"name": "Jane Doe", "contact_email": "jane@test.com", "activities": [1]}
+
+    result = run_import(app, tmp_path, "faculty.jsonl", json.dumps(row))
+
+    assert result.exit_code != 0
+    assert "Line 1: activities must be a list of strings" in result.output
+    assert VerificationEmail.query.count() == 0
+
+
+def test_import_reports_rows_the_database_refuses(app, client, tmp_path):
+    rows = [
+        *FACULTY_ROWS,
+        {"name": "New Tag", "contact_email": "new@test.com", "activities": ["Chess"]},
+        {"name": "Long", "contact_email": "long@test.com", "activities": ["x" * 51]},
+    ]
+
+    content = "\n".join(json.dumps(row) for row in rows)
+
+    result = run_import(app, tmp_path, "faculty.jsonl", content, "--batch-size", "2")
+
+    assert result.exit_code != 0
+    assert "Line 4: value too long for type character varying(50)" in result.output
+
+    # Earlier batches stay imported
+    assert FacultyProfile.query.count() == 2
+    assert VerificationEmail.query.count() == 2
@@ -0,0 +1,64 @@
+from server.models import FacultyProfile, db
+from server.queries import explain
+from server.views.api import (
+    faculty_directory_queryset,
+    get_sort_keys,
+    lists_own_profile,
+)
+
+from .utils import create_test_profile, create_test_verification_email
+
+
+def explain_first_page(verification_email, sorting):
+    """
+    The plan of the first /api/profiles page, with sequential scans disabled
+    so that the few test rows don't hide whether an index can be used.
+    """
+    sort_keys = get_sort_keys(
+        sorting,
+        FacultyProfile,
+        verification_email.id,
+        own_profile_first=lists_own_profile(verification_email, FacultyProfile),
+    )
+
+    page_queryset = (
+        faculty_directory_queryset("", "", "", "", verification_email.id)
+        .order_by(*[sort_key.ordering() for sort_key in sort_keys])
+        .limit(20)
+    )
+
+    db.session.execute("SET LOCAL enable_seqscan = off")
+
+    return "\n".join(line for line, in explain(page_queryset, "COSTS OFF"))
+
+
+def create_profiles():
+    for index in range(10):
+        create_test_profile(name=f"Profile {index}", available_for_mentoring=True)
+
+
+def test_date_updated_page_read_from_index(client):
+    create_profiles()
+
+    student_email = create_test_verification_email(is_faculty=False)
+
+    plan = explain_first_page(student_email, "date_updated")
+
+    assert "Index Scan Backward using ix_faculty_profile_date_updated" in plan
+    assert "Sort" not in plan
+
+
+def test_last_name_pages_read_from_index(client):
+    create_profiles()
+
+    student_email = create_test_verification_email(is_faculty=False)
+
+    plan = explain_first_page(student_email, "last_name_alphabetical")
+
+    assert "Index Scan using ix_faculty_profile_last_name_sort_key" in plan
+    assert "Sort" not in plan
+
+    plan = explain_first_page(student_email, "last_name_reverse_alphabetical")
+
+    assert "Index Scan Backward using ix_faculty_profile_last_name_sort_key" in plan
+    assert "Sort" not in plan
@@ -1,7 +1,30 @@
-from server.models import ProfileStar, save
+from server.models import (
+    ActivityOption,
+    ClinicalSpecialtyOption,
+    DegreeOption,
+    FacultyClinicalSpecialty,
+    FacultyHospitalAffiliation,
+    FacultyProfileActivity,
+    FacultyProfileDegree,
+    HospitalAffiliationOption,
+    ProfileStar,
+    save,
+)
 from server.queries import matching_faculty_profiles
 
-from .utils import create_test_profile, create_test_verification_email
+from .utils import add_test_tags, create_test_profile, create_test_verification_email
+
+
+def matching_profile_ids(verification_email_id, tags="", degrees="", affiliations=""):
+    profiles = matching_faculty_profiles(
+        query="",
+        tags=tags,
+        degrees=degrees,
+        affiliations=affiliations,
+        verification_email_id=verification_email_id,
+    )
+
+    return sorted(profile.id for profile, _ in profiles)
 
 
 def test_matching_profiles_starred_profile(db_session):
@@ -61,3 +84,104 @@ def test_matching_profiles_empty(db_session):
     )
 
     assert list(profiles) == []
+
+
+def test_matching_profiles_with_many_tags_not_duplicated(db_session):
+    user_email = create_test_verification_email()
+
+    profile = create_test_profile(available_for_mentoring=True)
+
+    add_test_tags(
+        profile, FacultyProfileActivity, ActivityOption, ["Hiking", "Surfing"]
+    )
+    add_test_tags(
+        profile, FacultyClinicalSpecialty, ClinicalSpecialtyOption, ["A", "B", "C"]
+    )
+    add_test_tags(profile, FacultyProfileDegree, DegreeOption, ["MD", "PhD"])
+
+    save(
+        ProfileStar(
+            from_verification_email_id=user_email.id,
+            to_verification_email_id=profile.verification_email_id,
+        )
+    )
+
+    profiles = list(
+        matching_faculty_profiles(
+            query="",
+            tags="hiking",
+            degrees="phd",
+            affiliations="",
+            verification_email_id=user_email.id,
+        )
+    )
+
+    assert profiles == [(profile, 1)]
+
+
+def test_matching_profiles_tags(db_session):
+    user_email = create_test_verification_email()
+
+    hiker = create_test_profile(available_for_mentoring=True)
+    add_test_tags(hiker, FacultyProfileActivity, ActivityOption, ["Hiking"])
+
+    cardiologist = create_test_profile(available_for_mentoring=True)
+    add_test_tags(
+        cardiologist, FacultyClinicalSpecialty, ClinicalSpecialtyOption, ["Cardiology"]
+    )
+    add_test_tags(cardiologist, FacultyProfileActivity, ActivityOption, ["Hiking"])
+
+    assert matching_profile_ids(user_email.id, tags="hiking") == sorted(
+        [hiker.id, cardiologist.id]
+    )
+    assert matching_profile_ids(user_email.id, tags="hiking,cardiology") == [
+        cardiologist.id
+    ]
+    assert matching_profile_ids(user_email.id, tags="surfing") == []
+
+
+def test_matching_profiles_degrees(db_session):
+    user_email = create_test_verification_email()
+
+    md = create_test_profile(available_for_mentoring=True)
+    add_test_tags(md, FacultyProfileDegree, DegreeOption, ["MD"])
+
+    do_phd = create_test_profile(available_for_mentoring=True)
+    add_test_tags(do_phd, FacultyProfileDegree, DegreeOption, ["DO", "PhD"])
+
+    dds = create_test_profile(available_for_mentoring=True)
+    add_test_tags(dds, FacultyProfileDegree, DegreeOption, ["DDS"])
+
+    assert matching_profile_ids(user_email.id, degrees="md / do") == sorted(
+        [md.id, do_phd.id]
+    )
+    assert matching_profile_ids(user_email.id, degrees="md / do,phd") == [do_phd.id]
+    assert matching_profile_ids(user_email.id, degrees="dmd / dds") == [dds.id]
+    assert matching_profile_ids(user_email.id, degrees="md") == [md.id]
+
+
+def test_matching_profiles_affiliations(db_session):
+    user_email = create_test_verification_email()
+
+    profile = create_test_profile(available_for_mentoring=True)
+    add_test_tags(
+        profile,
+        FacultyHospitalAffiliation,
+        HospitalAffiliationOption,
+        ["Boston Children's Hospital", "McLean Hospital"],
+    )
+
+    other_profile = create_test_profile(available_for_mentoring=True)
+    add_test_tags(
+        other_profile,
+        FacultyHospitalAffiliation,
+        HospitalAffiliationOption,
+        ["McLean Hospital"],
+    )
+
+    assert matching_profile_ids(
+        user_email.id, affiliations="mclean hospital"
+    ) == sorted([profile.id, other_profile.id])
+    assert matching_profile_ids(
+        user_email.id, affiliations="boston children's hospital,mclean hospital"
+    ) == [profile.id]
@@ -0,0 +1,135 @@
+import http
+
+from server.cache import profile_cache_key
+from server.models import (
+    ActivityOption,
+    FacultyProfile,
+    FacultyProfileActivity,
+    ProfileStar,
+    db,
+    save,
+)
+from server.queries import update_option_profiles
+
+from .test_search_profiles import PROFILE
+from .utils import add_test_tags, create_test_profile, create_test_verification_token
+
+
+def get_profile_names(client):
+    response = client.get("/api/profiles")
+
+    return [profile["name"] for profile in response.json["profiles"]]
+
+
+def test_profiles_served_from_cache(app, client, auth):
+    profile = create_test_profile(name="Jane Doe", available_for_mentoring=True)
+
+    token = create_test_verification_token()
+
+    auth.login(token.token)
+
+    assert get_profile_names(client) == ["Jane Doe"]
+
+    cache = app.caches["profiles"]
+    cache_key = profile_cache_key(FacultyProfile, profile.id)
+
+    version, fragment = cache.get(cache_key)
+
+    # Fragments are served as long as the profile's version is unchanged
+    cache.set(cache_key, (version, {**fragment, "name": "Cached"}))
+
+    assert get_profile_names(client) == ["Cached"]
+
+    # Writes that skip the application, such as in another process, still
+    # bump the version
+    FacultyProfile.query.filter(FacultyProfile.id == profile.id).update(
+        {FacultyProfile.name: "Jane Smith"}
+    )
+    db.session.commit()
+
+    assert get_profile_names(client) == ["Jane Smith"]
+
+
+def test_option_rename_invalidates_cached_profiles(client, auth):
+    profile = create_test_profile(available_for_mentoring=True)
+
+    add_test_tags(profile, FacultyProfileActivity, ActivityOption, ["Surfing"])
+
+    auth.login(create_test_verification_token().token)
+
+    response = client.get("/api/profiles")
+    assert response.json["profiles"][0]["activities"] == ["Surfing"]
+
+    # Renamed as the admin does, but leaving this process's caches alone as
+    # in another process
+    option = ActivityOption.query.filter(ActivityOption.value == "Surfing").one()
+    option.value = "Sailing"
+
+    update_option_profiles(ActivityOption, option.id)
+    db.session.commit()
+
+    response = client.get("/api/profiles")
+    assert response.json["profiles"][0]["activities"] == ["Sailing"]
+
+
+def test_cached_profiles_starred_per_viewer(client, auth):
+    profile = create_test_profile(available_for_mentoring=True)
+
+    starring_token = create_test_verification_token()
+
+    save(
+        ProfileStar(
+            from_verification_email_id=starring_token.email_id,
+            to_verification_email_id=profile.verification_email_id,
+        )
+    )
+
+    auth.login(starring_token.token)
+
+    response = client.get("/api/profiles")
+    assert response.json["profiles"][0]["starred"] is True
+
+    response = client.get(f"/api/profiles/{profile.id}")
+    assert response.json["starred"] is True
+
+    client.post("/api/logout")
+
+    auth.login(create_test_verification_token().token)
+
+    response = client.get("/api/profiles")
+    assert response.json["profiles"][0]["starred"] is False
+
+    response = client.get(f"/api/profiles/{profile.id}")
+    assert response.json["starred"] is False
+
+
+def test_admin_edit_invalidates_cached_profile(client, auth):
+    token = create_test_verification_token()
+
+    auth.login(token.token)
+
+    profile_id = client.post("/api/profile", json=PROFILE).json["id"]
+
+    client.post("/api/availability", json={"available": True})
+
+    assert get_profile_names(client) == ["Jane Doe"]
+
+    client.post("/api/logout")
+
+    admin_token = create_test_verification_token(is_admin=True)
+    admin_token.email.is_admin = True
+    save(admin_token)
+
+    auth.login(admin_token.token)
+
+    update = {**PROFILE, "name": "Jane Smith", "activities": ["Surfing"]}
+
+    response = client.put(f"/api/profiles/{profile_id}", json=update)
+    assert response.status_code == http.HTTPStatus.OK.value
+
+    response = client.get("/api/profiles")
+
+    [profile] = response.json["profiles"]
+
+    assert profile["name"] == "Jane Smith"
+    assert profile["activities"] == ["Surfing"]
@@ -0,0 +1,34 @@
+from server.models import ActivityOption, FacultyProfile, FacultyProfileActivity, db
+from server.profile_id_migration import PROFILE_ID_COLUMNS, migrate_profile_ids
+
+from .utils import add_test_tags, create_test_profile
+
+
+def test_migrate_profile_ids(db_session):
+    profile = create_test_profile()
+
+    add_test_tags(profile, FacultyProfileActivity, ActivityOption, ["Hiking"])
+
+    connection = db.session.connection()
+
+    # As created before profile ids were uuids
+    for table_name, column_name in PROFILE_ID_COLUMNS:
+        connection.execute(
+            f"ALTER TABLE {table_name} ALTER COLUMN {column_name} TYPE varchar"
+        )
+
+    assert migrate_profile_ids(connection) == [
+        "faculty_profile.id",
+        "student_profile.id",
+        "profile_tag.profile_id",
+    ]
+
+    db.session.expire_all()
+
+    # Ids are still strings, and tags still find their profiles
+    assert FacultyProfile.query.get(profile.id).id == profile.id
+    assert [str(tag) for tag in FacultyProfile.query.get(profile.id).activities] == [
+        "Hiking"
+    ]
+
+    assert migrate_profile_ids(connection) == []
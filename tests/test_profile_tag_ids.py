@@ -0,0 +1,95 @@
+from server.models import (
+    ActivityOption,
+    DegreeOption,
+    FacultyProfile,
+    FacultyProfileActivity,
+    FacultyProfileDegree,
+    db,
+    save,
+)
+from server.queries import matching_faculty_profiles
+
+from .test_matching_faculty_profiles import matching_profile_ids
+from .test_update_profile import PROFILE_UPDATE
+from .utils import (
+    add_test_tags,
+    create_test_profile,
+    create_test_verification_email,
+    create_test_verification_token,
+)
+
+
+def option_ids(option_class, values):
+    return [
+        option_class.query.filter(option_class.value == value).one().id
+        for value in values
+    ]
+
+
+def test_tag_ids_follow_orm_writes(db_session):
+    profile = create_test_profile()
+
+    add_test_tags(profile, FacultyProfileActivity, ActivityOption, ["Hiking", "Chess"])
+    add_test_tags(profile, FacultyProfileDegree, DegreeOption, ["MD"])
+
+    assert profile.activity_ids == option_ids(ActivityOption, ["Hiking", "Chess"])
+    assert profile.degree_ids == option_ids(DegreeOption, ["MD"])
+    assert profile.affiliation_ids == []
+
+    db.session.delete(profile.activities[0])
+    db.session.commit()
+
+    assert profile.activity_ids == option_ids(ActivityOption, ["Chess"])
+
+
+def test_tag_ids_follow_profile_updates(client, auth):
+    profile = create_test_profile()
+
+    token = create_test_verification_token(
+        verification_email=profile.verification_email
+    )
+
+    auth.login(token.token)
+
+    profile_update = {**PROFILE_UPDATE, "activities": ["Sailing", "Hiking"]}
+
+    client.put(f"/api/profiles/{profile.id}", json=profile_update)
+
+    profile = FacultyProfile.query.get(profile.id)
+
+    assert profile.activity_ids == option_ids(ActivityOption, ["Sailing", "Hiking"])
+
+    response = client.get("/api/profiles", query_string={"tags": "sailing,hiking"})
+
+    assert response.json["profiles"][0]["activities"] == ["Sailing", "Hiking"]
+
+
+def test_tag_filters_test_tag_id_arrays(db_session):
+    user_email = create_test_verification_email()
+
+    profile = create_test_profile(available_for_mentoring=True)
+
+    add_test_tags(profile, FacultyProfileActivity, ActivityOption, ["Hiking", "Chess"])
+    add_test_tags(profile, FacultyProfileDegree, DegreeOption, ["DO"])
+
+    save(DegreeOption(value="MD"))
+
+    query = matching_faculty_profiles(
+        query="",
+        tags="hiking,chess",
+        degrees="md / do",
+        affiliations="",
+        verification_email_id=user_email.id,
+    )
+
+    statement = str(query.statement)
+
+    # One containment test for both activities, an overlap test for the
+    # degree aliases, and no lookups in profile_tag
+    assert statement.count("@>") == 1
+    assert statement.count("&&") == 1
+    assert "profile_tag" not in statement
+
+    assert [row[0].id for row in query] == [profile.id]
+
+    assert matching_profile_ids(user_email.id, tags="hiking,golf") == []
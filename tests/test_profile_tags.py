@@ -0,0 +1,146 @@
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from server.models import (
+    ActivityOption,
+    DegreeOption,
+    FacultyProfile,
+    FacultyProfileActivity,
+    FacultyProfileDegree,
+    ProfileTag,
+    StudentProfileActivity,
+    db,
+    save,
+)
+from server.profile_tag_migration import migrate_profile_tags
+
+from .test_matching_faculty_profiles import matching_profile_ids
+from .utils import (
+    add_test_tags,
+    create_test_profile,
+    create_test_student_profile,
+    create_test_verification_email,
+)
+
+
+def test_profile_relations_load_their_own_tags(db_session):
+    profile = create_test_profile()
+    student_profile = create_test_student_profile()
+
+    add_test_tags(profile, FacultyProfileActivity, ActivityOption, ["Hiking", "Chess"])
+    add_test_tags(profile, FacultyProfileDegree, DegreeOption, ["MD"])
+    add_test_tags(student_profile, StudentProfileActivity, ActivityOption, ["Golf"])
+
+    db.session.expire_all()
+
+    assert [str(tag) for tag in profile.activities] == ["Hiking", "Chess"]
+    assert [str(tag) for tag in profile.degrees] == ["MD"]
+    assert [str(tag) for tag in student_profile.activities] == ["Golf"]
+
+    [tag] = FacultyProfileDegree.query.all()
+
+    assert (tag.profile_type, tag.tag_type) == ("faculty_profile", "degree_option")
+    assert tag.profile.id == profile.id
+
+
+def test_tag_filters_match_tag_type(db_session):
+    user_email = create_test_verification_email()
+
+    profile = create_test_profile(available_for_mentoring=True)
+
+    save(ActivityOption(value="Hiking"))
+    activity = save(ActivityOption(value="Chess"))
+    degree = save(DegreeOption(value="MD"))
+
+    # Ids only identify an option together with its type
+    assert activity.id != degree.id
+
+    save(FacultyProfileActivity(profile_id=profile.id, tag_id=activity.id))
+    save(FacultyProfileDegree(profile_id=profile.id, tag_id=degree.id))
+
+    assert matching_profile_ids(user_email.id, degrees="md") == [profile.id]
+    assert matching_profile_ids(user_email.id, tags="md") == []
+
+
+def test_migrate_profile_tags(db_session):
+    profile = create_test_profile()
+
+    hiking = save(ActivityOption(value="Hiking"))
+    chess = save(ActivityOption(value="Chess"))
+
+    connection = db.session.connection()
+
+    connection.execute(
+        "CREATE TABLE faculty_profile_activity"
+        " (id SERIAL PRIMARY KEY, profile_id VARCHAR NOT NULL, tag_id INTEGER)"
+    )
+
+    connection.execute(
+        "INSERT INTO faculty_profile_activity (profile_id, tag_id)"
+        " VALUES (%(profile_id)s, %(chess)s), (%(profile_id)s, %(hiking)s),"
+        " (%(profile_id)s, %(chess)s)",
+        {"profile_id": profile.id, "chess": chess.id, "hiking": hiking.id},
+    )
+
+    assert migrate_profile_tags(connection) == {"faculty_profile_activity": 2}
+
+    db.session.expire_all()
+
+    # Duplicates are dropped, and the order the tags were saved in is kept
+    assert [str(tag) for tag in FacultyProfile.query.get(profile.id).activities] == [
+        "Chess",
+        "Hiking",
+    ]
+
+    assert ProfileTag.query.count() == 2
+
+    # The old table is gone, so running it again does nothing
+    assert migrate_profile_tags(connection) == {}
+
+
+def test_option_in_use_cannot_be_deleted(app, client):
+    profile = create_test_profile()
+
+    add_test_tags(profile, FacultyProfileActivity, ActivityOption, ["Hiking"])
+    unused_option = save(ActivityOption(value="Chess"))
+
+    db.session.delete(ActivityOption.query.filter_by(value="Hiking").one())
+
+    with pytest.raises(IntegrityError):
+        db.session.commit()
+
+    db.session.rollback()
+
+    assert [str(tag) for tag in profile.activities] == ["Hiking"]
+
+    db.session.delete(unused_option)
+    db.session.commit()
+
+    assert [option.value for option in ActivityOption.query] == ["Hiking"]
+
+
+def test_tags_must_reference_existing_rows(app, client):
+    profile = create_test_profile()
+    degree = save(DegreeOption(value="MD"))
+
+    # A degree id isn't an activity id
+    db.session.add(FacultyProfileActivity(profile_id=profile.id, tag_id=degree.id))
+
+    with pytest.raises(IntegrityError):
+        db.session.commit()
+
+    db.session.rollback()
+
+    assert ProfileTag.query.count() == 0
+
+
+def test_deleting_profile_deletes_its_tags(app, client):
+    profile = create_test_profile()
+
+    add_test_tags(profile, FacultyProfileActivity, ActivityOption, ["Hiking"])
+
+    db.session.delete(profile)
+    db.session.commit()
+
+    assert ProfileTag.query.count() == 0
+    assert ActivityOption.query.count() == 1
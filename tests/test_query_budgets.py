@@ -0,0 +1,117 @@
+from server.models import (
+    ActivityOption,
+    DegreeOption,
+    FacultyProfileActivity,
+    FacultyProfileDegree,
+)
+
+from .test_update_profile import PROFILE_UPDATE
+from .utils import add_test_tags, create_test_profile, create_test_verification_token
+
+
+def create_profiles(count):
+    own_profile = profile = create_test_profile(available_for_mentoring=True)
+
+    for _ in range(count):
+        profile = create_test_profile(available_for_mentoring=True)
+
+        add_test_tags(profile, FacultyProfileActivity, ActivityOption, ["A", "B"])
+        add_test_tags(profile, FacultyProfileDegree, DegreeOption, ["MD"])
+
+    token = create_test_verification_token(
+        verification_email=own_profile.verification_email
+    )
+
+    return own_profile, profile, token
+
+
+def login(client, auth, token):
+    auth.login(token.token)
+
+    # Cache the token, so that requests only read its state
+    client.get("/api/account")
+
+
+def test_get_profiles_query_budget(client, auth, query_budget):
+    _, _, token = create_profiles(5)
+
+    login(client, auth, token)
+
+    # The token's state and the page, and the viewer's stars, the option ids,
+    # and the option values with the profile version they are current for on
+    # first use. Tags are serialized from the profiles' tag id arrays, so none
+    # are loaded.
+    with query_budget(6):
+        client.get("/api/profiles")
+
+    with query_budget(2):
+        client.get("/api/profiles")
+
+
+def test_get_profile_query_budget(client, auth, query_budget):
+    _, profile, token = create_profiles(1)
+
+    login(client, auth, token)
+
+    client.get(f"/api/profiles/{profile.id}")
+
+    with query_budget(2):
+        client.get(f"/api/profiles/{profile.id}")
+
+
+def test_tags_query_budget(client, auth, query_budget):
+    _, _, token = create_profiles(2)
+
+    login(client, auth, token)
+
+    with query_budget(3):
+        client.get("/api/faculty-search-tags")
+
+    with query_budget(3):
+        client.get("/api/profile-tags")
+
+
+def test_account_query_budget(client, auth, query_budget):
+    _, _, token = create_profiles(0)
+
+    login(client, auth, token)
+
+    with query_budget(2):
+        client.get("/api/account")
+
+
+def test_update_profile_query_budget(client, auth, query_budget):
+    own_profile, _, token = create_profiles(1)
+
+    login(client, auth, token)
+
+    profile_update = {
+        **PROFILE_UPDATE,
+        "activities": ["A", "C", "D", "E", "F"],
+        "degrees": ["MD", "PhD"],
+    }
+
+    # Independent of the number of tags: one statement each to read the
+    # token's state, to read, delete and insert tags and to lock them in the
+    # catalog, and one per kind of tag for the catalog refresh and the
+    # response
+    with query_budget(24):
+        client.put(f"/api/profiles/{own_profile.id}", json=profile_update)
+
+
+def test_server_timing_in_debug(app, client, auth):
+    _, _, token = create_profiles(1)
+
+    login(client, auth, token)
+
+    app.debug = True
+
+    response = client.get("/api/profiles")
+
+    assert response.headers["Server-Timing"].startswith("db;dur=")
+
+    app.debug = False
+
+    response = client.get("/api/profiles")
+
+    assert "Server-Timing" not in response.headers
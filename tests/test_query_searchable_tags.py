@@ -1,3 +1,5 @@
+import threading
+import time
 from typing import Dict, List
 
 from server.models import (
@@ -8,14 +10,18 @@ from server.models import (
     FacultyHospitalAffiliation,
     FacultyPartsOfMe,
     FacultyProfessionalInterest,
+    FacultyProfile,
     FacultyProfileActivity,
     FacultyProfileDegree,
     HospitalAffiliationOption,
     PartsOfMeOption,
     ProfessionalInterestOption,
+    SearchableTag,
+    db,
     save,
 )
 from server.queries import query_faculty_searchable_tags
+from server.searchable_tags import rebuild_searchable_tags, refresh_stale_tags
 
 from .utils import create_test_profile
 
@@ -139,3 +145,148 @@ def test_only_available_profile_tags(db_session):
     tags = query_faculty_searchable_tags()
 
     assert tags == EMPTY_TAGS
+
+
+def test_searchable_tags_follow_availability(db_session):
+    profile = create_test_profile(available_for_mentoring=True)
+
+    tag = save(ActivityOption(value="Activity", public=True))
+
+    save(FacultyProfileActivity(tag=tag, profile=profile))
+
+    assert query_faculty_searchable_tags()["activities"] == ["Activity"]
+
+    profile.available_for_mentoring = False
+    save(profile)
+
+    assert query_faculty_searchable_tags() == EMPTY_TAGS
+
+    profile.available_for_mentoring = True
+    save(profile)
+
+    assert query_faculty_searchable_tags()["activities"] == ["Activity"]
+
+
+def test_searchable_tags_follow_option_changes(db_session):
+    profile = create_test_profile(available_for_mentoring=True)
+
+    tag = save(ActivityOption(value="Activity", public=True))
+
+    save(FacultyProfileActivity(tag=tag, profile=profile))
+
+    tag.value = "Renamed"
+    save(tag)
+
+    assert query_faculty_searchable_tags()["activities"] == ["Renamed"]
+
+    tag.public = False
+    save(tag)
+
+    assert query_faculty_searchable_tags() == EMPTY_TAGS
+
+
+def test_searchable_tag_kept_while_another_profile_has_it(db_session):
+    profiles = [create_test_profile(available_for_mentoring=True) for _ in range(2)]
+
+    tag = save(ActivityOption(value="Activity", public=True))
+
+    relations = [
+        save(FacultyProfileActivity(tag=tag, profile=profile)) for profile in profiles
+    ]
+
+    db.session.delete(relations[0])
+    db.session.commit()
+
+    assert query_faculty_searchable_tags()["activities"] == ["Activity"]
+
+    db.session.delete(relations[1])
+    db.session.commit()
+
+    assert query_faculty_searchable_tags() == EMPTY_TAGS
+
+
+def test_rebuild_searchable_tags(db_session):
+    profile = create_test_profile(available_for_mentoring=True)
+
+    tag = save(ActivityOption(value="Activity", public=True))
+
+    save(FacultyProfileActivity(tag=tag, profile=profile))
+
+    db.session.query(SearchableTag).delete()
+
+    assert query_faculty_searchable_tags() == EMPTY_TAGS
+
+    rebuild_searchable_tags()
+
+    assert query_faculty_searchable_tags()["activities"] == ["Activity"]
+
+
+def set_availability_concurrently(profiles, available):
+    """
+    Set the availability of each profile and refresh the activities they
+    have in a transaction of its own, all started before any commits.
+    """
+    errors = []
+
+    def set_availability(connection, profile_id, tag_ids, committed):
+        transaction = connection.begin()
+
+        try:
+            connection.execute(
+                FacultyProfile.__table__.update()
+                .where(FacultyProfile.id == profile_id)
+                .values(available_for_mentoring=available)
+            )
+
+            refresh_stale_tags(connection, {FacultyProfileActivity: tag_ids})
+
+            committed.wait()
+            transaction.commit()
+        except Exception as error:
+            errors.append(error)
+            transaction.rollback()
+
+    connections = [db.engine.connect() for _ in profiles]
+
+    commits = [threading.Event() for _ in profiles]
+
+    threads = [
+        threading.Thread(
+            target=set_availability,
+            args=(connection, profile.id, set(profile.activity_ids), commit),
+        )
+        for connection, profile, commit in zip(connections, profiles, commits)
+    ]
+
+    for thread, commit in zip(threads, commits):
+        thread.start()
+
+        # Let the transaction refresh (or wait to) before starting the next
+        time.sleep(0.2)
+
+    for thread, commit in zip(threads, commits):
+        commit.set()
+        thread.join()
+
+    for connection in connections:
+        connection.close()
+
+    assert errors == []
+
+
+def test_concurrent_refreshes_of_a_tag(app, client):
+    tag = save(ActivityOption(value="Activity", public=True))
+
+    profiles = [create_test_profile(available_for_mentoring=False) for _ in range(2)]
+
+    for profile in profiles:
+        save(FacultyProfileActivity(tag=tag, profile=profile))
+
+    set_availability_concurrently(profiles, True)
+
+    [row] = SearchableTag.query.all()
+    assert row.profile_count == 2
+
+    set_availability_concurrently(profiles, False)
+
+    assert query_faculty_searchable_tags() == EMPTY_TAGS
@@ -0,0 +1,286 @@
+import http
+
+import pytest
+
+from server.models import ClinicalSpecialtyOption, FacultyProfile, db
+from server.queries import (
+    matching_faculty_profiles,
+    trigram_search_available,
+    update_option_profiles,
+    update_search_documents,
+)
+
+from .utils import (
+    create_test_profile,
+    create_test_verification_email,
+    create_test_verification_token,
+)
+
+
+PROFILE = {
+    "name": "Jane Doe",
+    "contact_email": "jane@test.com",
+    "clinical_specialties": ["Cardiology"],
+    "affiliations": [],
+    "professional_interests": [],
+    "parts_of_me": [],
+    "activities": ["Scuba diving"],
+    "degrees": [],
+    "additional_information": "Happy to talk about research.",
+    "cadence": "monthly",
+}
+
+
+def search_profile_ids(query, search_mode="prefix"):
+    user_email = create_test_verification_email()
+
+    profiles = matching_faculty_profiles(
+        query=query,
+        tags="",
+        degrees="",
+        affiliations="",
+        verification_email_id=user_email.id,
+        search_mode=search_mode,
+    )
+
+    return [profile.id for profile, _ in profiles]
+
+
+def test_search_matches_name_prefix(db_session):
+    profile = create_test_profile(name="Jane Doe", available_for_mentoring=True)
+
+    update_search_documents(FacultyProfile)
+
+    assert search_profile_ids("jan") == [profile.id]
+    assert search_profile_ids("DOE jane") == [profile.id]
+    assert search_profile_ids("jane smith") == []
+
+
+def test_search_ignores_punctuation(db_session):
+    profile = create_test_profile(name="Jane Doe", available_for_mentoring=True)
+
+    update_search_documents(FacultyProfile)
+
+    assert search_profile_ids("doe & (jane)") == [profile.id]
+    assert search_profile_ids("'") == [profile.id]
+
+
+def test_search_profiles_by_tag_and_information(client, auth):
+    token = create_test_verification_token()
+
+    auth.login(token.token)
+
+    response = client.post("/api/profile", json=PROFILE)
+
+    assert response.status_code == http.HTTPStatus.CREATED.value
+
+    profile_id = response.json["id"]
+
+    for query in ["cardio", "scuba", "research", "jane cardiology"]:
+        response = client.get("/api/profiles", query_string={"query": query})
+
+        assert response.json["profile_count"] == 1, query
+        assert response.json["profiles"][0]["id"] == profile_id
+
+    response = client.get("/api/profiles", query_string={"query": "dermatology"})
+
+    assert response.json["profile_count"] == 0
+
+
+def test_search_document_updated_with_profile(client, auth):
+    token = create_test_verification_token()
+
+    auth.login(token.token)
+
+    profile_id = client.post("/api/profile", json=PROFILE).json["id"]
+
+    update = {**PROFILE, "clinical_specialties": ["Dermatology"]}
+
+    response = client.put(f"/api/profiles/{profile_id}", json=update)
+
+    assert response.status_code == http.HTTPStatus.OK.value
+
+    response = client.get("/api/profiles", query_string={"query": "cardiology"})
+    assert response.json["profile_count"] == 0
+
+    response = client.get("/api/profiles", query_string={"query": "dermatology"})
+    assert response.json["profile_count"] == 1
+
+
+def test_search_document_updated_with_option(client, auth):
+    token = create_test_verification_token()
+
+    auth.login(token.token)
+
+    client.post("/api/profile", json=PROFILE)
+
+    option = ClinicalSpecialtyOption.query.filter_by(value="Cardiology").one()
+    option.value = "Cardiac Surgery"
+
+    update_option_profiles(ClinicalSpecialtyOption, option.id)
+    db.session.commit()
+
+    response = client.get("/api/profiles", query_string={"query": "cardiac"})
+    assert response.json["profile_count"] == 1
+
+    response = client.get("/api/profiles", query_string={"query": "cardiology"})
+    assert response.json["profile_count"] == 0
+
+
+def test_filter_by_tag_created_after_tags_cached(client, auth):
+    token = create_test_verification_token()
+
+    auth.login(token.token)
+
+    response = client.get("/api/profiles", query_string={"tags": "cardiology"})
+    assert response.json["profile_count"] == 0
+
+    client.post("/api/profile", json=PROFILE)
+
+    response = client.get("/api/profiles", query_string={"tags": "cardiology"})
+    assert response.json["profile_count"] == 1
+
+    response = client.get("/api/profiles", query_string={"tags": "scuba diving"})
+    assert response.json["profile_count"] == 1
+
+
+def test_search_tags_updated_with_profile(client, auth):
+    token = create_test_verification_token()
+
+    auth.login(token.token)
+
+    profile_id = client.post("/api/profile", json=PROFILE).json["id"]
+
+    response = client.get("/api/faculty-search-tags")
+    assert response.json["tags"]["clinical_specialties"] == ["Cardiology"]
+
+    update = {**PROFILE, "clinical_specialties": ["Dermatology"]}
+
+    client.put(f"/api/profiles/{profile_id}", json=update)
+
+    response = client.get("/api/faculty-search-tags")
+    assert response.json["tags"]["clinical_specialties"] == ["Dermatology"]
+    assert response.json["tags"]["activities"] == ["Scuba diving"]
+
+
+def test_substring_search(client, auth):
+    token = create_test_verification_token()
+
+    auth.login(token.token)
+
+    profile_id = client.post("/api/profile", json=PROFILE).json["id"]
+
+    for query in ["iolog", "ane", "esearc", "cuba ardio"]:
+        response = client.get(
+            "/api/profiles", query_string={"query": query, "search_mode": "substring"}
+        )
+
+        assert response.json["profile_count"] == 1, query
+        assert response.json["profiles"][0]["id"] == profile_id
+
+    response = client.get("/api/profiles", query_string={"query": "iolog"})
+    assert response.json["profile_count"] == 0
+
+    response = client.get(
+        "/api/profiles", query_string={"query": "ology", "search_mode": "substring"}
+    )
+    assert response.json["profile_count"] == 1
+
+
+def test_search_without_query_ignores_search_mode(db_session):
+    profile = create_test_profile(available_for_mentoring=True)
+
+    assert search_profile_ids("", search_mode="substring") == [profile.id]
+    assert search_profile_ids("", search_mode="fuzzy") == [profile.id]
+
+
+def test_invalid_search_mode(client, auth):
+    token = create_test_verification_token()
+
+    auth.login(token.token)
+
+    response = client.get("/api/profiles", query_string={"search_mode": "regex"})
+
+    assert response.status_code == http.HTTPStatus.UNPROCESSABLE_ENTITY.value
+    assert response.json == {"search_mode": ["invalid"]}
+
+    response = client.get("/api/profiles", query_string={"sorting": "relevance"})
+
+    assert response.json == {"sorting": ["invalid"]}
+
+
+def test_fuzzy_search_unavailable_without_pg_trgm(client, auth):
+    if trigram_search_available():
+        pytest.skip("pg_trgm is installed")
+
+    token = create_test_verification_token()
+
+    auth.login(token.token)
+
+    response = client.get(
+        "/api/profiles", query_string={"query": "jane", "search_mode": "fuzzy"}
+    )
+
+    assert response.status_code == http.HTTPStatus.UNPROCESSABLE_ENTITY.value
+    assert response.json == {"search_mode": ["unavailable"]}
+
+
+def test_fuzzy_search(client, auth):
+    if not trigram_search_available():
+        pytest.skip("pg_trgm is not installed")
+
+    token = create_test_verification_token()
+
+    auth.login(token.token)
+
+    profile_id = client.post("/api/profile", json=PROFILE).json["id"]
+
+    create_test_profile(name="Jane Doel", available_for_mentoring=True)
+    update_search_documents(FacultyProfile)
+
+    response = client.get(
+        "/api/profiles",
+        query_string={"query": "cardiolgy", "search_mode": "fuzzy"},
+    )
+
+    assert response.json["profile_count"] == 1
+    assert response.json["profiles"][0]["id"] == profile_id
+
+    # Both names are similar to the query, but the exact match ranks first
+    response = client.get(
+        "/api/profiles",
+        query_string={
+            "query": "jane doe",
+            "search_mode": "fuzzy",
+            "sorting": "relevance",
+            "page_size": 1,
+            "cursor": "",
+        },
+    )
+
+    assert response.json["profile_count"] == 2
+    assert response.json["profiles"][0]["id"] == profile_id
+
+    response = client.get(
+        "/api/profiles",
+        query_string={
+            "query": "jane doe",
+            "search_mode": "fuzzy",
+            "sorting": "relevance",
+            "page_size": 1,
+            "cursor": response.json["next_cursor"],
+        },
+    )
+
+    [profile] = response.json["profiles"]
+    assert profile["name"] == "Jane Doel"
+
+
+def test_populated_profiles_are_searchable(app, client):
+    result = app.test_cli_runner().invoke(args=["populate"])
+
+    assert result.exit_code == 0, result.output
+
+    FacultyProfile.query.update({"available_for_mentoring": True})
+
+    assert len(search_profile_ids("sea lion")) == 1
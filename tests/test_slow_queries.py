@@ -0,0 +1,88 @@
+import pytest
+from sqlalchemy.exc import InternalError
+from structlog.testing import capture_logs
+
+from server.models import db
+from server.query_stats import explain_statement
+
+from .utils import create_test_profile, create_test_verification_token
+
+
+def test_slow_query_logged(app, client, auth):
+    app.config["SLOW_QUERY_MS"] = 0.000001
+    app.config["SLOW_QUERY_EXPLAIN_RATE"] = 0
+
+    token = create_test_verification_token()
+
+    auth.login(token.token)
+
+    with capture_logs() as logs:
+        client.get("/api/profiles", query_string={"query": "surgeon"})
+
+    slow_queries = [entry for entry in logs if entry["event"] == "Slow query"]
+
+    assert slow_queries
+    assert {entry["route"] for entry in slow_queries} == {"api.get_profiles"}
+    assert any("surgeon" in entry["parameters"] for entry in slow_queries)
+
+
+def test_slow_query_threshold(app, client, auth):
+    app.config["SLOW_QUERY_MS"] = 60000
+
+    token = create_test_verification_token()
+
+    auth.login(token.token)
+
+    with capture_logs() as logs:
+        client.get("/api/profiles")
+
+    assert not [entry for entry in logs if entry["event"] == "Slow query"]
+
+
+def test_explain_statement(app, client):
+    # Plans are captured on a connection of their own
+    with db.engine.connect() as connection:
+        plan = explain_statement(
+            connection,
+            "SELECT * FROM faculty_profile WHERE name = %(name)s",
+            {"name": "Plan Test"},
+        )
+
+        assert "Seq Scan on faculty_profile" in plan
+        assert "actual time" in plan
+
+        # Statements are explained in a read-only transaction
+        with pytest.raises(InternalError, match="read-only transaction"):
+            explain_statement(
+                connection, "UPDATE faculty_profile SET name = 'x' RETURNING id", {}
+            )
+
+
+def test_slow_queries_explained_in_background(app, client):
+    app.config["SLOW_QUERY_MS"] = 0.000001
+    app.config["SLOW_QUERY_EXPLAIN_RATE"] = 1
+
+    with capture_logs() as logs:
+        db.session.execute("SELECT 1")
+
+        app.config["SLOW_QUERY_EXPLAIN_RATE"] = 0
+        app.slow_query_executor.shutdown(wait=True)
+
+    [plan_entry] = [entry for entry in logs if entry["event"] == "Slow query plan"]
+
+    assert plan_entry["statement"] == "SELECT 1"
+    assert "Result" in plan_entry["plan"]
+
+
+def test_explain_search(app, client):
+    create_test_profile(available_for_mentoring=True)
+
+    runner = app.test_cli_runner()
+
+    result = runner.invoke(
+        args=["explain-search", "--query", "surgeon", "--tags", "hiking"]
+    )
+
+    assert result.exit_code == 0, result.output
+    assert "Limit" in result.output
+    assert "actual time" in result.output
@@ -0,0 +1,95 @@
+import json
+
+import pytest
+import requests
+import requests_mock
+
+from server.emails.email_backend import EmailDeliveryError, EmailRejectedError
+from server.emails.fake_email_backend import FakeEmailBackend
+from server.emails.sparkpost_email_backend import (
+    TRANSMISSIONS_URL,
+    SparkPostEmailBackend,
+)
+
+
+ACCEPTED = {
+    "results": {
+        "id": "11668787484950529",
+        "total_accepted_recipients": 2,
+        "total_rejected_recipients": 0,
+    }
+}
+
+
+def test_send_many_in_one_transmission():
+    backend = SparkPostEmailBackend("key")
+
+    with requests_mock.Mocker() as mock:
+        mock.post(TRANSMISSIONS_URL, json=ACCEPTED)
+
+        email_log = backend.send_many(
+            ["a@test.com", "b@test.com"],
+            "Subject",
+            "<a href='{{link}}'>Log in</a>",
+            [{"link": "https://a"}, {"link": "https://b"}],
+        )
+
+    [request] = mock.request_history
+
+    assert request.headers["Authorization"] == "key"
+    assert request.json()["recipients"] == [
+        {"address": "a@test.com", "substitution_data": {"link": "https://a"}},
+        {"address": "b@test.com", "substitution_data": {"link": "https://b"}},
+    ]
+
+    assert json.loads(email_log) == {
+        "status": 200,
+        "id": "11668787484950529",
+        "accepted": 2,
+        "rejected": 0,
+    }
+
+
+def test_rejected_email_raises_with_record():
+    backend = SparkPostEmailBackend("key")
+
+    with requests_mock.Mocker() as mock:
+        mock.post(
+            TRANSMISSIONS_URL,
+            status_code=400,
+            json={"errors": [{"message": "invalid data format/type"}]},
+        )
+
+        with pytest.raises(EmailRejectedError) as error:
+            backend.send_email("a@test.com", "Subject", "html")
+
+    assert json.loads(error.value.email_log) == {
+        "status": 400,
+        "id": None,
+        "accepted": None,
+        "rejected": None,
+        "errors": ["invalid data format/type"],
+    }
+
+
+@pytest.mark.parametrize(
+    "response", [{"status_code": 503}, {"exc": requests.exceptions.ConnectTimeout}]
+)
+def test_retryable_failures_raise(response):
+    backend = SparkPostEmailBackend("key")
+
+    with requests_mock.Mocker() as mock:
+        mock.post(TRANSMISSIONS_URL, **response)
+
+        with pytest.raises(EmailDeliveryError):
+            backend.send_email("a@test.com", "Subject", "html")
+
+
+def test_send_many_falls_back_to_one_email_each():
+    backend = FakeEmailBackend()
+
+    backend.send_many(
+        ["a@test.com", "b@test.com"], "Subject", "Hi {{name}}", [{"name": "A"}, {}]
+    )
+
+    assert [email["html"] for email in backend.sent_emails] == ["Hi A", "Hi {{name}}"]
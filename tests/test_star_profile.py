@@ -1,6 +1,6 @@
 from http import HTTPStatus
 
-from server.models import ProfileStar, save
+from server.models import ProfileStar, db, save
 
 from .utils import create_test_profile, create_test_verification_token
 
@@ -131,3 +131,47 @@ def test_only_one_profile_starred(client, auth):
     assert profiles.json["profile_count"] == 2
     assert profiles.json["profiles"][0]["starred"]
     assert not profiles.json["profiles"][1]["starred"]
+
+
+def test_starring_updates_cached_stars(client, auth):
+    verification_token = create_test_verification_token()
+
+    profile = create_test_profile(available_for_mentoring=True)
+
+    auth.login(verification_token.token)
+
+    assert not client.get("/api/profiles").json["profiles"][0]["starred"]
+
+    client.post("/api/star_profile", json={"profile_id": profile.id})
+
+    assert client.get("/api/profiles").json["profiles"][0]["starred"]
+
+    client.post("/api/unstar_profile", json={"profile_id": profile.id})
+
+    assert not client.get("/api/profiles").json["profiles"][0]["starred"]
+
+
+def test_stars_written_by_another_process_not_cached(client, auth):
+    verification_token = create_test_verification_token()
+
+    profile = create_test_profile(available_for_mentoring=True)
+
+    auth.login(verification_token.token)
+
+    assert not client.get("/api/profiles").json["profiles"][0]["starred"]
+
+    # Written without going through this process's views or sessions
+    with db.engine.begin() as connection:
+        connection.execute(
+            ProfileStar.__table__.insert().values(
+                from_verification_email_id=verification_token.email_id,
+                to_verification_email_id=profile.verification_email_id,
+            )
+        )
+
+    assert client.get("/api/profiles").json["profiles"][0]["starred"]
+
+    with db.engine.begin() as connection:
+        connection.execute(ProfileStar.__table__.delete())
+
+    assert not client.get("/api/profiles").json["profiles"][0]["starred"]
@@ -0,0 +1,76 @@
+import http
+
+from server.models import ActivityOption, FacultyProfileActivity, save
+
+from .utils import create_test_profile, create_test_verification_token
+
+
+TAG_ENDPOINTS = [
+    "/api/profile-tags",
+    "/api/faculty-search-tags",
+    "/api/student-search-tags",
+]
+
+
+def test_tags_not_modified(client, auth):
+    auth.login(create_test_verification_token().token)
+
+    for endpoint in TAG_ENDPOINTS:
+        response = client.get(endpoint)
+
+        assert response.status_code == http.HTTPStatus.OK.value
+        assert response.headers["ETag"]
+
+        response = client.get(
+            endpoint, headers={"If-None-Match": response.headers["ETag"]}
+        )
+
+        assert response.status_code == http.HTTPStatus.NOT_MODIFIED.value, endpoint
+        assert response.data == b""
+
+
+def test_tag_versions_change_with_catalog(client, auth):
+    auth.login(create_test_verification_token().token)
+
+    etags = {
+        endpoint: client.get(endpoint).headers["ETag"] for endpoint in TAG_ENDPOINTS
+    }
+
+    profile = create_test_profile(available_for_mentoring=True)
+
+    option = save(ActivityOption(value="Activity", public=True))
+
+    save(FacultyProfileActivity(tag=option, profile=profile))
+
+    def get_tags(endpoint):
+        return client.get(endpoint, headers={"If-None-Match": etags[endpoint]})
+
+    response = get_tags("/api/profile-tags")
+    assert response.status_code == http.HTTPStatus.OK.value
+    assert response.json["tags"]["activities"] == ["Activity"]
+
+    response = get_tags("/api/faculty-search-tags")
+    assert response.status_code == http.HTTPStatus.OK.value
+    assert response.json["tags"]["activities"] == ["Activity"]
+
+    response = get_tags("/api/student-search-tags")
+    assert response.status_code == http.HTTPStatus.NOT_MODIFIED.value
+
+
+def test_search_tag_version_unchanged_by_other_profiles(client, auth):
+    auth.login(create_test_verification_token().token)
+
+    option = save(ActivityOption(value="Activity", public=True))
+
+    profile = create_test_profile(available_for_mentoring=True)
+    save(FacultyProfileActivity(tag=option, profile=profile))
+
+    etag = client.get("/api/faculty-search-tags").headers["ETag"]
+
+    # Another profile with the same tag doesn't change the values served
+    profile = create_test_profile(available_for_mentoring=True)
+    save(FacultyProfileActivity(tag=option, profile=profile))
+
+    response = client.get("/api/faculty-search-tags", headers={"If-None-Match": etag})
+
+    assert response.status_code == http.HTTPStatus.NOT_MODIFIED.value
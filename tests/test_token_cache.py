@@ -0,0 +1,109 @@
+import http
+
+from sqlalchemy import event
+
+from server import session
+from server.models import VerificationToken, db
+
+from .utils import create_test_verification_token
+
+
+def count_token_queries(client, path):
+    statements = []
+
+    def count_statement(connection, cursor, statement, *args):
+        if "FROM verification_token" in statement:
+            statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", count_statement)
+
+    try:
+        response = client.get(path)
+    finally:
+        event.remove(db.engine, "before_cursor_execute", count_statement)
+
+    assert response.status_code == http.HTTPStatus.OK.value
+
+    return len(statements)
+
+
+def test_cached_token_state_read_by_id(client, auth):
+    auth.login(create_test_verification_token().token)
+
+    assert count_token_queries(client, "/api/profile-tags") == 1
+
+    statements = []
+
+    def record_statement(connection, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", record_statement)
+
+    try:
+        client.get("/api/account")
+    finally:
+        event.remove(db.engine, "before_cursor_execute", record_statement)
+
+    [token_statement] = [
+        statement for statement in statements if "FROM verification_token" in statement
+    ]
+
+    assert "verification_token.id = " in token_statement
+    assert "verification_token.token = " not in token_statement
+
+
+def test_token_logged_out_by_another_process(client, auth):
+    verification_token = create_test_verification_token()
+
+    auth.login(verification_token.token)
+
+    assert client.get("/api/account").status_code == http.HTTPStatus.OK.value
+
+    # Logged out without this process's cache knowing
+    VerificationToken.query.filter(
+        VerificationToken.id == verification_token.id
+    ).update({VerificationToken.logged_out: True})
+    db.session.commit()
+
+    response = client.get("/api/account")
+
+    assert response.status_code == http.HTTPStatus.UNAUTHORIZED.value
+
+
+def test_token_expiry_computed_once_per_request(client, auth, monkeypatch):
+    auth.login(create_test_verification_token().token)
+
+    calls = []
+
+    def compute_token_expired(verification_token):
+        calls.append(verification_token)
+        return False
+
+    monkeypatch.setattr(session, "compute_token_expired", compute_token_expired)
+
+    response = client.get("/api/account")
+
+    assert response.status_code == http.HTTPStatus.OK.value
+    assert len(calls) == 1
+
+
+def test_logging_in_elsewhere_logs_out_cached_token(app, client, auth):
+    verification_token = create_test_verification_token()
+
+    auth.login(verification_token.token)
+
+    assert client.get("/api/account").status_code == http.HTTPStatus.OK.value
+
+    other_token = create_test_verification_token(
+        verification_email=verification_token.email
+    )
+
+    other_client = app.test_client()
+
+    response = other_client.post("/api/verify-token", json={"token": other_token.token})
+    assert response.status_code == http.HTTPStatus.OK.value
+
+    response = client.get("/api/account")
+
+    assert response.status_code == http.HTTPStatus.UNAUTHORIZED.value
+    assert response.json == {"token": ["logged out"]}
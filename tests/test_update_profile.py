@@ -2,8 +2,9 @@ import datetime
 import http
 
 from freezegun import freeze_time
+from sqlalchemy import event
 
-from server.models import FacultyProfile
+from server.models import FacultyProfile, FacultyProfileActivity, db
 
 from .utils import create_test_profile, create_test_verification_token
 
@@ -81,3 +82,49 @@ def test_tags_cannot_have_trailing_spaces(client, auth):
     assert response.status_code == http.HTTPStatus.OK.value
 
     assert profile.clinical_specialties[0].tag.value == "Test"
+
+
+def test_update_only_changes_edited_tags(client, auth):
+    profile = create_test_profile()
+
+    token = create_test_verification_token(
+        verification_email=profile.verification_email
+    )
+
+    auth.login(token.token)
+
+    update = {**PROFILE_UPDATE, "activities": ["Hiking", "Surfing", "Hiking"]}
+
+    client.put(f"/api/profiles/{profile.id}", json=update)
+
+    [hiking_id] = [
+        activity.id
+        for activity in FacultyProfileActivity.query
+        if activity.tag.value == "Hiking"
+    ]
+
+    commits = []
+
+    def count_commit(connection):
+        commits.append(connection)
+
+    event.listen(db.engine, "commit", count_commit)
+
+    try:
+        update = {**PROFILE_UPDATE, "activities": ["Hiking", "Sailing"]}
+
+        response = client.put(f"/api/profiles/{profile.id}", json=update)
+    finally:
+        event.remove(db.engine, "commit", count_commit)
+
+    assert response.status_code == http.HTTPStatus.OK.value
+
+    assert sorted(response.json["activities"]) == ["Hiking", "Sailing"]
+
+    activities = {
+        activity.tag.value: activity.id for activity in FacultyProfileActivity.query
+    }
+
+    assert activities == {"Hiking": hiking_id, "Sailing": activities["Sailing"]}
+
+    assert len(commits) == 1
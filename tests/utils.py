@@ -89,3 +89,13 @@ def create_test_student_profile(
     )
 
     return profile
+
+
+def add_test_tags(profile, relation_class, option_class, values) -> None:
+    for value in values:
+        option = option_class.query.filter(option_class.value == value).first()
+
+        if option is None:
+            option = save(option_class(value=value))
+
+        save(relation_class(tag_id=option.id, profile_id=profile.id))